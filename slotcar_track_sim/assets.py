@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Lazily loaded image assets.
+
+PIL is only imported the first time an image is requested, so the geometry
+and physics modules can be imported by headless tools without it.
+"""
+
+import os
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+CAR_IMG_PATH = os.path.join(ASSET_DIR, "car1.png")
+
+_images = {}
+
+
+def load_image(path=CAR_IMG_PATH):
+    img = _images.get(path)
+    if img is None:
+        from PIL import Image
+
+        img = _images[path] = Image.open(path)
+        img.load()
+    return img
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Reproducible benchmarks for the simulator hot paths.
+
+    python bench.py                       # run everything, write bench_<commit>.json
+    python bench.py --only lookup,tick    # run a subset
+    python bench.py --compare old.json    # print speedups against a previous run
+
+The startup benchmark also guards the import budget: the run exits with a
+non-zero status if importing the geometry and physics modules takes longer
+than STARTUP_BUDGET_MS or pulls in any of HEAVY_MODULES.
+
+Every benchmark repeats its measurement and keeps the best run, inputs are
+generated from a fixed seed so numbers are comparable across commits.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from config import *
+from track import *
+
+LOOKUP_PIECES = [10, 100, 1000]
+TICK_CARS = [1, 10, 1000]
+RACE_CARS = 8
+RACE_VOLTAGES = (3.0, 4.5)  # spread over the field as in race.py, which keeps it on the slot
+BENCH_VOLTAGE = 6.0
+PROPAGATOR_VOLTAGE, PROPAGATOR_STATIC_F = 4.0, 3.0
+
+STARTUP_MODULES = ["config", "track", "car", "car2"]
+HEAVY_MODULES = ["PIL", "tkinter", "numpy"]
+STARTUP_BUDGET_MS = 50
+
+STARTUP_SCRIPT = """
+import json, sys, time
+t0 = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"import_ms": elapsed * 1e3, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def bench_parameters():
+    return midParameters(voltage=BENCH_VOLTAGE)
+
+
+def best_of(fn, repeat):
+    """Runs fn() `repeat` times, returns the smallest elapsed wall time."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def repeated_layout(n_pieces):
+    # the default layout repeated; closure is irrelevant for lookups
+    return [DEFAULT_LAYOUT[i % len(DEFAULT_LAYOUT)] for i in range(n_pieces)]
+
+
+def make_car(circuit, parameters):
+    from car2 import Car
+
+    x, y = circuit.getLaneStart()
+    return Car(
+        x,
+        y,
+        0,
+        None,
+        "bench",
+        circuit.piecewise_curvature,
+        circuit.piecewise_angle,
+        circuit.piecewise_position,
+        parameters,
+    )
+
+
+# ============== BENCHMARKS ==============
+
+
+def bench_lookup(repeat, quick):
+    n_calls = 2000 if quick else 20000
+    results = []
+    for n_pieces in LOOKUP_PIECES:
+        circuit = Circuit(repeated_layout(n_pieces))
+        rng = random.Random(0)
+        length = circuit.getLength()
+        xs = [rng.uniform(0, length) for _ in range(n_calls)]
+
+        for name in ("piecewise_curvature", "piecewise_angle", "piecewise_position"):
+            get = getattr(circuit, name).get
+
+            def run():
+                for x in xs:
+                    get(x)
+
+            elapsed = best_of(run, repeat)
+            results.append({"pieces": n_pieces, "function": name, "calls_per_s": n_calls / elapsed})
+    return results
+
+
+def bench_tick(repeat, quick):
+    total_steps = 5000 if quick else 50000
+    circuit = Circuit()
+    parameters = bench_parameters()
+    results = []
+    for n_cars in TICK_CARS:
+        n_ticks = max(50, total_steps // n_cars)
+
+        def run():
+            cars = [make_car(circuit, parameters) for _ in range(n_cars)]
+            for _ in range(n_ticks):
+                for car in cars:
+                    car.tick(deltat)
+
+        elapsed = best_of(run, repeat)
+        results.append({"cars": n_cars, "ticks": n_ticks, "steps_per_s": n_cars * n_ticks / elapsed})
+    return results
+
+
+def bench_lap(repeat, quick):
+    circuit = Circuit()
+    parameters = bench_parameters()
+    length = circuit.getLength()
+    ticks = []
+
+    def run():
+        car = make_car(circuit, parameters)
+        n = 0
+        while car.s < length:
+            car.tick(deltat)
+            n += 1
+            if car.derailed:
+                # a derailed car stops ticking its dynamics: timing that would not be a lap
+                raise RuntimeError(f"car derailed at s={car.s:.3f} m after {n} ticks, lap not timed")
+        ticks.append(n)
+
+    elapsed = best_of(run, repeat)
+    return {
+        "lap_length_m": length,
+        "ticks": ticks[-1],
+        "sim_time_s": ticks[-1] * deltat,
+        "wall_time_s": elapsed,
+    }
+
+
+def bench_kernel(repeat, quick):
+    import kernel
+
+    n_ticks = 100000 if quick else 10000000
+    circuit = Circuit()
+    tick_kernel = kernel.TickKernel(circuit)
+    tick_kernel.run(make_car(circuit, bench_parameters()), 10)  # compile outside the timing
+
+    def run():
+        tick_kernel.run(make_car(circuit, bench_parameters()), n_ticks, dt=1e-4, every=1000)
+
+    elapsed = best_of(run, repeat)
+    return {"jit": kernel.JIT_ENABLED, "ticks": n_ticks, "steps_per_s": n_ticks / elapsed}
+
+
+def bench_propagator(repeat, quick):
+    """SegmentPropagator against plain kernel.runTicks over the same run, at deltat and at a fine step."""
+    import kernel
+    from propagator import SegmentPropagator
+
+    duration = 60.0 if quick else 600.0
+    circuit = Circuit()
+    parameters = midParameters(voltage=PROPAGATOR_VOLTAGE, static_f=PROPAGATOR_STATIC_F)  # grips all lap
+    results = []
+    for dt in (deltat, 1e-4):
+        n_ticks = int(duration / dt)
+        tick_kernel, propagator = kernel.TickKernel(circuit), SegmentPropagator(circuit, dt)
+        tick_kernel.run(make_car(circuit, parameters), 10, dt=dt)  # compile outside the timing
+        propagator.run(make_car(circuit, parameters), 10)
+
+        def run_kernel():
+            tick_kernel.run(make_car(circuit, parameters), n_ticks, dt=dt, every=n_ticks)
+
+        def run_propagator():
+            propagator.run(make_car(circuit, parameters), n_ticks)
+
+        kernel_elapsed = best_of(run_kernel, repeat)
+        propagator_elapsed = best_of(run_propagator, repeat)
+        results.append(
+            {
+                "dt": dt,
+                "ticks": n_ticks,
+                "kernel_steps_per_s": n_ticks / kernel_elapsed,
+                "steps_per_s": n_ticks / propagator_elapsed,
+                "speedup": kernel_elapsed / propagator_elapsed,
+            }
+        )
+    return results
+
+
+def bench_race(repeat, quick):
+    from race import Race
+
+    n_ticks = 1000 if quick else 10000
+    layout = list(DEFAULT_LAYOUT)
+    layout[0] = (LaneChangerTrack, None)
+    lo, hi = RACE_VOLTAGES
+    parameters = [midParameters(voltage=lo + (hi - lo) * i / (RACE_CARS - 1)) for i in range(RACE_CARS)]
+    live = []
+
+    def run():
+        race = Race(layout, RACE_CARS, parameters)
+        live_ticks = 0
+        for i in range(n_ticks):
+            race.racers[i % RACE_CARS].change = i % 50 == 0
+            race.step()
+            live_ticks += sum(1 for racer in race.racers if not racer.car.derailed)
+        live.append(live_ticks / (RACE_CARS * n_ticks))
+
+    elapsed = best_of(run, repeat)
+    return {
+        "cars": RACE_CARS,
+        "ticks": n_ticks,
+        "ticks_per_s": n_ticks / elapsed,
+        "real_time_factor": n_ticks * deltat / elapsed,
+        # car-ticks on the slot: a derailed car skips its dynamics and would flatter the timing
+        "live_fraction": live[-1],
+    }
+
+
+def bench_draw(repeat, quick):
+    import tkinter as tk
+
+    n_frames = 50 if quick else 300
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return {"skipped": f"no display available ({e})"}
+
+    root.withdraw()
+    canvas = tk.Canvas(root, width=sw, height=sh)
+    circuit = Circuit()
+    car = make_car(circuit, bench_parameters())
+
+    def run():
+        for _ in range(n_frames):
+            car.tick(deltat)
+            car.draw(canvas)
+        canvas.delete("all")
+        car.img = None
+
+    elapsed = best_of(run, repeat)
+    root.destroy()
+    return {"frames": n_frames, "ms_per_frame": elapsed / n_frames * 1e3}
+
+
+def bench_startup(repeat, quick):
+    """Imports the headless modules in fresh interpreters."""
+    script = STARTUP_SCRIPT.format(modules=STARTUP_MODULES, heavy=HEAVY_MODULES)
+    here = os.path.dirname(os.path.abspath(__file__))
+    best_import, best_process, heavy = float("inf"), float("inf"), []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=here, check=True)
+        best_process = min(best_process, time.perf_counter() - t0)
+        child = json.loads(out.stdout)
+        best_import = min(best_import, child["import_ms"])
+        heavy = child["heavy"]
+
+    return {
+        "modules": STARTUP_MODULES,
+        "import_ms": best_import,
+        "process_ms": best_process * 1e3,
+        "heavy_modules_loaded": heavy,
+        "budget_ms": STARTUP_BUDGET_MS,
+        "within_budget": best_import <= STARTUP_BUDGET_MS and not heavy,
+    }
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "lookup": bench_lookup,
+    "tick": bench_tick,
+    "lap": bench_lap,
+    "kernel": bench_kernel,
+    "propagator": bench_propagator,
+    "race": bench_race,
+    "draw": bench_draw,
+}
+
+
+# ============== DRIVER ==============
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+TIME_KEYS = ("ms_per_frame", "wall_time_s", "import_ms")
+
+
+def compare(old, new):
+    """Prints the speedup of every rate and timing in `new` relative to `old`."""
+
+    def rates(results, prefix=""):
+        if isinstance(results, dict):
+            for k, v in results.items():
+                yield from rates(v, f"{prefix}{k}.")
+        elif isinstance(results, list):
+            for i, v in enumerate(results):
+                yield from rates(v, f"{prefix}{i}.")
+        elif isinstance(results, (int, float)) and prefix.rstrip(".").endswith(("_per_s",) + TIME_KEYS):
+            yield prefix.rstrip("."), results
+
+    old_rates = dict(rates(old["results"]))
+    for key, value in rates(new["results"]):
+        if key in old_rates and old_rates[key] and value:
+            ratio = value / old_rates[key]
+            if key.endswith(TIME_KEYS):
+                ratio = 1 / ratio  # times: smaller is better
+            print(f"{key:60s} {ratio:6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma separated benchmark names")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="smaller workloads, for smoke runs")
+    parser.add_argument("--output", help="JSON output path (default bench_<commit>.json)")
+    parser.add_argument("--compare", help="previous JSON result to compare against")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "deltat": deltat,
+            "repeat": args.repeat,
+            "quick": args.quick,
+        },
+        "results": {},
+    }
+
+    for name in args.only.split(","):
+        print(f"running {name} ...", flush=True)
+        report["results"][name] = BENCHMARKS[name](args.repeat, args.quick)
+        print(json.dumps(report["results"][name], indent=2))
+
+    output = args.output or f"bench_{commit or 'local'}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+    startup = report["results"].get("startup")
+    if startup and not startup["within_budget"]:
+        print(f"startup budget exceeded: {startup['import_ms']:.1f} ms, heavy modules {startup['heavy_modules_loaded']}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,17 @@
 # -*- coding: utf-8 -*-
 
-import os
 from typing import Literal
-from PIL import Image, ImageTk
 import math
 from config import *
+from assets import load_image
+from viewport import DEFAULT_VIEW
 
 DRIVING_STATE = Literal["driving", "derailed"]
 
-car_img_path = "car1.png" if os.path.exists("car1.png") else "slotcar_track_sim/car1.png"
-car1_img = Image.open(car_img_path)
-
 
 class Car:
     def __init__(self, x, y, b, img, name, piecewise_curvature, piecewise_angle, piecewise_position, parameters):
-        self.fi = img
+        self.fi = img  # sprite, None loads the default car image on first draw
         self.name = name
         self.img = None
 
@@ -47,6 +44,8 @@ class Car:
 
         # Internal State
         self.s = 0  # linear distance along track (meters) - GUIDE PIN position
+        self.x = x
+        self.y = y
         self.guide_x = x
         self.guide_y = y
         self.b = b  # car heading angle in radians
@@ -60,6 +59,10 @@ class Car:
         self.driving_state: DRIVING_STATE = "driving"
         self.animation_direction = None
 
+    def motorForce(self):
+        """Motor force (N) at the current voltage and speed, the same call on every model."""
+        return self.calculate_motor_force(self.iv, self.v)
+
     def calculate_motor_force(self, voltage, velocity):
         """
         Calculate motor force with gearbox from slide 12
@@ -90,7 +93,6 @@ class Car:
 
     def calculate_centripetal_force(self):
         curvature = self.piecewise_curvature.get(self.s)
-        print(curvature)
         if curvature == 0:
             return 0
 
@@ -158,7 +160,7 @@ class Car:
 
             if self.iv > 11:
                 self.driving_state = "derailed"
-                self.animation_direction = self.b * 180 / math.pi
+                self.animation_direction = self.b  # rad, flies off along its heading
                 self.v = self.v if self.v != 0 else 0.4
 
         elif self.driving_state == "derailed":
@@ -167,21 +169,39 @@ class Car:
             self.b += 0.15
             self.b %= 2 * math.pi
 
-    def draw(self, canvas):
+    def draw(self, canvas, view=DEFAULT_VIEW):
+        from PIL import Image, ImageTk
+
+        if self.fi is None:
+            self.fi = load_image()
+
         if self.img:
             canvas.delete(self.img)
 
         ow, oh = self.fi.size
 
-        screen_x, screen_y = m_to_px(canvas, self.x, self.y)
+        screen_x, screen_y = view.m_to_px(canvas, self.x, self.y)
 
         rot_angle = self.b * 180 / math.pi
 
         img = self.fi.rotate(-90 + (rot_angle), resample=Image.BICUBIC)
-        img = img.resize((int(ow * SCALE), int(oh * SCALE)), Image.Resampling.LANCZOS)
+        size = (max(1, int(ow * SCALE * view.zoom)), max(1, int(oh * SCALE * view.zoom)))
+        img = img.resize(size, Image.Resampling.LANCZOS)
 
         self.photo = ImageTk.PhotoImage(img)
-        self.img = canvas.create_image(screen_x, screen_y, image=self.photo)
+        self.img = canvas.create_image(screen_x, screen_y, image=self.photo, tags="car")
+
+    # ============== STATE ==============
+    # in the order of models.STATE_FIELDS
+
+    def getState(self):
+        return (self.s, self.x, self.y, self.b, self.v, self.slip_angle, float(self.driving_state == "derailed"))
+
+    def setState(self, state):
+        self.s, self.x, self.y, self.b, self.v, self.slip_angle, derailed = state
+        self.driving_state = "derailed" if derailed else "driving"
+        # the state has no flight direction: the heading it is restored with stands in for it
+        self.animation_direction = self.b if derailed else None
 
     def updateParameters(self, parameters: dict) -> None:
         self.iv = parameters["voltage"]
@@ -3,24 +3,34 @@
 SIMPLIFIED CAR MODEL - Clear Names, Simple Physics
 """
 
-import os
-from PIL import Image, ImageTk
 import math
 from config import *
-
-car_img_path = "car1.png" if os.path.exists("car1.png") else "slotcar_track_sim/car1.png"
-car1_img = Image.open(car_img_path)
+from assets import load_image
+from profiler import PROFILER
+from viewport import CAR_LENGTH, DEFAULT_VIEW
+
+# fixed by the car, not sliders. kernel, identify, race, steady and
+# layout_search import these rather than copying them
+CAR_A = 0.020  # m, CG to rear
+CAR_B = 0.025  # m, CG to front/guide pin
+R_MOTOR = 0.5  # Ohm
+MAX_SLIP_RATE = 2.0  # rad/s
+MAX_SLIP = math.radians(50)
+DERAIL_SLIP = math.radians(42)
+MAX_ACCEL = 30.0  # m/s^2
+MAX_V = 15.0  # m/s
 
 
 class Car:
     def __init__(self, x, y, b, img, name, piecewise_curvature, piecewise_angle, piecewise_position, parameters):
-        self.fi = img
+        self.fi = img  # sprite, None loads the default car image on first draw
         self.name = name
         self.img = None
+        self.hud_tag = f"hud{id(self)}"
 
         # Car geometry
-        self.a = 0.020  # Distance CG to rear (m)
-        self.b = 0.025  # Distance CG to front/guide pin (m)
+        self.a = CAR_A  # Distance CG to rear (m)
+        self.b = CAR_B  # Distance CG to front/guide pin (m)
 
         # State variables
         self.s = 0  # Position along track (m)
@@ -43,7 +53,7 @@ class Car:
         self.back_emf_c = parameters["back_emf_c"]
         self.gear_ratio = parameters["gear_ratio"]
         self.gear_efficiency = parameters["efficiency"]
-        self.R_motor = 0.5  # Motor resistance (Ohms)
+        self.R_motor = R_MOTOR  # Motor resistance (Ohms)
 
         self.piecewise_curvature = piecewise_curvature
         self.piecewise_position = piecewise_position
@@ -69,6 +79,10 @@ class Car:
         F = (eta * N * k_t / (r * self.R_motor)) * (self.voltage - back_emf)
         return F
 
+    def motorForce(self):
+        """Motor force (N) at the current voltage and speed, the same call on every model."""
+        return self.calculate_F_motor()
+
     def calculate_N_total(self):
         """
         Total normal force (perpendicular to track surface)
@@ -95,7 +109,8 @@ class Car:
         if self.v == 0:
             return 0
 
-        curvature = self.piecewise_curvature.get(self.s)
+        with PROFILER.phase("lookup"):
+            curvature = self.piecewise_curvature.get(self.s)
 
         if abs(curvature) < 0.0001:  # Straight section
             return 0
@@ -201,13 +216,11 @@ class Car:
             slip_rate = F_net_lateral / (mass_kg * 10) if self.v > 0 else 0  # rad/s
 
             # Limit rate
-            MAX_SLIP_RATE = 2.0
             slip_rate = max(-MAX_SLIP_RATE, min(MAX_SLIP_RATE, slip_rate))
 
             self.slip_angle += slip_rate * deltat
 
             # Clamp slip angle
-            MAX_SLIP = math.radians(50)
             self.slip_angle = max(-MAX_SLIP, min(MAX_SLIP, self.slip_angle))
 
         # === STEP 3: Effective forward force ===
@@ -223,11 +236,9 @@ class Car:
         F_effective_forward = F_motor * cos_alpha
 
         # === STEP 4: Update velocity ===
-        MAX_ACCEL = 30
         acceleration = F_effective_forward / mass_kg
         acceleration = max(-MAX_ACCEL, min(MAX_ACCEL, acceleration))
 
-        MAX_V = 15
         self.v += acceleration * deltat
         self.v = max(0, min(MAX_V, self.v))
 
@@ -237,15 +248,16 @@ class Car:
 
         # === STEP 6: Derailment check ===
 
-        if abs(self.slip_angle) >= math.radians(42):
+        if abs(self.slip_angle) >= DERAIL_SLIP:
             self.derailed = True
             print(f"DERAILED at slip_angle = {math.degrees(self.slip_angle):.1f}°")
             return
 
         # === STEP 7: Visual position ===
 
-        track_angle = self.piecewise_angle.get(self.s)
-        pin_x, pin_y = self.piecewise_position.get(self.s)
+        with PROFILER.phase("lookup"):
+            track_angle = self.piecewise_angle.get(self.s)
+            pin_x, pin_y = self.piecewise_position.get(self.s)
 
         self.b_heading = track_angle + self.slip_angle
 
@@ -255,49 +267,107 @@ class Car:
 
     # ============== DRAWING ==============
 
-    def draw(self, canvas):
-        if self.img:
-            canvas.delete(self.img)
+    def draw(self, canvas, view=DEFAULT_VIEW):
+        screen_x, screen_y = view.m_to_px(canvas, self.x, self.y)
+        bounds = (self.x - CAR_LENGTH, self.y - CAR_LENGTH, self.x + CAR_LENGTH, self.y + CAR_LENGTH)
+
+        if not view.isVisible(canvas, bounds):
+            # culled: nothing to draw but the HUD
+            if self.img:
+                canvas.delete(self.img)
+                self.img = None
+        elif view.showSprites():
+            self.drawSprite(canvas, view, screen_x, screen_y)
+        else:
+            self.drawGlyph(canvas, view, screen_x, screen_y)
+
+        with PROFILER.phase("canvas_update"):
+            # Debug info, replaced every frame
+            canvas.delete(self.hud_tag)
+            hud = ("hud", self.hud_tag)
+            canvas.create_rectangle(5, 5, 300, 180, fill="black", outline="white", width=2, tags=hud)
+
+            status = "DERAILED!" if self.derailed else ("SLIPPING" if abs(self.slip_angle) > 0.05 else "Grip OK")
+            color = "red" if self.derailed else ("orange" if abs(self.slip_angle) > 0.05 else "lime")
+
+            canvas.create_text(
+                15, 20, anchor="w", text=f"Status: {status}", fill=color, font=("Arial", 14, "bold"), tags=hud
+            )
+            canvas.create_text(
+                15,
+                50,
+                anchor="w",
+                text=f"Slip Angle: {math.degrees(self.slip_angle):.1f}°",
+                fill="white",
+                font=("Arial", 11),
+                tags=hud,
+            )
+            canvas.create_text(
+                15, 75, anchor="w", text=f"Velocity: {self.v:.2f} m/s", fill="white", font=("Arial", 11), tags=hud
+            )
+
+            F_motor = self.calculate_F_motor()
+            F_eff = F_motor * math.cos(self.slip_angle)
+            canvas.create_text(
+                15, 100, anchor="w", text=f"F_motor: {F_motor:.2f} N", fill="white", font=("Arial", 11), tags=hud
+            )
+            canvas.create_text(
+                15, 125, anchor="w", text=f"F_eff_forward: {F_eff:.2f} N", fill="cyan", font=("Arial", 11), tags=hud
+            )
+            canvas.create_text(
+                15,
+                150,
+                anchor="w",
+                text=f"F_centrifugal: {self.calculate_F_centrifugal():.2f} N",
+                fill="red",
+                font=("Arial", 11),
+                tags=hud,
+            )
+
+    def drawSprite(self, canvas, view, screen_x, screen_y):
+        from PIL import Image, ImageTk
+
+        if self.fi is None:
+            self.fi = load_image()
 
         ow, oh = self.fi.size
-        screen_x, screen_y = m_to_px(canvas, self.x, self.y)
         rot_angle = self.b_heading * 180 / math.pi
-
-        img = self.fi.rotate(-90 + rot_angle, resample=Image.BICUBIC)
-        img = img.resize((int(ow * SCALE), int(oh * SCALE)), Image.Resampling.LANCZOS)
-
-        self.photo = ImageTk.PhotoImage(img)
-        self.img = canvas.create_image(screen_x, screen_y, image=self.photo)
-
-        # Debug info
-        canvas.create_rectangle(5, 5, 300, 180, fill="black", outline="white", width=2)
-
-        status = "DERAILED!" if self.derailed else ("SLIPPING" if abs(self.slip_angle) > 0.05 else "Grip OK")
-        color = "red" if self.derailed else ("orange" if abs(self.slip_angle) > 0.05 else "lime")
-
-        canvas.create_text(15, 20, anchor="w", text=f"Status: {status}", fill=color, font=("Arial", 14, "bold"))
-        canvas.create_text(
-            15,
-            50,
-            anchor="w",
-            text=f"Slip Angle: {math.degrees(self.slip_angle):.1f}°",
-            fill="white",
-            font=("Arial", 11),
-        )
-        canvas.create_text(15, 75, anchor="w", text=f"Velocity: {self.v:.2f} m/s", fill="white", font=("Arial", 11))
-
-        F_motor = self.calculate_F_motor()
-        F_eff = F_motor * math.cos(self.slip_angle)
-        canvas.create_text(15, 100, anchor="w", text=f"F_motor: {F_motor:.2f} N", fill="white", font=("Arial", 11))
-        canvas.create_text(15, 125, anchor="w", text=f"F_eff_forward: {F_eff:.2f} N", fill="cyan", font=("Arial", 11))
-        canvas.create_text(
-            15,
-            150,
-            anchor="w",
-            text=f"F_centrifugal: {self.calculate_F_centrifugal():.2f} N",
-            fill="red",
-            font=("Arial", 11),
-        )
+        size = (max(1, int(ow * SCALE * view.zoom)), max(1, int(oh * SCALE * view.zoom)))
+
+        with PROFILER.phase("sprite"):
+            img = self.fi.rotate(-90 + rot_angle, resample=Image.BICUBIC)
+            img = img.resize(size, Image.Resampling.LANCZOS)
+
+            self.photo = ImageTk.PhotoImage(img)
+
+        with PROFILER.phase("canvas_update"):
+            if self.img:
+                canvas.delete(self.img)
+            self.img = canvas.create_image(screen_x, screen_y, image=self.photo, tags="car")
+
+    def drawGlyph(self, canvas, view, screen_x, screen_y):
+        # level of detail: a triangle pointing along the heading instead of a rotated sprite
+        half = view.sm_to_px(CAR_LENGTH) / 2 + 2
+        c, s = math.cos(self.b_heading), math.sin(self.b_heading)
+        tip = (screen_x + half * c, screen_y - half * s)
+        left = (screen_x - half * c - 0.6 * half * s, screen_y + half * s - 0.6 * half * c)
+        right = (screen_x - half * c + 0.6 * half * s, screen_y + half * s + 0.6 * half * c)
+
+        with PROFILER.phase("canvas_update"):
+            if self.img:
+                canvas.delete(self.img)
+            color = "red" if self.derailed else "gold"
+            self.img = canvas.create_polygon(*tip, *left, *right, fill=color, outline="black", tags="car")
+
+    # ============== STATE ==============
+    # in the order of models.STATE_FIELDS
+
+    def getState(self):
+        return (self.s, self.x, self.y, self.b_heading, self.v, self.slip_angle, float(self.derailed))
+
+    def setState(self, state):
+        self.s, self.x, self.y, self.b_heading, self.v, self.slip_angle, derailed = state
+        self.derailed = bool(derailed)
 
     def updateParameters(self, parameters: dict) -> None:
         self.voltage = parameters["voltage"]
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Live telemetry charts for the control panel.
+
+Velocity, slip angle, motor force and voltage of the first car, plotted
+against time (a scrolling window or the whole session) or against the
+position in the lap (this lap over the previous one).
+
+Every channel keeps its samples in a MinMaxPyramid: level k holds the min
+and max of blocks of FACTOR**k samples. A chart picks the finest level with
+at most two blocks per pixel column in its window and draws each block as a
+vertical min-max stroke, so peaks survive decimation and a redraw costs
+the chart width, not the session length. Against s, samples go into
+LAP_BINS fixed bins per lap.
+
+The UI adds a sample for every new physics frame it reads (a few appends)
+and redraws the charts only every chart_period, independently of both the
+physics and the frame rate.
+"""
+
+import bisect
+import math
+import tkinter as tk
+from array import array
+from tkinter import ttk
+
+from config import *
+
+FACTOR = 4  # samples per block, level to level
+LAP_BINS = 300  # bins per lap of the charts against s
+WINDOWS = {"10 s": 10.0, "1 min": 60.0, "10 min": 600.0, "session": None}
+
+# (key, label, unit, color)
+CHANNELS = [
+    ("v", "Velocity", "m/s", "blue"),
+    ("slip", "Slip angle", "deg", "orange"),
+    ("force", "Motor force", "N", "red"),
+    ("voltage", "Voltage", "V", "green"),
+]
+
+
+class MinMaxPyramid:
+    def __init__(self, factor=FACTOR):
+        self.factor = factor
+        self.clear()
+
+    def clear(self):
+        # level k: (start time, min, max) of every complete block
+        self.levels = [(array("d"), array("d"), array("d"))]
+        self.partial = []  # [start time, min, max, count] of the block in progress on level k + 1
+
+    def __len__(self):
+        return len(self.levels[0][0])
+
+    def add(self, t, value):
+        """Appends a sample, t has to grow. Amortized O(1)."""
+        block = (t, value, value)
+        for k in range(len(self.levels) + 1):
+            if k == len(self.levels):
+                self.levels.append((array("d"), array("d"), array("d")))
+            times, lo, hi = self.levels[k]
+            times.append(block[0])
+            lo.append(block[1])
+            hi.append(block[2])
+
+            # fold the block into the one in progress on the next level
+            if k == len(self.partial):
+                self.partial.append([block[0], block[1], block[2], 0])
+            partial = self.partial[k]
+            if partial[3] == 0:
+                partial[:] = [block[0], block[1], block[2], 0]
+            else:
+                partial[1], partial[2] = min(partial[1], block[1]), max(partial[2], block[2])
+            partial[3] += 1
+            if partial[3] < self.factor:
+                return
+            block = tuple(partial[:3])
+            partial[3] = 0
+
+    def query(self, t0, t1, columns):
+        """(times, lo, hi) of the blocks starting in [t0, t1], from the finest level with at most 2 per column."""
+        for k, (times, lo, hi) in enumerate(self.levels):
+            i0, i1 = bisect.bisect_left(times, t0), bisect.bisect_right(times, t1)
+            if i1 - i0 <= 2 * columns or k == len(self.levels) - 1:
+                blocks = (list(times[i0:i1]), list(lo[i0:i1]), list(hi[i0:i1]))
+                # the newest samples are still in the block in progress on this level
+                if k > 0 and self.partial[k - 1][3] and t0 <= self.partial[k - 1][0] <= t1:
+                    for column, value in zip(blocks, self.partial[k - 1][:3]):
+                        column.append(value)
+                return blocks
+
+
+class LapBins:
+    """Min/max of a channel in LAP_BINS bins over the lap, for this lap and the previous one."""
+
+    def __init__(self, length, bins=LAP_BINS):
+        self.length = length
+        self.bins = bins
+        self.lap = None
+        self.current = self.previous = None
+
+    def add(self, s, value):
+        lap = math.floor(s / self.length)
+        if lap != self.lap:
+            self.previous = self.current
+            self.current = ([math.inf] * self.bins, [-math.inf] * self.bins)
+            self.lap = lap
+        i = min(self.bins - 1, int((s - lap * self.length) / self.length * self.bins))
+        lo, hi = self.current
+        lo[i], hi[i] = min(lo[i], value), max(hi[i], value)
+
+
+# ============== WIDGET ==============
+
+
+class LiveCharts:
+    def __init__(self, parent, width=360, strip_height=80):
+        self.frame = ttk.Frame(parent)
+        self.width, self.strip_height = width, strip_height
+
+        self.axis = tk.StringVar(value="time")
+        self.window = tk.StringVar(value="1 min")
+        ttk.Radiobutton(self.frame, text="vs time", variable=self.axis, value="time").grid(row=0, column=0, sticky="w")
+        ttk.Radiobutton(self.frame, text="vs lap", variable=self.axis, value="lap").grid(row=0, column=1, sticky="w")
+        ttk.Combobox(self.frame, textvariable=self.window, values=list(WINDOWS), width=8, state="readonly").grid(
+            row=0, column=2, sticky="e"
+        )
+        self.canvas = tk.Canvas(
+            self.frame, width=width, height=strip_height * len(CHANNELS), bg="black", highlightthickness=0
+        )
+        self.canvas.grid(row=1, column=0, columnspan=3, sticky="nsew", pady=(5, 0))
+
+        self.pyramids = {key: MinMaxPyramid() for key, _, _, _ in CHANNELS}
+        self.laps = {}
+        self.latest = {}
+        self.t = None
+
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
+
+    def reset(self, lap_length):
+        for pyramid in self.pyramids.values():
+            pyramid.clear()
+        self.laps = {key: LapBins(lap_length) for key, _, _, _ in CHANNELS}
+        self.latest = {}
+        self.t = None
+
+    def setLapLength(self, lap_length):
+        # after a track edit, the lap in progress starts over in new bins
+        for bins in self.laps.values():
+            bins.length = lap_length
+            bins.lap = None
+
+    def add(self, t, s, values):
+        """One sample of every channel at time t and lap position s."""
+        if self.t is not None and t <= self.t:
+            return  # the same physics frame again
+        self.t = t
+        for key, value in values.items():
+            self.pyramids[key].add(t, value)
+            if key in self.laps:
+                self.laps[key].add(s, value)
+        self.latest = values
+
+    def draw(self):
+        canvas = self.canvas
+        canvas.delete("all")
+        if self.t is None:
+            return
+        for row, (key, label, unit, color) in enumerate(CHANNELS):
+            top = row * self.strip_height
+            if self.axis.get() == "lap":
+                series = self.lapSeries(key)
+            else:
+                series = self.timeSeries(key)
+            self.drawStrip(top, series, color)
+            text = f"{label}: {self.latest.get(key, math.nan):.2f} {unit}"
+            canvas.create_text(4, top + 2, anchor="nw", text=text, fill="white", font=("Arial", 9))
+
+    def timeSeries(self, key):
+        window = WINDOWS[self.window.get()]
+        t1 = self.t
+        t0 = 0.0 if window is None else t1 - window
+        times, lo, hi = self.pyramids[key].query(t0, t1, self.width)
+        span = max(t1 - t0, 1e-9)
+        return [([(t - t0) / span for t in times], lo, hi, None)]
+
+    def lapSeries(self, key):
+        bins = self.laps[key]
+        series = []
+        for profile, color in ((bins.previous, "gray40"), (bins.current, None)):
+            if profile is None:
+                continue
+            lo, hi = profile
+            filled = [i for i in range(bins.bins) if lo[i] <= hi[i]]
+            series.append(
+                ([(i + 0.5) / bins.bins for i in filled], [lo[i] for i in filled], [hi[i] for i in filled], color)
+            )
+        return series
+
+    def drawStrip(self, top, series, color):
+        values = [v for _, lo, hi, _ in series for v in lo + hi]
+        if not values:
+            return
+        v_min, v_max = min(values), max(values)
+        if v_max - v_min < 1e-9:
+            v_min, v_max = v_min - 1, v_max + 1
+        margin = 14  # px, for the label
+        height = self.strip_height - margin - 4
+
+        def y(v):
+            return top + margin + (v_max - v) / (v_max - v_min) * height
+
+        self.canvas.create_line(0, top + self.strip_height - 1, self.width, top + self.strip_height - 1, fill="gray25")
+        for xs, lo, hi, series_color in series:
+            # a min-max stroke per block, joined into one polyline
+            points = []
+            for x, a, b in zip(xs, lo, hi):
+                px = x * (self.width - 1)
+                points += [px, y(b), px, y(a)]
+            if len(points) >= 4:
+                if len(points) == 4:
+                    points += points[-2:]
+                self.canvas.create_line(*points, fill=series_color or color)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints of a running simulation, and what-if branches forked from them.
+
+A Snapshot holds everything a run depends on: the layout, lane, model and
+parameter snapshot of the Simulation, its tick counter, the state of every
+car (models.STATE_FIELDS, the complete state of a car2 car) and the state of
+any other component with getState()/setState(), such as scheduler.ClosedLoop
+with its controller, IMU noise generator and pending events (a ClosedLoop
+also records its periods, its target and the parameters it started with, so
+a branch runs at the same rates and --check can repeat the prefix). It is one
+immutable compressed byte string of plain values (a few KB), so it can be
+saved, sent to worker processes and loaded without unpickling any class.
+
+Branches share the snapshot and never copy the prefix: each one restores a
+Simulation of its own from the shared bytes when it starts, and worker
+processes receive the bytes once, not per branch. Forking thousands of
+variants from one checkpoint costs only their suffixes.
+
+    python checkpoint.py --prefix 20 --suffix 10 --targets 15 20 25 30 35
+    python checkpoint.py --prefix 20 --save lap20.ckpt
+    python checkpoint.py --load lap20.ckpt --suffix 10 --targets 25 --check    # compare with a run from tick 0
+"""
+
+import argparse
+import io
+import os
+import pickle
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from config import *
+from track import *
+
+FORMAT = 3  # 2: the IMU keeps the acceleration of the last physics step, 3: ClosedLoop settings
+
+
+class PlainUnpickler(pickle.Unpickler):
+    # snapshots hold builtins only: tuples, lists, dicts, numbers, strings
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"snapshot refers to {module}.{name}")
+
+
+class Snapshot:
+    def __init__(self, data):
+        self.data = bytes(data)
+        self._content = None  # decoded on first use, read-only
+
+    @classmethod
+    def capture(cls, sim, **components):
+        """Snapshot of `sim` and of every component (name=object with getState())."""
+        content = {
+            "format": FORMAT,
+            "layout": layoutKey(sim.circuit.layout),
+            "lane": sim.circuit.lane_idx,
+            "model": sim.model,
+            "parameters": dict(sim.parameters),
+            "tick_count": sim.tick_count,
+            "cars": [tuple(float(v) for v in car.getState()) for car in sim.cars],
+            "components": {name: component.getState() for name, component in components.items()},
+        }
+        return cls(zlib.compress(pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    @property
+    def content(self):
+        if self._content is None:
+            content = PlainUnpickler(io.BytesIO(zlib.decompress(self.data))).load()
+            if content.get("format") != FORMAT:
+                raise ValueError(f"snapshot format {content.get('format')}, expected {FORMAT}")
+            self._content = content
+        return self._content
+
+    @property
+    def tick_count(self):
+        return self.content["tick_count"]
+
+    def simulation(self, parameters=None):
+        """A new Simulation on the checkpointed layout, lane and model at tick 0, with `parameters` or the checkpointed ones."""
+        from simulation import Simulation
+
+        content = self.content
+        layout = layoutFromKey(content["layout"])
+        parameters = dict(content["parameters"] if parameters is None else parameters)
+        return Simulation(layout, len(content["cars"]), parameters, content["lane"], content["model"])
+
+    def restore(self, sim=None):
+        """A new Simulation in the checkpointed state, or `sim` (same layout, lane and model) reset to it."""
+        content = self.content
+        if sim is None:
+            sim = self.simulation()
+        else:
+            sim.applyParameters(dict(content["parameters"]))
+        for car, state in zip(sim.cars, content["cars"]):
+            car.setState(state)
+        sim.tick_count = content["tick_count"]
+        return sim
+
+    def component(self, name):
+        return self.content["components"][name]
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+
+# ============== FORKING ==============
+
+_shared = None  # the snapshot of a worker process
+
+
+def _initWorker(data):
+    global _shared
+    _shared = Snapshot(data)
+
+
+def _runBranch(run, variant):
+    return run(_shared, variant)
+
+
+def fork(snapshot, variants, run, processes=None):
+    """
+    run(snapshot, variant) for every variant, in worker processes (`processes`
+    of them, 1 runs them here). `run` has to be a module-level function.
+    Returns the results in the order of the variants.
+    """
+    variants = list(variants)
+    if processes == 1:
+        return [run(snapshot, variant) for variant in variants]
+    processes = processes or os.cpu_count()
+    chunksize = max(1, len(variants) // (4 * processes))
+    with ProcessPoolExecutor(processes, initializer=_initWorker, initargs=(snapshot.data,)) as pool:
+        return list(pool.map(_runBranch, [run] * len(variants), variants, chunksize=chunksize))
+
+
+# ============== WHAT-IF DEMO ==============
+
+
+def loopSummary(loop, since=0.0):
+    lap_times = [b - a for a, b in zip([0.0] + loop.laps, loop.laps) if b > since]
+    return {
+        "laps": len(loop.laps),
+        "best_lap": min(lap_times, default=None),
+        "mean_voltage": loop.meanVoltage(),
+        "derailed": bool(loop.car.derailed),
+        "state": loop.car.getState(),
+    }
+
+
+def loopSettings(snapshot):
+    """ClosedLoop arguments of the loop captured as component "loop", and the parameters it started with."""
+    settings = dict(snapshot.component("loop")[0])
+    return settings, settings.pop("start_parameters")
+
+
+def restoreLoop(snapshot):
+    """The scheduler.ClosedLoop captured as component "loop", with its own periods, in the checkpointed state."""
+    from scheduler import ClosedLoop
+
+    settings, _ = loopSettings(snapshot)
+    loop = ClosedLoop(snapshot.restore(), **settings)
+    loop.setState(snapshot.component("loop"))
+    return loop
+
+
+def whatIf(snapshot, variant):
+    """The scheduler.py closed loop from the checkpoint, with the controller target set to variant["target_ay"]."""
+    loop = restoreLoop(snapshot)
+    loop.controller.target_ay = variant["target_ay"]
+    start = snapshot.tick_count * loop.physics_period
+    loop.run(variant["duration"])
+    return loopSummary(loop, start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prefix", type=float, default=20.0, help="seconds before the checkpoint")
+    parser.add_argument("--suffix", type=float, default=10.0, help="seconds of every branch")
+    parser.add_argument("--target-ay", type=float, default=20.0, help="controller target before the checkpoint")
+    parser.add_argument("--physics", type=float, default=deltat, help="physics period (s) of the prefix")
+    parser.add_argument("--targets", type=float, nargs="*", default=[], help="controller targets of the branches")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--save", help="write the checkpoint to this file")
+    parser.add_argument("--load", help="start from a saved checkpoint instead of running the prefix")
+    parser.add_argument("--check", action="store_true", help="re-run the first branch from tick 0 and compare")
+    args = parser.parse_args(argv)
+
+    from simulation import Simulation
+    from scheduler import ClosedLoop
+
+    if args.load:
+        snapshot = Snapshot.load(args.load)
+    else:
+        t0 = time.perf_counter()
+        sim = Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=0.0))
+        loop = ClosedLoop(sim, physics=args.physics, target_ay=args.target_ay)
+        loop.run(args.prefix)
+        snapshot = Snapshot.capture(loop.sim, loop=loop)
+        print(f"prefix: {args.prefix:g} s in {time.perf_counter() - t0:.2f} s, {len(loop.laps)} laps")
+    print(f"checkpoint at tick {snapshot.tick_count}: {len(snapshot.data)} bytes")
+    if args.save:
+        snapshot.save(args.save)
+
+    variants = [{"target_ay": target, "duration": args.suffix} for target in args.targets]
+    t0 = time.perf_counter()
+    results = fork(snapshot, variants, whatIf, args.processes)
+    if variants:
+        print(f"{len(variants)} branches of {args.suffix:g} s in {time.perf_counter() - t0:.2f} s")
+    for variant, result in zip(variants, results):
+        best = f"{result['best_lap']:.3f} s" if result["best_lap"] else "-"
+        print(
+            f"  target {variant['target_ay']:5.1f} m/s^2: {result['laps']:3d} laps, best {best}, "
+            f"mean {result['mean_voltage']:.2f} V{', derailed' if result['derailed'] else ''}"
+        )
+
+    if args.check and variants:
+        # the same branch without the checkpoint: the prefix again as it was run, then the changed target
+        settings, start_parameters = loopSettings(snapshot)
+        start = snapshot.tick_count * settings["physics"]
+        loop = ClosedLoop(snapshot.simulation(start_parameters), **settings)
+        loop.run(start)
+        loop.controller.target_ay = variants[0]["target_ay"]
+        loop.run(args.suffix)
+        same = loopSummary(loop, start) == results[0]
+        print(f"check from tick 0: {'identical' if same else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
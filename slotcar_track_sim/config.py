@@ -6,13 +6,46 @@ Created on Fri Oct 17 09:07:49 2025
 """
 
 SCALE = 0.5
-deltat = 0.010  # 5 ms
+deltat = 0.010  # 10 ms
+render_period = 1 / 60  # s between UI frames, independent of the physics step
+chart_period = 0.2  # s between live chart redraws, independent of the frame rate
+imu_period = 0.001  # s, GY521 sampling on the real car (scheduler.py)
+control_period = 0.004  # s, ESP32 controller loop (scheduler.py)
 gravity = 9.81  # m/s^2
 pixels_per_meter = 128 * SCALE / 0.12
 sw = 1920
 sh = 1080
 # ixels_per_mm = pixels_per_meter / 1000
 
+# (label, min, max, resolution, unit, parameter name) of every car parameter
+PARAM_DEFINITIONS = [
+    ("Voltage", 0.0, 12.0, 0.1, "V", "voltage"),
+    ("Magnet Max Energy Product", 0.0, 50.0, 0.5, "MGOe", "max_energy"),
+    ("Mass", 70.0, 200.0, 1.0, "g", "mass"),
+    ("Static Friction", 0.0, 2.0, 0.01, "-", "static_f"),
+    ("Dynamic Friction", 0.0, 2.0, 0.01, "-", "dynamic_f"),
+    ("Wheel Radius", 4.0, 10.0, 0.1, "mm", "wheel_r"),
+    ("Torque Constant", 0.8, 2.0, 0.01, "-", "torque_c"),
+    ("Back EMF Constant", 1.0, 5.0, 0.01, "-", "back_emf_c"),
+    ("Back EMF", 0.003, 0.007, 0.0001, "-", "back_emf"),
+    ("Gear Ratio", 2.5, 4.0, 0.1, "-", "gear_ratio"),
+    ("Geartrain Efficiency", 80.0, 95.0, 1.0, "%", "efficiency"),
+]
+
+
+def defaultParameters(**overrides):
+    """Parameter dict at the slider minimums (what the UI starts with)."""
+    parameters = {var_name: min_val for _, min_val, _, _, _, var_name in PARAM_DEFINITIONS}
+    parameters.update(overrides)
+    return parameters
+
+
+def midParameters(**overrides):
+    """Parameter dict at the middle of every slider range."""
+    parameters = {var_name: (lo + hi) / 2 for _, lo, hi, _, _, var_name in PARAM_DEFINITIONS}
+    parameters.update(overrides)
+    return parameters
+
 
 # def mm_to_px(canvas, x, y):
 #    """Convert mm to pixel coordinates (Tkinter uses y downward)."""
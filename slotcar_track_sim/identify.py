@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Fits car parameters to a recorded run.
+
+The car2 tick is rewritten over NumPy arrays so that a whole population of
+candidate parameter sets is stepped at once. Every iteration of the
+optimizer (a cross-entropy search in the slider ranges, normalized to
+[0, 1]) splits its population over a process pool, each worker stepping
+its share as one batch and scoring it by the RMS error of s at the
+recorded instants.
+
+    python identify.py aligned.npz --fit voltage torque_c dynamic_f
+    python identify.py run.json --fit mass static_f --out car.json
+
+Recordings are the aligned .npz written by telemetry.py (t, s) or the
+telemetry JSON of offscreen.py (first car). The run is simulated from the
+first recorded position with the car still. Parameters that are not
+fitted keep their value from --start (a JSON parameter file) or the
+middle of their slider range.
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import *
+from track import *
+from car2 import CAR_A, DERAIL_SLIP, MAX_ACCEL, MAX_SLIP, MAX_SLIP_RATE, MAX_V, R_MOTOR
+
+POPULATION = 64
+ELITE_FRACTION = 0.2
+ITERATIONS = 30
+SMOOTHING = 0.7  # weight of the elite statistics in each distribution update
+MIN_SIGMA = 1e-3  # of the normalized range, the search stops below it
+
+RANGES = {name: (lo, hi) for _, lo, hi, _, _, name in PARAM_DEFINITIONS}
+
+
+# ============== BATCHED MODEL ==============
+
+
+class BatchCar:
+    """car2.Car without the drawing, over arrays of parameter sets (one car per set)."""
+
+    def __init__(self, circuit, parameters, s0=0.0):
+        entries = circuit.piecewise_curvature.piece
+        self.piece_starts = np.array([e[1] for e in entries])
+        self.piece_curvatures = np.array([e[0] for e in entries])
+        self.length = circuit.getLength()
+
+        p = {name: np.asarray(parameters[name], dtype=float) for name in RANGES}
+        n = np.broadcast(*p.values()).size
+        self.mass_kg = p["mass"] / 1000
+        r = p["wheel_r"] / 1000
+        N = p["gear_ratio"]
+        # F_motor = motor_gain * (voltage - emf_per_v * v)
+        self.motor_gain = (p["efficiency"] / 100) * N * (p["torque_c"] * 0.001) / (r * R_MOTOR)
+        self.emf_per_v = p["back_emf_c"] * 0.001 * N / r
+        self.voltage = p["voltage"]
+        normal = self.mass_kg * gravity + p["max_energy"] * 0.05
+        self.grip_static = p["static_f"] * normal
+        self.grip_dynamic = p["dynamic_f"] * normal
+        self.magnet_k = p["max_energy"] * 10
+
+        self.s = np.full(n, float(s0))
+        self.v = np.zeros(n)
+        self.slip_angle = np.zeros(n)
+        self.derailed = np.zeros(n, dtype=bool)
+
+    def curvature(self):
+        piece = np.searchsorted(self.piece_starts, self.s % self.length, side="right") - 1
+        return self.piece_curvatures[piece]
+
+    def tick(self, dt=deltat):
+        on = ~self.derailed
+        v, slip = self.v, self.slip_angle
+
+        F_motor = self.motor_gain * (self.voltage - self.emf_per_v * v)
+        c = np.abs(self.curvature())
+        F_centrifugal = np.where((v != 0) & (c >= 0.0001), self.mass_kg * v**2 * c, 0.0)
+        slipping = F_centrifugal > self.grip_static
+
+        # grip: the slip angle damps back to zero
+        slip_grip = np.where(slip > 0.01, slip * 0.9, 0.0)
+
+        # slip: the rear slides out against friction and the magnet
+        offset = CAR_A * np.sin(slip)
+        F_restore = np.where(np.abs(offset) < 0.015, -self.magnet_k * offset, 0.0)
+        F_net = F_centrifugal - self.grip_dynamic + F_restore
+        slip_rate = np.where(v > 0, F_net / (self.mass_kg * 10), 0.0)
+        slip_rate = np.clip(slip_rate, -MAX_SLIP_RATE, MAX_SLIP_RATE)
+        slip_slide = np.clip(slip + slip_rate * dt, -MAX_SLIP, MAX_SLIP)
+
+        slip = np.where(slipping, slip_slide, slip_grip)
+        acceleration = np.clip(F_motor * np.maximum(np.cos(slip), 0) / self.mass_kg, -MAX_ACCEL, MAX_ACCEL)
+        v_on = np.clip(v + acceleration * dt, 0, MAX_V)
+
+        # derailed cars spin down where they are
+        v_off = self.v * 0.97
+        v_off[v_off < 0.01] = 0
+
+        self.slip_angle = np.where(on, slip, self.slip_angle)
+        self.v = np.where(on, v_on, v_off)
+        self.s = np.where(on, self.s + v_on * dt, self.s)
+        self.derailed |= on & (np.abs(slip) >= DERAIL_SLIP)
+
+
+def simulate(circuit, parameters, ticks, s0=0.0, dt=deltat):
+    """Positions s of every parameter set at the given tick indices, shape (len(ticks), n)."""
+    ticks = np.asarray(ticks)
+    cars = BatchCar(circuit, parameters, s0)
+    out = np.empty((len(ticks), len(cars.s)))
+    k = 0
+    for tick in range(int(ticks[-1]) + 1):
+        while k < len(ticks) and ticks[k] == tick:
+            out[k] = cars.s
+            k += 1
+        cars.tick(dt)
+    return out
+
+
+# ============== RECORDINGS ==============
+
+
+def loadRecording(path):
+    """Returns (layout, t, s) of a recorded run, t starting at 0."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            t, s = data["t"], data["s"]
+        layout = DEFAULT_LAYOUT
+    else:
+        from offscreen import load_telemetry
+
+        layout, frames, frame_dt = load_telemetry(path)
+        s = np.array([states[0][0] for states in frames])
+        t = np.arange(len(s)) * frame_dt
+    return layout, t - t[0], s
+
+
+# ============== PARALLEL EVALUATION ==============
+
+_worker = {}
+
+
+def _init_worker(layout, lane_idx, ticks, observed, s0):
+    _worker.update(circuit=Circuit(layout, lane_idx=lane_idx), ticks=ticks, observed=observed, s0=s0)
+
+
+def _score(parameters):
+    s = simulate(_worker["circuit"], parameters, _worker["ticks"], _worker["s0"])
+    return np.sqrt(np.mean((s - _worker["observed"][:, None]) ** 2, axis=0))
+
+
+class Identifier:
+    """Cross-entropy search of the parameters in `fit`, the others fixed at `base`."""
+
+    def __init__(self, layout, t, s, fit, base, lane_idx=0, workers=None, dt=deltat):
+        unknown = [name for name in fit if name not in RANGES]
+        if unknown:
+            raise ValueError(f"unknown parameters {unknown}, expected some of {list(RANGES)}")
+        self.fit = list(fit)
+        self.base = dict(base)
+        self.lo = np.array([RANGES[name][0] for name in self.fit])
+        self.hi = np.array([RANGES[name][1] for name in self.fit])
+
+        ticks = np.round(t / dt).astype(int)
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(
+            self.workers, initializer=_init_worker, initargs=(layout, lane_idx, ticks, np.asarray(s), float(s[0]))
+        )
+
+    def close(self):
+        self.pool.shutdown()
+
+    def parameters(self, x):
+        """Parameter dict of arrays for normalized candidates x, shape (n, len(fit))."""
+        values = self.lo + np.clip(x, 0, 1) * (self.hi - self.lo)
+        parameters = {name: np.full(len(x), value, dtype=float) for name, value in self.base.items()}
+        for i, name in enumerate(self.fit):
+            parameters[name] = values[:, i]
+        return parameters
+
+    def evaluate(self, x):
+        """RMS s error of every candidate, the population split over the pool."""
+        batches = np.array_split(x, min(self.workers, len(x)))
+        futures = [self.pool.submit(_score, self.parameters(b)) for b in batches]
+        return np.concatenate([f.result() for f in futures])
+
+    def run(self, population=POPULATION, iterations=ITERATIONS, seed=0, log=print):
+        rng = np.random.default_rng(seed)
+        mean = np.array([(self.base[name] - lo) / (hi - lo) for name, lo, hi in zip(self.fit, self.lo, self.hi)])
+        sigma = np.full(len(self.fit), 0.3)
+        n_elite = max(2, int(population * ELITE_FRACTION))
+        best_x, best_error = mean, math.inf
+
+        for iteration in range(iterations):
+            x = np.clip(rng.normal(mean, sigma, (population, len(self.fit))), 0, 1)
+            x[0] = best_x if best_error < math.inf else mean  # the best so far is always re-scored
+            errors = self.evaluate(x)
+            order = np.argsort(errors)
+            if errors[order[0]] < best_error:
+                best_x, best_error = x[order[0]], float(errors[order[0]])
+
+            elite = x[order[:n_elite]]
+            mean = SMOOTHING * elite.mean(axis=0) + (1 - SMOOTHING) * mean
+            sigma = SMOOTHING * elite.std(axis=0) + (1 - SMOOTHING) * sigma
+            if log:
+                log(f"iteration {iteration + 1}: best RMS {best_error:.4f} m, spread {sigma.max():.4f}")
+            if sigma.max() < MIN_SIGMA:
+                break
+
+        fitted = {name: float(values[0]) for name, values in self.parameters(best_x[None, :]).items()}
+        return fitted, best_error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="aligned .npz from telemetry.py or telemetry JSON from offscreen.py")
+    parser.add_argument("--fit", nargs="+", required=True, choices=list(RANGES))
+    parser.add_argument("--start", help="JSON parameter file with the starting (and fixed) values")
+    parser.add_argument("--lane", type=int, default=0)
+    parser.add_argument("--population", type=int, default=POPULATION)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the fitted parameters to this JSON file")
+    args = parser.parse_args(argv)
+
+    base = midParameters()
+    if args.start:
+        with open(args.start) as f:
+            base.update(json.load(f))
+
+    layout, t, s = loadRecording(args.recording)
+    t0 = time.perf_counter()
+    identifier = Identifier(layout, t, s, args.fit, base, args.lane, args.workers)
+    try:
+        fitted, error = identifier.run(args.population, args.iterations, args.seed)
+    finally:
+        identifier.close()
+    print(f"fitted in {time.perf_counter() - t0:.1f} s, RMS error {error:.4f} m")
+    for name in args.fit:
+        print(f"  {name} = {fitted[name]:.4g}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(fitted, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
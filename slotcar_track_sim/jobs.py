@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Batch runs of headless car2 jobs through a queue on a shared filesystem.
+
+No broker: the queue is a directory that every worker can reach (an NFS
+mount on a cluster, or a local directory for worker processes on one
+box). A sweep is split into units of a few runs each, and workers pull
+units until the queue is drained:
+
+    QUEUE/pending/<unit>.json          waiting (runs, attempts so far)
+    QUEUE/claimed/<unit>@<worker>.json claimed by a worker, mtime = heartbeat
+    QUEUE/results/<unit>.json          metrics of every run of the unit
+    QUEUE/failed/<unit>.json           gave up after MAX_ATTEMPTS
+
+A worker claims a unit by renaming it from pending/ to claimed/, which
+only one worker can win, and touches the claim every HEARTBEAT_S while
+it runs. A claim whose heartbeat is older than STALE_S belongs to a dead
+worker; any worker moves it back to pending/ with one attempt more.
+Results are written to a temporary file and renamed into place, so a
+slow worker that finishes after its claim was retried only rewrites the
+same result.
+
+    python jobs.py submit sweep/ --grid voltage=4:8:0.5 --grid mass=80:200:20 --duration 20
+    python jobs.py submit mc/ --random static_f=0.2:2 --random dynamic_f=0.1:1.5 --samples 5000
+    python jobs.py work sweep/ --processes 8        # on every node
+    python jobs.py status sweep/
+    python jobs.py merge sweep/ --out sweep.npz     # one column per parameter and metric
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+from config import *
+from track import *
+
+RUNS_PER_UNIT = 16
+HEARTBEAT_S = 10
+STALE_S = 60
+MAX_ATTEMPTS = 3
+POLL_S = 2  # idle wait while other workers still hold claims
+
+PARAMETER_NAMES = [definition[5] for definition in PARAM_DEFINITIONS]
+METRIC_COLUMNS = ("laps", "first_lap", "best_lap", "derailed", "final_s", "v_max")
+STATES = ("pending", "claimed", "results", "failed")
+
+
+def _writeJson(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _readJson(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class JobQueue:
+    def __init__(self, root):
+        self.root = root
+        for state in STATES:
+            os.makedirs(os.path.join(root, state), exist_ok=True)
+
+    def path(self, state, name=""):
+        return os.path.join(self.root, state, name)
+
+    def names(self, state):
+        return sorted(name for name in os.listdir(self.path(state)) if name.endswith(".json"))
+
+    # ---------- submit ----------
+
+    def submit(
+        self, layout, parameter_sets, duration, lane_idx=0, model=None, runs_per_unit=RUNS_PER_UNIT, steady=False
+    ):
+        if any(self.names(state) for state in STATES):
+            raise ValueError(f"{self.root} already holds a job")
+        with open(os.path.join(self.root, "job.json"), "w") as f:
+            json.dump(
+                {
+                    "layout": [list(k) for k in layoutKey(layout)],
+                    "duration": duration,
+                    "lane": lane_idx,
+                    "model": model,
+                    "steady": steady,
+                },
+                f,
+            )
+        runs = [{"index": i, "parameters": p} for i, p in enumerate(parameter_sets)]
+        n_units = 0
+        for first in range(0, len(runs), runs_per_unit):
+            unit = f"u{first // runs_per_unit:06d}"
+            _writeJson(self.path("pending", unit + ".json"), {"attempts": 0, "runs": runs[first : first + runs_per_unit]})
+            n_units += 1
+        return n_units
+
+    def job(self):
+        job = _readJson(os.path.join(self.root, "job.json"))
+        job["layout"] = layoutFromKey(job["layout"])
+        return job
+
+    # ---------- claims ----------
+
+    def claim(self, worker):
+        """Claims a pending unit, returning (unit, claim path, data) or None if there is none."""
+        for name in self.names("pending"):
+            unit = name[: -len(".json")]
+            claim = self.path("claimed", f"{unit}@{worker}.json")
+            try:
+                # fresh mtime first, or the claim would look stale as soon as it is made
+                os.utime(self.path("pending", name))
+                os.rename(self.path("pending", name), claim)
+            except FileNotFoundError:
+                continue  # another worker was faster
+            return unit, claim, _readJson(claim)
+        return None
+
+    def recoverStale(self, now=None):
+        """Moves claims without a recent heartbeat back to pending (or failed). Returns how many."""
+        now = now or time.time()
+        recovered = 0
+        for name in os.listdir(self.path("claimed")):
+            # left behind by a worker that died while recovering a claim
+            if name.endswith(".recovering"):
+                path = self.path("claimed", name)
+                try:
+                    if now - os.path.getmtime(path) >= STALE_S:
+                        os.rename(path, path[: -len(".recovering")])
+                except FileNotFoundError:
+                    pass
+        for name in self.names("claimed"):
+            claim = self.path("claimed", name)
+            try:
+                if now - os.path.getmtime(claim) < STALE_S:
+                    continue
+                data = _readJson(claim)
+            except FileNotFoundError:
+                continue
+            unit = name.split("@")[0]
+            data["attempts"] += 1
+            target = "failed" if data["attempts"] >= MAX_ATTEMPTS else "pending"
+            data.setdefault("errors", []).append(f"claim {name} went stale")
+            # the rename is the recovery: only one worker can move this claim
+            moving = self.path("claimed", name + ".recovering")
+            try:
+                os.rename(claim, moving)
+                os.utime(moving)
+            except FileNotFoundError:
+                continue
+            _writeJson(self.path(target, unit + ".json"), data)
+            os.unlink(moving)
+            recovered += 1
+        return recovered
+
+    def complete(self, unit, claim, rows):
+        _writeJson(self.path("results", unit + ".json"), {"runs": rows})
+        try:
+            os.unlink(claim)
+        except FileNotFoundError:
+            pass  # retried meanwhile: the result is the same
+
+    def fail(self, unit, claim, data, error):
+        data["attempts"] += 1
+        data.setdefault("errors", []).append(error)
+        target = "failed" if data["attempts"] >= MAX_ATTEMPTS else "pending"
+        _writeJson(self.path(target, unit + ".json"), data)
+        try:
+            os.unlink(claim)
+        except FileNotFoundError:
+            pass
+
+    def status(self):
+        return {state: len(self.names(state)) for state in STATES}
+
+    # ---------- results ----------
+
+    def merge(self):
+        """Columns (lists) of every finished run, in submission order."""
+        rows = []
+        for name in self.names("results"):
+            rows.extend(_readJson(self.path("results", name))["runs"])
+        rows.sort(key=lambda r: r["index"])
+        columns = {"index": [r["index"] for r in rows]}
+        for name in PARAMETER_NAMES:
+            columns[name] = [r["parameters"][name] for r in rows]
+        for name in METRIC_COLUMNS:
+            columns[name] = [r[name] for r in rows]
+        return columns
+
+
+# ============== WORKER ==============
+
+
+def workerName():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Heartbeat:
+    """Touches a claim file every HEARTBEAT_S until stopped."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stop_event.wait(HEARTBEAT_S):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return  # recovered by another worker
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def runUnit(job, runs, store=None):
+    from results import cachedRun
+
+    rows = []
+    for run in runs:
+        metrics, _ = cachedRun(
+            store,
+            job["layout"],
+            run["parameters"],
+            job["duration"],
+            job["lane"],
+            job["model"],
+            steady=job.get("steady", False),
+        )
+        rows.append(
+            {
+                "index": run["index"],
+                "parameters": run["parameters"],
+                "laps": metrics["laps"],
+                "first_lap": metrics["lap_times"][0] if metrics["lap_times"] else math.nan,
+                "best_lap": math.nan if metrics["best_lap"] is None else metrics["best_lap"],
+                "derailed": metrics["derailed"],
+                "final_s": metrics["final_s"],
+                "v_max": metrics["v_max"],
+            }
+        )
+    return rows
+
+
+def work(root, cache=None, log=print):
+    """Pulls units until the queue is drained. Returns the number of units completed."""
+    queue = JobQueue(root)
+    job = queue.job()
+    store = None
+    if cache is not None:
+        from results import DEFAULT_ROOT, ResultStore
+
+        store = ResultStore(cache or DEFAULT_ROOT)
+
+    worker = workerName()
+    done = 0
+    while True:
+        queue.recoverStale()
+        claimed = queue.claim(worker)
+        if claimed is None:
+            if not queue.names("claimed"):
+                return done
+            time.sleep(POLL_S)  # others still working, their units may come back
+            continue
+
+        unit, claim, data = claimed
+        try:
+            with Heartbeat(claim):
+                rows = runUnit(job, data["runs"], store)
+        except Exception as e:
+            queue.fail(unit, claim, data, f"{worker}: {e!r}")
+            if log:
+                log(f"{worker}: {unit} failed: {e!r}")
+            continue
+        queue.complete(unit, claim, rows)
+        done += 1
+        if log:
+            log(f"{worker}: {unit} done ({len(rows)} runs)")
+
+
+# ============== SWEEPS ==============
+
+
+def parseRange(spec):
+    """'name=lo:hi[:step]' -> (name, lo, hi, step or None)."""
+    name, _, values = spec.partition("=")
+    if name not in PARAMETER_NAMES:
+        raise ValueError(f"unknown parameter {name!r}, expected one of {PARAMETER_NAMES}")
+    parts = [float(v) for v in values.split(":")]
+    lo = parts[0]
+    hi = parts[1] if len(parts) > 1 else lo
+    step = parts[2] if len(parts) > 2 else None
+    return name, lo, hi, step
+
+
+def parameterSets(base, grid=(), random_ranges=(), samples=0, seed=0):
+    """The grid product of `grid`, each grid point repeated with `samples` uniform draws of `random_ranges`."""
+    axes = []
+    for name, lo, hi, step in grid:
+        n = int(round((hi - lo) / step)) + 1 if step else 1
+        axes.append([(name, lo + i * step if step else lo) for i in range(n)])
+    rng = random.Random(seed)
+    sets = []
+    for point in itertools.product(*axes):
+        for _ in range(samples if random_ranges else 1):
+            parameters = dict(base, **dict(point))
+            for name, lo, hi, _ in random_ranges:
+                parameters[name] = rng.uniform(lo, hi)
+            sets.append(parameters)
+    return sets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit")
+    submit.add_argument("queue")
+    submit.add_argument("--grid", action="append", default=[], help="name=lo:hi:step")
+    submit.add_argument("--random", action="append", default=[], help="name=lo:hi, drawn --samples times")
+    submit.add_argument("--samples", type=int, default=100)
+    submit.add_argument("--seed", type=int, default=0)
+    submit.add_argument("--duration", type=float, default=20.0)
+    submit.add_argument("--model")
+    submit.add_argument("--per-unit", type=int, default=RUNS_PER_UNIT)
+    submit.add_argument("--steady", action="store_true", help="extrapolate runs once their laps are periodic")
+
+    worker = commands.add_parser("work")
+    worker.add_argument("queue")
+    worker.add_argument("--processes", type=int, default=1)
+    worker.add_argument("--cache", nargs="?", const="", help="also keep runs in a result store")
+
+    status = commands.add_parser("status")
+    status.add_argument("queue")
+
+    merge = commands.add_parser("merge")
+    merge.add_argument("queue")
+    merge.add_argument("--out", required=True, help=".npz (columns) or .csv")
+
+    args = parser.parse_args(argv)
+    queue = JobQueue(args.queue)
+
+    if args.command == "submit":
+        grid = [parseRange(spec) for spec in args.grid]
+        random_ranges = [parseRange(spec) for spec in args.random]
+        sets = parameterSets(midParameters(), grid, random_ranges, args.samples, args.seed)
+        n_units = queue.submit(
+            DEFAULT_LAYOUT, sets, args.duration, model=args.model, runs_per_unit=args.per_unit, steady=args.steady
+        )
+        print(f"{len(sets)} runs in {n_units} units queued in {args.queue}")
+
+    elif args.command == "work":
+        if args.processes == 1:
+            work(args.queue, args.cache)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(args.processes) as pool:
+                futures = [pool.submit(work, args.queue, args.cache) for _ in range(args.processes)]
+                done = sum(f.result() for f in futures)
+            print(f"{done} units done")
+
+    elif args.command == "status":
+        print(", ".join(f"{n} {state}" for state, n in queue.status().items()))
+
+    elif args.command == "merge":
+        columns = queue.merge()
+        if args.out.endswith(".csv"):
+            with open(args.out, "w") as f:
+                f.write(",".join(columns) + "\n")
+                for row in zip(*columns.values()):
+                    f.write(",".join(str(v) for v in row) + "\n")
+        else:
+            import numpy as np
+
+            np.savez(args.out, **{name: np.array(values) for name, values in columns.items()})
+        print(f"{len(columns['index'])} runs merged into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
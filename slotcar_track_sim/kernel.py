@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled tick kernel for long single-car runs.
+
+runTicks() is car2.Car.tick and the piecewise lookups of its lane,
+rewritten over flat arrays so that a whole run is one call. With Numba
+installed it is compiled on first use (and cached on disk); without it,
+or with AUTOSLOT_JIT=0, the same function runs as plain Python. Both give
+the same floats as car2.Car.tick, operation for operation, so either path
+can stand in for the other.
+
+    kernel = TickKernel(circuit)
+    trajectory = kernel.run(car, 1_000_000, dt=1e-4, every=100)
+
+The trajectory has one row of STATE_FIELDS every `every` ticks, and the
+car is left in the final state. The derailment message of car2 is not
+printed.
+"""
+
+import math
+import os
+
+import numpy as np
+
+from config import *
+from car2 import CAR_A, CAR_B, DERAIL_SLIP, MAX_ACCEL, MAX_SLIP, MAX_SLIP_RATE, MAX_V, R_MOTOR
+
+# packed parameter order: the car's parameters, then car2's constants. Those
+# travel with the parameters rather than as globals, which Numba would freeze
+# into its disk cache, stale once car2 changes
+P_VOLTAGE, P_MASS, P_STATIC, P_DYNAMIC, P_MAGNET, P_WHEEL_R, P_TORQUE_C, P_BACK_EMF_C, P_GEAR, P_EFFICIENCY = range(10)
+P_CAR_A, P_CAR_B, P_R_MOTOR, P_MAX_SLIP, P_DERAIL_SLIP, P_MAX_SLIP_RATE, P_MAX_ACCEL, P_MAX_V = range(10, 18)
+CAR_CONSTANTS = [CAR_A, CAR_B, R_MOTOR, MAX_SLIP, DERAIL_SLIP, MAX_SLIP_RATE, MAX_ACCEL, MAX_V]
+
+
+def _identity(f):
+    return f
+
+
+jit = inline = _identity
+if os.environ.get("AUTOSLOT_JIT", "1") not in ("", "0"):
+    try:
+        from numba import njit
+
+        jit = njit(cache=True)
+        inline = njit(cache=True, inline="always")  # for the tick body, inlined into every loop that steps
+    except ImportError:
+        pass
+
+JIT_ENABLED = jit is not _identity
+
+
+# ============== LANE LOOKUPS ==============
+
+
+@jit
+def _piece(lane, length, x, hint):
+    # index of the piece holding x, as the linear scans in track.py find it. The
+    # car usually stays on the piece of the previous lookup, `hint`, or the next one
+    if x > length:
+        x -= int(x / length) * length
+    starts, ends = lane[0], lane[1]
+    n = len(starts)
+    for i in (hint, hint + 1 if hint + 1 < n else 0):
+        if starts[i] <= x < ends[i]:
+            return i, x
+    for i in range(n):
+        if starts[i] <= x < ends[i]:
+            return i, x
+    raise ValueError("position outside the lane")
+
+
+@jit
+def _angle(lane, i, x):
+    return lane[5, i] + (x - lane[0, i]) * lane[2, i]
+
+
+@jit
+def _position(lane, i, x):
+    c, x0, y0, a0 = lane[2, i], lane[3, i], lane[4, i], lane[5, i]
+    rx = x - lane[0, i]
+    if c == 0:
+        return x0 + rx * math.cos(a0), y0 + rx * math.sin(a0)
+    af = a0 + rx * c
+    return x0 + 1 / c * (math.sin(af) - lane[6, i]), y0 - 1 / c * (math.cos(af) - lane[7, i])
+
+
+# ============== TICK ==============
+
+
+@jit
+def _pose(lane, length, c, s, slip_angle, piece):
+    # visual position of car2: the CG behind the guide pin, along the heading
+    car_b = c[C_CAR_B]
+    piece, at = _piece(lane, length, s, piece)
+    pin_x, pin_y = _position(lane, piece, at)
+    b_heading = _angle(lane, piece, at) + slip_angle
+    return pin_x - car_b * math.cos(b_heading), pin_y - car_b * math.sin(b_heading), b_heading, piece
+
+
+# _constants() order
+C_MASS, C_MOTOR_GAIN, C_EMF_K, C_R, C_VOLTAGE, C_F_MAX_STATIC, C_F_FRICTION, C_K_MAGNET = range(8)
+C_CAR_A, C_CAR_B, C_MAX_SLIP, C_DERAIL_SLIP, C_MAX_SLIP_RATE, C_MAX_ACCEL, C_MAX_V = range(8, 15)
+
+
+@jit
+def _constants(p):
+    # per-run constants of car2's tick, grouped as its expressions evaluate them
+    mass_kg = p[P_MASS] / 1000
+    r = p[P_WHEEL_R] / 1000
+    eta = p[P_EFFICIENCY] / 100
+    N = p[P_GEAR]
+    k_t = p[P_TORQUE_C] * 0.001
+    k_e = p[P_BACK_EMF_C] * 0.001
+    N_total = mass_kg * 9.81 + p[P_MAGNET] * 0.05
+    motor_gain = eta * N * k_t / (r * p[P_R_MOTOR])
+    return (
+        mass_kg,
+        motor_gain,
+        k_e * N,
+        r,
+        p[P_VOLTAGE],
+        p[P_STATIC] * N_total,
+        p[P_DYNAMIC] * N_total,
+        p[P_MAGNET] * 10,
+        p[P_CAR_A],
+        p[P_CAR_B],
+        p[P_MAX_SLIP],
+        p[P_DERAIL_SLIP],
+        p[P_MAX_SLIP_RATE],
+        p[P_MAX_ACCEL],
+        p[P_MAX_V],
+    )
+
+
+@inline
+def _tick(lane, length, c, dt, s, x, y, b_heading, v, slip_angle, derailed, piece, pose_pending, pose_s, pose_slip):
+    """One car2.Car.tick over the scalars of a state. The pose is left pending while on the track."""
+    mass_kg, motor_gain, emf_k, r, voltage, F_max_static, F_friction_lateral, k_magnet = c[:8]
+    car_a, max_slip, derail_slip, max_slip_rate, max_accel, max_v = c[8], c[10], c[11], c[12], c[13], c[14]
+    if derailed:
+        if pose_pending:
+            x, y, b_heading, piece = _pose(lane, length, c, pose_s, pose_slip, piece)
+            pose_pending = False
+        b_heading += 0.33 * v
+        b_heading %= 6.28
+        v *= 0.97
+        piece, at = _piece(lane, length, s, piece)
+        x += math.cos(_angle(lane, piece, at)) * v * dt
+        y += math.sin(_angle(lane, piece, at)) * v * dt
+        if v < 0.01:
+            v = 0.0
+    else:
+        F_motor = motor_gain * (voltage - (emf_k * v) / r)
+
+        F_centrifugal = 0.0
+        if v != 0:
+            piece, at = _piece(lane, length, s, piece)
+            curvature = lane[2, piece]
+            if abs(curvature) >= 0.0001:
+                F_centrifugal = mass_kg * (v**2) / abs(1 / curvature)
+
+        if not F_centrifugal > F_max_static:
+            slip_angle = slip_angle * 0.9 if slip_angle > 0.01 else 0.0
+        else:
+            offset = car_a * math.sin(slip_angle)
+            F_restore = -k_magnet * offset if abs(offset) < 0.015 else 0.0
+            F_net_lateral = F_centrifugal - F_friction_lateral + F_restore
+            slip_rate = F_net_lateral / (mass_kg * 10) if v > 0 else 0.0
+            slip_rate = max(-max_slip_rate, min(max_slip_rate, slip_rate))
+            slip_angle += slip_rate * dt
+            slip_angle = max(-max_slip, min(max_slip, slip_angle))
+
+        cos_alpha = math.cos(slip_angle)
+        if cos_alpha < 0:
+            cos_alpha = 0.0
+        acceleration = F_motor * cos_alpha / mass_kg
+        acceleration = max(-max_accel, min(max_accel, acceleration))
+        v += acceleration * dt
+        v = max(0.0, min(max_v, v))
+        s += v * dt
+
+        if abs(slip_angle) >= derail_slip:
+            derailed = 1.0
+        else:
+            pose_s, pose_slip, pose_pending = s, slip_angle, True
+    return s, x, y, b_heading, v, slip_angle, derailed, piece, pose_pending, pose_s, pose_slip
+
+
+@jit
+def runTicks(lane, length, p, state, n_ticks, dt, every):
+    """
+    Steps `state` (STATE_FIELDS, updated in place) n_ticks times with the
+    packed parameters `p`. Returns the state every `every` ticks.
+    """
+    s, x, y, b_heading, v, slip_angle, derailed = state[0], state[1], state[2], state[3], state[4], state[5], state[6]
+    out = np.empty((n_ticks // every, 7))
+    c = _constants(p)
+    piece = 0
+    # the pose only depends on s and the slip angle while on the track, so it is
+    # computed when a row is recorded or the car derails, not on every tick
+    pose_pending, pose_s, pose_slip = False, s, slip_angle
+
+    for tick in range(n_ticks):
+        s, x, y, b_heading, v, slip_angle, derailed, piece, pose_pending, pose_s, pose_slip = _tick(
+            lane, length, c, dt, s, x, y, b_heading, v, slip_angle, derailed, piece, pose_pending, pose_s, pose_slip
+        )
+        if (tick + 1) % every == 0:
+            if pose_pending:
+                x, y, b_heading, piece = _pose(lane, length, c, pose_s, pose_slip, piece)
+                pose_pending = False
+            row = out[(tick + 1) // every - 1]
+            row[0], row[1], row[2], row[3], row[4], row[5], row[6] = s, x, y, b_heading, v, slip_angle, derailed
+
+    if pose_pending:
+        x, y, b_heading, piece = _pose(lane, length, c, pose_s, pose_slip, piece)
+    state[0], state[1], state[2], state[3], state[4], state[5], state[6] = s, x, y, b_heading, v, slip_angle, derailed
+    return out
+
+
+# ============== CAR INTERFACE ==============
+
+
+def laneArrays(circuit):
+    """Rows start, end, curvature, x0, y0, a0, sin(a0), cos(a0) of every lane piece, and the lane length."""
+    entries = circuit.piecewise_position.piece
+    lane = np.array([[e[1], e[2], e[0], e[3], e[4], e[5], math.sin(e[5]), math.cos(e[5])] for e in entries]).T.copy()
+    return lane, circuit.piecewise_position.getLength()
+
+
+def packParameters(car):
+    """Current parameters of a car2.Car and car2's constants, in the kernel order."""
+    return np.array(
+        [
+            car.voltage,
+            car.mass,
+            car.mu_static,
+            car.mu_dynamic,
+            car.magnet_strength,
+            car.wheel_r,
+            car.torque_c,
+            car.back_emf_c,
+            car.gear_ratio,
+            car.gear_efficiency,
+            *CAR_CONSTANTS,
+        ],
+        dtype=float,
+    )
+
+
+class TickKernel:
+    """Runs car2 cars of one circuit through runTicks."""
+
+    def __init__(self, circuit):
+        self.lane, self.length = laneArrays(circuit)
+
+    def run(self, car, n_ticks, dt=deltat, every=1):
+        state = np.array(car.getState(), dtype=float)
+        trajectory = runTicks(self.lane, self.length, packParameters(car), state, n_ticks, dt, every)
+        car.setState(tuple(float(v) for v in state))
+        return trajectory
+
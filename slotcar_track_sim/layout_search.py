@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+"""
+Search for closed layouts over the piece catalog.
+
+Every catalog piece turns by a multiple of pi/8, so headings are small
+integers and each piece is a rigid move from a table indexed by the
+current heading. The depth-first search prunes a branch as soon as:
+
+- the pieces placed so far leave the footprint (room) rectangle, or
+- no completion can close the loop with the pieces left. For the last
+  CLOSING_DEPTH pieces this is exact: a memoized table, built backwards
+  from the start pose, holds every quantized pose that closes in r pieces
+  (meet in the middle), so partial sequences never walk their last
+  pieces. Up to REACH_DEPTH pieces from the end a coarser table, grown
+  backwards from the exact one, holds every REACH_CELL cell and heading
+  that can still reach it, so a branch heading away from a closable
+  pose is cut long before the end (for REACH_MIN_PIECES and more).
+  Further out only a reach bound on distance and heading applies.
+
+Loops are counted once. Only counterclockwise loops are kept (a
+clockwise loop is a mirrored counterclockwise one), and rotations of
+the same cycle are reduced to the one starting with the lowest catalog
+index. The first two pieces split the search over a process pool.
+
+Larger layouts can be sampled with random pruned descents instead of
+enumerated. A descent gives up after SAMPLE_BUDGET nodes: most do
+(the CLI reports the share), but short descents find far more layouts
+per second than long ones. At 24 pieces a core samples about 700
+descents and 10 layouts per second, so the example below finds a few
+hundred layouts in half a minute of CPU time, not millions.
+
+    python layout_search.py --pieces 10 --width 2 --height 1.5
+    python layout_search.py --pieces 24 --sample 20000 --rank lap_time --simulate 5
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import *
+from track import *
+from car2 import MAX_ACCEL, MAX_V
+from validate import CLOSURE_TOLERANCE
+
+HEADING_STEPS = 16  # headings are multiples of 2 pi / HEADING_STEPS
+HEADING_UNIT = 2 * math.pi / HEADING_STEPS
+QUANTUM = CLOSURE_TOLERANCE  # m, cell size of the closing table
+CLOSING_DEPTH = 5  # pieces covered by the closing table
+REACH_DEPTH = 10  # pieces covered by the coarse reach table
+REACH_CELL = 0.1  # m, cell size of the reach table
+REACH_MIN_PIECES = 14  # smaller searches finish before the reach table (about 1 s) pays off
+SAMPLE_BUDGET = 60  # search nodes per random descent
+
+CATALOG = [
+    (C8205Track, None),
+    (C8204Track, "L"),
+    (C8204Track, "R"),
+    (C8202Track, "L"),
+    (C8202Track, "R"),
+    (R3CurveTrack, "L"),
+    (R3CurveTrack, "R"),
+    (R4CurveTrack, "L"),
+    (R4CurveTrack, "R"),
+]
+
+# lap time estimate: a point mass with car2's acceleration and speed limits
+# and a fixed lateral grip. Only the ranking matters, --simulate refines it.
+LATERAL_ACCEL = 20.0  # m/s^2
+SEGMENT_LENGTH = 0.05  # m
+
+
+class PieceTable:
+    """Moves, footprints and lane profile of every catalog piece at every heading."""
+
+    def __init__(self, catalog=CATALOG, lane_idx=0):
+        self.catalog = list(catalog)
+        self.moves = []  # [heading][piece] -> (dx, dy, dk)
+        self.boxes = []  # [heading][piece] -> bounds relative to the piece start
+        for k in range(HEADING_STEPS):
+            moves, boxes = [], []
+            for cls, side in self.catalog:
+                t = cls(0, 0, k * HEADING_UNIT) if side is None else cls(0, 0, k * HEADING_UNIT, side)
+                nx, ny, na = t.getNext()
+                dk = (na - t.angle) / HEADING_UNIT
+                if abs(dk - round(dk)) > 1e-9:
+                    raise ValueError(f"{cls.__name__} does not turn by a multiple of {HEADING_UNIT:.4f} rad")
+                moves.append((nx, ny, round(dk)))
+                boxes.append(t.getBounds())
+            self.moves.append(moves)
+            self.boxes.append(boxes)
+
+        self.max_step = max(math.hypot(dx, dy) for dx, dy, dk in self.moves[0])
+        self.max_turn = max(abs(dk) for dx, dy, dk in self.moves[0])
+
+        self._closing = {}
+        self._reach = None
+        self.lanes = []  # per piece: (lane length, lane curvature)
+        for cls, side in self.catalog:
+            t = cls(0, 0, 0) if side is None else cls(0, 0, 0, side)
+            self.lanes.append((t.getLaneLength(lane_idx), t.getLaneCurvature(lane_idx)))
+
+    def layout(self, seq):
+        return [self.catalog[p] for p in seq]
+
+    def closingTable(self, depth=CLOSING_DEPTH):
+        """
+        closing[r]: quantized poses (x, y, k) from which r pieces end at the
+        start pose after one counterclockwise turn (k = HEADING_STEPS).
+        """
+        if depth in self._closing:
+            return self._closing[depth]
+        closing = [{(0, 0, HEADING_STEPS)}]
+        frontier = {(0, 0, HEADING_STEPS): (0.0, 0.0)}  # exact pose behind every key
+        for r in range(1, depth + 1):
+            poses = {}
+            for (qx, qy, qk), (x, y) in frontier.items():
+                for p in range(len(self.catalog)):
+                    k = qk - self.moves[0][p][2]
+                    dx, dy, _ = self.moves[k % HEADING_STEPS][p]
+                    poses.setdefault((round((x - dx) / QUANTUM), round((y - dy) / QUANTUM), k), (x - dx, y - dy))
+            closing.append(set(poses))
+            frontier = poses
+        self._closing[depth] = closing
+        return closing
+
+    def reachTable(self, depth=REACH_DEPTH):
+        """
+        reach[r] for CLOSING_DEPTH < r <= depth: the REACH_CELL cells and
+        headings (cx, cy, k) that contain every pose able to reach closing
+        (within the tolerance of canClose) in r - CLOSING_DEPTH pieces. A
+        superset, so pruning with it never loses a layout. None below.
+        """
+        closing = self.closingTable()
+        if self._reach is None:
+            # cells touched by a closing pose and the neighbor cells canClose accepts around it
+            base = set()
+            for qx, qy, k in closing[-1]:
+                for x in ((qx - 1.5) * QUANTUM, (qx + 1.5) * QUANTUM):
+                    for y in ((qy - 1.5) * QUANTUM, (qy + 1.5) * QUANTUM):
+                        base.add((math.floor(x / REACH_CELL), math.floor(y / REACH_CELL), k))
+            self._reach = [None] * (len(closing) - 1) + [base]
+        while len(self._reach) <= depth:
+            cells = set()
+            for cx, cy, qk in self._reach[-1]:
+                for p in range(len(self.catalog)):
+                    k = qk - self.moves[0][p][2]
+                    dx, dy, _ = self.moves[k % HEADING_STEPS][p]
+                    # the cell moved back by the piece overlaps at most 2 x 2 cells
+                    x0, y0 = math.floor(cx - dx / REACH_CELL), math.floor(cy - dy / REACH_CELL)
+                    cells.update(((x0, y0, k), (x0 + 1, y0, k), (x0, y0 + 1, k), (x0 + 1, y0 + 1, k)))
+            self._reach.append(cells)
+        return self._reach[: depth + 1]
+
+    def mirrorIndex(self):
+        # catalog index of every piece with its side swapped
+        index = {spec: p for p, spec in enumerate(self.catalog)}
+        swap = {"L": "R", "R": "L", None: None}
+        return [index[(cls, swap[side])] for cls, side in self.catalog]
+
+
+_default_table = None
+
+
+def defaultTable():
+    # one table per process, shared by every search task it runs
+    global _default_table
+    if _default_table is None:
+        _default_table = PieceTable()
+    return _default_table
+
+
+def canonical(seq, mirror):
+    """Smallest rotation of the loop and of the same loop driven backwards and mirrored."""
+    reverse = tuple(mirror[p] for p in reversed(seq))
+    candidates = []
+    for s in (tuple(seq), reverse):
+        candidates.extend(s[i:] + s[:i] for i in range(len(s)))
+    return min(candidates)
+
+
+class LayoutSearch:
+    def __init__(self, n_pieces, footprint=None, table=None):
+        self.n_pieces = n_pieces
+        self.footprint = footprint  # (width, height) in m, or None
+        self.table = table or defaultTable()
+        self.mirror = self.table.mirrorIndex()
+        self.closing = self.table.closingTable()
+        self.reach = self.table.reachTable(REACH_DEPTH) if n_pieces >= REACH_MIN_PIECES else []
+        self.nodes = 0
+
+    def canClose(self, x, y, k, remaining):
+        """True if `remaining` pieces can bring pose (x, y, k) back to the start, one turn counterclockwise."""
+        if remaining == 0:
+            return k == HEADING_STEPS and math.hypot(x, y) <= CLOSURE_TOLERANCE
+        if remaining < len(self.closing):
+            # a pose closing within the tolerance is at most one cell away from an exact one
+            table, qx, qy = self.closing[remaining], round(x / QUANTUM), round(y / QUANTUM)
+            return any((qx + i, qy + j, k) in table for i in (-1, 0, 1) for j in (-1, 0, 1))
+        if remaining < len(self.reach):
+            return (math.floor(x / REACH_CELL), math.floor(y / REACH_CELL), k) in self.reach[remaining]
+        # too far from the end for the table, only the reach bounds apply
+        if abs(HEADING_STEPS - k) > remaining * self.table.max_turn:
+            return False
+        return math.hypot(x, y) <= remaining * self.table.max_step + CLOSURE_TOLERANCE
+
+    def fits(self, box, x, y, k, p):
+        bx0, by0, bx1, by1 = self.table.boxes[k % HEADING_STEPS][p]
+        box = (min(box[0], x + bx0), min(box[1], y + by0), max(box[2], x + bx1), max(box[3], y + by1))
+        if self.footprint is not None and (
+            box[2] - box[0] > self.footprint[0] or box[3] - box[1] > self.footprint[1]
+        ):
+            return None
+        return box
+
+    def enumerateLayouts(self, prefix=()):
+        """Yields every closed layout (tuples of catalog indices) starting with `prefix`, once per loop."""
+        seq, x, y, k = [], 0.0, 0.0, 0
+        box = (math.inf, math.inf, -math.inf, -math.inf)
+        for p in prefix:
+            box = self.fits(box, x, y, k, p)
+            if box is None or (seq and p < seq[0]):
+                return
+            dx, dy, dk = self.table.moves[k % HEADING_STEPS][p]
+            seq.append(p)
+            x, y, k = x + dx, y + dy, k + dk
+        if not self.canClose(x, y, k, self.n_pieces - len(seq)):
+            return
+        yield from self._dfs(seq, x, y, k, box)
+
+    def _dfs(self, seq, x, y, k, box):
+        self.nodes += 1
+        remaining = self.n_pieces - len(seq)
+        if remaining == 0:
+            if canonical(seq, self.mirror) == tuple(seq):
+                yield tuple(seq)
+            return
+
+        # the canonical rotation starts with its lowest index
+        first = seq[0] if seq else 0
+        for p, (dx, dy, dk) in enumerate(self.table.moves[k % HEADING_STEPS]):
+            if p < first:
+                continue
+            new_box = self.fits(box, x, y, k, p)
+            if new_box is None or not self.canClose(x + dx, y + dy, k + dk, remaining - 1):
+                continue
+            seq.append(p)
+            yield from self._dfs(seq, x + dx, y + dy, k + dk, new_box)
+            seq.pop()
+
+    def sample(self, rng, budget=SAMPLE_BUDGET):
+        """
+        One randomized depth-first descent, backtracking for at most `budget`
+        nodes. Returns the canonical layout, or None if the budget ran out.
+        """
+        self.budget = self.nodes + budget
+        box = (math.inf, math.inf, -math.inf, -math.inf)
+        seq = self._sampleDfs(rng, [], 0.0, 0.0, 0, box)
+        return None if seq is None else canonical(seq, self.mirror)
+
+    def _sampleDfs(self, rng, seq, x, y, k, box):
+        self.nodes += 1
+        remaining = self.n_pieces - len(seq)
+        if remaining == 0:
+            return tuple(seq)
+
+        options = list(enumerate(self.table.moves[k % HEADING_STEPS]))
+        rng.shuffle(options)
+        for p, (dx, dy, dk) in options:
+            if self.nodes >= self.budget:
+                return None
+            new_box = self.fits(box, x, y, k, p)
+            if new_box is None or not self.canClose(x + dx, y + dy, k + dk, remaining - 1):
+                continue
+            seq.append(p)
+            found = self._sampleDfs(rng, seq, x + dx, y + dy, k + dk, new_box)
+            if found is not None:
+                return found
+            seq.pop()
+        return None
+
+
+# ============== RANKING ==============
+
+
+def estimateLapTime(segments):
+    """
+    Flying lap time of a point mass over (length, curvature) segments of a
+    loop: speed capped by the lateral grip in curves, accelerating and braking
+    at MAX_ACCEL. Two passes around the loop make the speed profile periodic.
+    """
+    ds, caps = [], []
+    for length, c in segments:
+        n = max(1, round(length / SEGMENT_LENGTH))
+        cap = MAX_V if c == 0 else min(MAX_V, math.sqrt(LATERAL_ACCEL / abs(c)))
+        ds.extend([length / n] * n)
+        caps.extend([cap] * n)
+
+    n = len(ds)
+    v = caps[:]
+    for _ in range(2):
+        for i in range(n):  # accelerating out of the previous segment
+            v[i] = min(v[i], math.sqrt(v[i - 1] ** 2 + 2 * MAX_ACCEL * ds[i - 1]))
+        for i in range(n - 1, -1, -1):  # braking for the next one
+            j = (i + 1) % n
+            v[i] = min(v[i], math.sqrt(v[j] ** 2 + 2 * MAX_ACCEL * ds[i]))
+    return sum(d / max((v[i] + v[(i + 1) % n]) / 2, 1e-9) for i, d in enumerate(ds))
+
+
+def scoreLayout(table, seq):
+    segments = [table.lanes[p] for p in seq]
+    length = sum(l for l, c in segments)
+
+    # curvature variety: entropy (bits) of the lane length spent at every curvature
+    share = {}
+    for l, c in segments:
+        share[round(c, 6)] = share.get(round(c, 6), 0) + l
+    variety = -sum(w / length * math.log2(w / length) for w in share.values())
+
+    return {"length_m": length, "variety_bits": variety, "lap_time_s": estimateLapTime(segments)}
+
+
+RANKINGS = {
+    # metric, True when larger is better
+    "length": ("length_m", True),
+    "variety": ("variety_bits", True),
+    "lap_time": ("lap_time_s", False),
+}
+
+
+def simulateLapTime(layout, parameters, max_time=30.0, dt=deltat, store=None):
+    """
+    Lap time of the car2 model from a standing start, inf if it derails or runs
+    out of time. With a results.ResultStore, runs it has seen are not simulated again.
+    """
+    if store is not None:
+        from results import cachedRun
+
+        metrics, _ = cachedRun(store, layout, parameters, max_time, dt=dt)
+        return metrics["lap_times"][0] if metrics["lap_times"] else math.inf
+
+    from simulation import Simulation
+
+    sim = Simulation(layout, 1, parameters)
+    car = sim.cars[0]
+    length = sim.circuit.getLength()
+    for tick in range(int(max_time / dt)):
+        if car.derailed:
+            return math.inf
+        if car.s >= length:
+            return tick * dt
+        sim.step(dt)
+    return math.inf
+
+
+# ============== PARALLEL DRIVER ==============
+
+
+def _enumerate_prefix(n_pieces, footprint, prefix, limit):
+    search = LayoutSearch(n_pieces, footprint)
+    found = []
+    for seq in search.enumerateLayouts(prefix):
+        found.append(seq)
+        if limit and len(found) >= limit:
+            break
+    return found, search.nodes, 0
+
+
+def _sample_batch(n_pieces, footprint, seed, n_samples):
+    search = LayoutSearch(n_pieces, footprint)
+    rng = random.Random(seed)
+    found, exhausted = set(), 0
+    for _ in range(n_samples):
+        seq = search.sample(rng)
+        if seq is None:
+            exhausted += 1
+        else:
+            found.add(seq)
+    return found, search.nodes, exhausted
+
+
+def search(n_pieces, footprint=None, samples=None, workers=None, limit=None, seed=0):
+    """
+    Returns (set of layouts as catalog index tuples, search nodes visited,
+    random descents that ran out of budget). Enumerates exhaustively unless
+    `samples` random descents are requested.
+    """
+    found, nodes, exhausted = set(), 0, 0
+    with ProcessPoolExecutor(workers) as pool:
+        if samples:
+            n_tasks = (workers or os.cpu_count() or 1) * 4
+            per_task = -(-samples // n_tasks)
+            futures = [pool.submit(_sample_batch, n_pieces, footprint, seed + i, per_task) for i in range(n_tasks)]
+        else:
+            n = len(CATALOG)
+            prefixes = [(a, b) for a in range(n) for b in range(a, n)] if n_pieces > 2 else [()]
+            futures = [pool.submit(_enumerate_prefix, n_pieces, footprint, prefix, limit) for prefix in prefixes]
+        for f in futures:
+            layouts, visited, gave_up = f.result()
+            found.update(layouts)
+            nodes += visited
+            exhausted += gave_up
+    return found, nodes, exhausted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pieces", type=int, default=10)
+    parser.add_argument("--width", type=float, help="footprint width (m)")
+    parser.add_argument("--height", type=float, help="footprint height (m)")
+    parser.add_argument("--sample", type=int, help="random descents instead of a full enumeration")
+    parser.add_argument("--limit", type=int, help="stop every enumeration task after this many layouts")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--rank", choices=RANKINGS, default="lap_time")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--simulate", type=int, default=0, help="re-rank the best N with the car2 model")
+    parser.add_argument("--voltage", type=float, default=6.0)
+    parser.add_argument("--cache", nargs="?", const="", help="keep simulated runs in a result store (default root if no dir)")
+    parser.add_argument("--out", help="write the ranked layouts to this JSON file")
+    args = parser.parse_args(argv)
+
+    footprint = None
+    if args.width or args.height:
+        footprint = (args.width or math.inf, args.height or math.inf)
+
+    t0 = time.perf_counter()
+    found, nodes, exhausted = search(args.pieces, footprint, args.sample, args.workers, args.limit)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(found)} closed layouts, {nodes:,} nodes in {elapsed:.2f} s ({nodes / elapsed:,.0f} nodes/s)")
+    if args.sample:
+        n_tasks = (args.workers or os.cpu_count() or 1) * 4
+        descents = n_tasks * -(-args.sample // n_tasks)
+        print(f"{exhausted / descents:.0%} of {descents:,} descents ran out of their {SAMPLE_BUDGET} node budget")
+
+    table = defaultTable()
+    key, descending = RANKINGS[args.rank]
+    ranked = sorted(({"seq": seq, **scoreLayout(table, seq)} for seq in found), key=lambda r: r[key], reverse=descending)
+    ranked = ranked[: args.top]
+
+    if args.simulate:
+        parameters = midParameters(voltage=args.voltage)
+        store = None
+        if args.cache is not None:
+            from results import DEFAULT_ROOT, ResultStore
+
+            store = ResultStore(args.cache or DEFAULT_ROOT)
+        for r in ranked[: args.simulate]:
+            r["simulated_lap_time_s"] = simulateLapTime(table.layout(r["seq"]), parameters, store=store)
+        ranked[: args.simulate] = sorted(ranked[: args.simulate], key=lambda r: r["simulated_lap_time_s"])
+        for r in ranked[: args.simulate]:
+            if math.isinf(r["simulated_lap_time_s"]):
+                r["simulated_lap_time_s"] = None  # derailed or too slow, JSON has no infinity
+
+    for r in ranked:
+        r["layout"] = [list(k) for k in layoutKey(table.layout(r.pop("seq")))]
+        names = " ".join(f"{name}{side or ''}" for name, side in r["layout"])
+        sim = ""
+        if "simulated_lap_time_s" in r:
+            lap = r["simulated_lap_time_s"]
+            sim = ", simulated " + ("no lap" if lap is None else f"{lap:.2f} s")
+        print(
+            f"{r['length_m']:.3f} m, variety {r['variety_bits']:.2f} bits, lap {r['lap_time_s']:.2f} s{sim}: {names}"
+        )
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(ranked, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of car physics models.
+
+Every model is a Car class with the constructor of car2.Car and the same
+state interface: tick(dt), updateParameters(parameters), motorForce(),
+draw(canvas, view) and getState()/setState() over STATE_FIELDS. The
+simulator, the physics worker and the batch tools take a model name, so
+the model is chosen at runtime (AUTOSLOT_MODEL, or --model in the tools)
+instead of by an import.
+
+    python models.py --voltage 4 6 8 --laps 2     # car against car2
+
+The comparison runs every model from the same start over the same laps
+for each parameter set and reports the divergence from the first model
+and the cost of a step.
+"""
+
+import argparse
+import importlib
+import math
+import os
+import time
+
+from config import *
+from track import *
+
+STATE_FIELDS = ("s", "x", "y", "b_heading", "v", "slip_angle", "derailed")
+
+# name: (module, class), imported on first use
+MODELS = {
+    "car": ("car", "Car"),  # guide pin and rear axle, derails above 11 V
+    "car2": ("car2", "Car"),  # slip angle against static/dynamic friction and the magnet
+}
+DEFAULT_MODEL = os.environ.get("AUTOSLOT_MODEL", "car2")
+
+
+def registerModel(name, cls):
+    """Adds a Car class (or replaces one) under `name`."""
+    MODELS[name] = cls
+
+
+def getModel(name=None):
+    """Car class of the model `name`, the default model if None."""
+    name = name or DEFAULT_MODEL
+    if name not in MODELS:
+        raise ValueError(f"unknown car model {name!r}, expected one of {sorted(MODELS)}")
+    entry = MODELS[name]
+    if isinstance(entry, tuple):
+        module, cls = entry
+        entry = MODELS[name] = getattr(importlib.import_module(module), cls)
+    return entry
+
+
+# ============== COMPARISON ==============
+
+
+def runModel(name, layout, parameters, ticks, dt=deltat):
+    """Steps one car of the model, returning (states per tick, seconds per step)."""
+    from simulation import Simulation
+
+    sim = Simulation(layout, 1, parameters, model=name)
+    car = sim.cars[0]
+    states = []
+    elapsed = 0.0
+    for _ in range(ticks):
+        t0 = time.perf_counter()
+        car.tick(dt)
+        elapsed += time.perf_counter() - t0
+        states.append(car.getState())
+    return states, elapsed / ticks
+
+
+def divergence(reference, states):
+    """Max and RMS difference of s and of the x, y position between two state sequences."""
+    S, X, Y = STATE_FIELDS.index("s"), STATE_FIELDS.index("x"), STATE_FIELDS.index("y")
+    ds = [b[S] - a[S] for a, b in zip(reference, states)]
+    dxy = [math.hypot(b[X] - a[X], b[Y] - a[Y]) for a, b in zip(reference, states)]
+    return {
+        "s_max_m": max(abs(d) for d in ds),
+        "s_rms_m": math.sqrt(sum(d * d for d in ds) / len(ds)),
+        "xy_max_m": max(dxy),
+        "xy_rms_m": math.sqrt(sum(d * d for d in dxy) / len(dxy)),
+    }
+
+
+def compare(names, layout, parameter_sets, duration, dt=deltat):
+    """One row per (parameter set, model): cost per step and divergence from the first model."""
+    ticks = int(duration / dt)
+    rows = []
+    for parameters in parameter_sets:
+        reference = None
+        for name in names:
+            states, step_s = runModel(name, layout, parameters, ticks, dt)
+            row = {"model": name, "voltage": parameters["voltage"], "us_per_step": step_s * 1e6}
+            row["final_s_m"] = states[-1][STATE_FIELDS.index("s")]
+            row["derailed"] = bool(states[-1][STATE_FIELDS.index("derailed")])
+            if reference is None:
+                reference = states
+            else:
+                row.update(divergence(reference, states))
+            rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["car2", "car"], help="the first one is the reference")
+    parser.add_argument("--voltage", nargs="+", type=float, default=[4.0, 6.0, 8.0])
+    parser.add_argument("--laps", type=float, default=1.0, help="duration in laps of the reference at 6 V")
+    parser.add_argument("--duration", type=float, help="seconds, instead of --laps")
+    args = parser.parse_args(argv)
+
+    layout = DEFAULT_LAYOUT
+    duration = args.duration
+    if duration is None:
+        # time the reference model needs for the laps, so every model covers the same stretch of track
+        length = Circuit(layout).getLength()
+        states, _ = runModel(args.models[0], layout, midParameters(voltage=6.0), int(60 / deltat))
+        S = STATE_FIELDS.index("s")
+        ticks = next((i for i, state in enumerate(states) if state[S] >= args.laps * length), len(states))
+        duration = (ticks + 1) * deltat
+
+    rows = compare(args.models, layout, [midParameters(voltage=v) for v in args.voltage], duration)
+    print(f"{duration:.2f} s per run")
+    for row in rows:
+        diff = ""
+        if "s_max_m" in row:
+            diff = f", s diverges by {row['s_max_m']:.3f} m max ({row['s_rms_m']:.3f} rms), xy by {row['xy_max_m']:.3f} m max"
+        status = " derailed" if row["derailed"] else ""
+        print(
+            f"{row['voltage']:5.1f} V {row['model']:>6}: {row['us_per_step']:7.2f} us/step, "
+            f"s {row['final_s_m']:7.3f} m{status}{diff}"
+        )
+
+
+if __name__ == "__main__":
+    main()
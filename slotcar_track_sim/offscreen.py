@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Offscreen, display-free renderer for replays and image export.
+
+The track is drawn with PIL following the geometry of StraighTrack.draw
+and CurvedTrack.draw, cars are composited from recorded telemetry (one
+list of Car.getState() tuples per frame). The static track raster is
+rendered once per worker process and frames are spread over a process
+pool, so this runs on compute nodes without a display.
+
+    python offscreen.py --voltage 6 --duration 5 --out replay.gif
+    python offscreen.py --telemetry run.json --out frames/
+
+Telemetry JSON: {"layout": [[piece class name, side], ...],
+                 "frame_dt": seconds, "frames": [[state, ...], ...]}
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from config import *
+from track import *
+from models import DEFAULT_MODEL, MODELS, STATE_FIELDS
+from viewport import CAR_LENGTH, Viewport, unionBounds
+
+BACKGROUND = "white"
+FRAMES_PER_TASK = 16
+
+X, Y, HEADING = STATE_FIELDS.index("x"), STATE_FIELDS.index("y"), STATE_FIELDS.index("b_heading")
+DERAILED = STATE_FIELDS.index("derailed")
+
+
+class Surface:
+    """Image size with the winfo_* interface the viewport maps against."""
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+
+# ============== TRACK ==============
+
+
+def draw_straight(draw, t, surface, view):
+    x0, y0 = view.m_to_px(surface, t.x, t.y)
+    ppm = view.pixels_per_meter
+    cos_a, sin_a = math.cos(t.angle), math.sin(t.angle)
+
+    def to_px(dx, dy):
+        return x0 + (dx * cos_a - dy * sin_a) * ppm, y0 - (dx * sin_a + dy * cos_a) * ppm
+
+    corners = [to_px(0, 0), to_px(t.TRACK_LENGTH, 0), to_px(t.TRACK_LENGTH, TRACK_WIDTH), to_px(0, TRACK_WIDTH)]
+    draw.polygon(corners, fill="#333333", outline="black", width=2)
+
+    if not view.showDetail(RAIL_SPACING):
+        return
+
+    w_rails = max(1, round(view.sm_to_px(RAIL_WIDTH)))
+    w_slot = max(1, round(view.sm_to_px(SLOT_WIDTH)))
+    lane1_center_y = (TRACK_WIDTH - LANE_SPACING) / 2
+    for lane_y in (lane1_center_y, lane1_center_y + LANE_SPACING):
+        for rail_y in (lane_y - RAIL_SPACING / 2, lane_y + RAIL_SPACING / 2):
+            draw.line([to_px(0, rail_y), to_px(t.TRACK_LENGTH, rail_y)], fill="silver", width=w_rails)
+        draw.line([to_px(0, lane_y), to_px(t.TRACK_LENGTH, lane_y)], fill="black", width=w_slot)
+
+
+def draw_curve(draw, t, surface, view):
+    cx, cy = view.m_to_px(surface, *t.getCenterOfRotation())
+    ppm = view.pixels_per_meter
+
+    # Tk arcs run counterclockwise from 3 o'clock, PIL arcs clockwise
+    start, extent = (math.degrees(a) for a in t.getArcAngles())
+    pil_start, pil_end = -(start + extent), -start
+
+    def bbox(radius):
+        r = radius * ppm
+        return [cx - r, cy - r, cx + r, cy + r]
+
+    inner_edge_radius = t.OUTER_RADIUS - TRACK_WIDTH
+    draw.pieslice(bbox(t.OUTER_RADIUS), pil_start, pil_end, fill="#333333")
+    draw.pieslice(bbox(inner_edge_radius), pil_start, pil_end + 1, fill=BACKGROUND)
+
+    if not view.showDetail(RAIL_SPACING):
+        return
+
+    w_rails = max(1, round(view.sm_to_px(RAIL_WIDTH)))
+    w_slot = max(1, round(view.sm_to_px(SLOT_WIDTH)))
+    for lane_idx in (0, 1):
+        radius = t.getLaneRadius(lane_idx)
+        for rail_radius in (radius - RAIL_SPACING / 2, radius + RAIL_SPACING / 2):
+            draw.arc(bbox(rail_radius), pil_start, pil_end, fill="silver", width=w_rails)
+        draw.arc(bbox(radius), pil_start, pil_end, fill="black", width=w_slot)
+
+
+def render_track(circuit, surface, view):
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (surface.width, surface.height), BACKGROUND)
+    draw = ImageDraw.Draw(img)
+    for t in circuit.pieces:
+        if not view.isVisible(surface, t.getBounds()):
+            continue
+        if isinstance(t, CurvedTrack):
+            draw_curve(draw, t, surface, view)
+        else:
+            draw_straight(draw, t, surface, view)
+    return img
+
+
+# ============== CARS ==============
+
+
+class CarPainter:
+    """Composites cars onto frames, caching rotated sprites per degree."""
+
+    def __init__(self, view):
+        self.view = view
+        self.sprites = {}
+
+    def sprite(self, heading):
+        from PIL import Image
+        from assets import load_image
+
+        deg = round(math.degrees(heading)) % 360
+        img = self.sprites.get(deg)
+        if img is None:
+            fi = load_image().convert("RGBA")
+            ow, oh = fi.size
+            size = (max(1, int(ow * SCALE * self.view.zoom)), max(1, int(oh * SCALE * self.view.zoom)))
+            img = fi.resize(size, Image.Resampling.LANCZOS).rotate(-90 + deg, resample=Image.BICUBIC, expand=True)
+            self.sprites[deg] = img
+        return img
+
+    def paint(self, frame_img, states, surface):
+        from PIL import ImageDraw
+
+        draw = None
+        for state in states:
+            px, py = self.view.m_to_px(surface, state[X], state[Y])
+            if self.view.showSprites():
+                sprite = self.sprite(state[HEADING])
+                frame_img.paste(sprite, (int(px - sprite.width / 2), int(py - sprite.height / 2)), sprite)
+            else:
+                draw = draw or ImageDraw.Draw(frame_img)
+                half = self.view.sm_to_px(CAR_LENGTH) / 2 + 2
+                c, s = math.cos(state[HEADING]), math.sin(state[HEADING])
+                points = [
+                    (px + half * c, py - half * s),
+                    (px - half * c - 0.6 * half * s, py + half * s - 0.6 * half * c),
+                    (px - half * c + 0.6 * half * s, py + half * s + 0.6 * half * c),
+                ]
+                draw.polygon(points, fill="red" if state[DERAILED] else "gold", outline="black")
+
+
+# ============== PARALLEL RENDERING ==============
+
+_worker = {}
+
+
+def _init_worker(layout, size, view_args):
+    surface = Surface(*size)
+    view = Viewport(*view_args)
+    _worker["surface"] = surface
+    _worker["background"] = render_track(Circuit(layout), surface, view)
+    _worker["painter"] = CarPainter(view)
+
+
+def _render_chunk(first_index, frames, out_dir):
+    """Renders frames[i] as frame number first_index + i; returns PNG bytes or written paths."""
+    results = []
+    for i, states in enumerate(frames):
+        img = _worker["background"].copy()
+        _worker["painter"].paint(img, states, _worker["surface"])
+        if out_dir is None:
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+            results.append(buf.getvalue())
+        else:
+            path = os.path.join(out_dir, f"frame_{first_index + i:05d}.png")
+            img.save(path)
+            results.append(path)
+    return results
+
+
+def render(layout, frames, out, size=(1280, 720), view=None, frame_dt=1 / 30, workers=None):
+    """
+    Renders telemetry frames to `out`: a directory (PNG sequence) or a .gif/.webp/.png
+    file (animation). Without a viewport the circuit is fitted to the image.
+    """
+    if view is None:
+        view = Viewport()
+        view.fit(Surface(*size), unionBounds([t.getBounds() for t in Circuit(layout).pieces]))
+    view_args = (view.zoom, view.pan_x, view.pan_y)
+
+    animated = os.path.splitext(out)[1].lower() in (".gif", ".webp", ".png")
+    out_dir = None if animated else out
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+
+    chunks = [(i, frames[i : i + FRAMES_PER_TASK]) for i in range(0, len(frames), FRAMES_PER_TASK)]
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(layout, size, view_args)) as pool:
+        futures = [pool.submit(_render_chunk, i, chunk, out_dir) for i, chunk in chunks]
+        results = [r for f in futures for r in f.result()]
+
+    if animated:
+        from PIL import Image
+
+        images = [Image.open(io.BytesIO(png)) for png in results]
+        images[0].save(out, save_all=True, append_images=images[1:], duration=int(frame_dt * 1000), loop=0)
+    return out
+
+
+# ============== TELEMETRY ==============
+
+
+def record(simulation, duration, fps=30, dt=deltat):
+    """Runs a headless Simulation, keeping the car states every 1/fps seconds."""
+    every = max(1, round(1 / (fps * dt)))
+    frames = []
+    for i in range(int(duration / dt)):
+        if i % every == 0:
+            frames.append(simulation.getState())
+        simulation.step(dt)
+    return frames, every * dt
+
+
+def save_telemetry(path, layout, frames, frame_dt):
+    with open(path, "w") as f:
+        json.dump({"layout": [list(k) for k in layoutKey(layout)], "frame_dt": frame_dt, "frames": frames}, f)
+
+
+def load_telemetry(path):
+    with open(path) as f:
+        data = json.load(f)
+    return layoutFromKey(data["layout"]), data["frames"], data["frame_dt"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--telemetry", help="recorded telemetry JSON; otherwise a headless run is recorded")
+    parser.add_argument("--voltage", type=float, default=6.0)
+    parser.add_argument("--cars", type=int, default=1)
+    parser.add_argument("--model", default=DEFAULT_MODEL, choices=sorted(MODELS))
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--save-telemetry", help="also write the recorded telemetry to this JSON file")
+    parser.add_argument("--out", required=True, help="output directory or .gif/.webp/.png file")
+    args = parser.parse_args(argv)
+
+    if args.telemetry:
+        layout, frames, frame_dt = load_telemetry(args.telemetry)
+    else:
+        from simulation import Simulation
+
+        layout = DEFAULT_LAYOUT
+        sim = Simulation(layout, args.cars, midParameters(voltage=args.voltage), model=args.model)
+        frames, frame_dt = record(sim, args.duration, args.fps)
+        if args.save_telemetry:
+            save_telemetry(args.save_telemetry, layout, frames, frame_dt)
+
+    size = tuple(int(v) for v in args.size.split("x"))
+    out = render(layout, frames, args.out, size, frame_dt=frame_dt, workers=args.workers)
+    print(f"rendered {len(frames)} frames to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Coalesced, immutable parameter snapshots.
+
+The UI writes slider values into a private pending dict as often as Tk
+fires events. Once per frame publish() freezes the pending values into a
+new read-only mapping and swaps the ``snapshot`` reference. Readers (the
+physics loop, possibly on another thread) only ever see complete
+snapshots, and can tell a new one apart with an identity check:
+
+    params = store.snapshot
+    if params is not applied:
+        car.updateParameters(params)
+        applied = params
+"""
+
+from types import MappingProxyType
+
+
+class ParameterStore:
+    def __init__(self, initial):
+        self._pending = dict(initial)
+        self._dirty = False
+        self.snapshot = MappingProxyType(dict(initial))
+        self.version = 0
+
+    def set(self, name, value):
+        self._pending[name] = value
+        self._dirty = True
+
+    def update(self, values):
+        self._pending.update(values)
+        self._dirty = True
+
+    def get(self, name):
+        """Latest value, published or not (for UI feedback)."""
+        return self._pending[name]
+
+    def publish(self):
+        """Freezes pending changes into a new snapshot; a no-op when nothing changed."""
+        if self._dirty:
+            self._dirty = False
+            self.version += 1
+            # a single reference assignment, atomic for readers on other threads
+            self.snapshot = MappingProxyType(dict(self._pending))
+        return self.snapshot
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Physics on a dedicated worker, decoupled from the Tk main loop.
+
+The worker (a thread, or a separate process to escape the GIL) owns the
+Simulation and steps it in real time at its own rate. After every tick it
+writes the car states into a shared-memory double buffer; the UI only
+reads the latest complete frame, so rendering and physics rates are
+independent and a stalled UI never stalls the simulation.
+
+Shared memory layout (float64):
+
+    [front, seq_0, seq_1, tick_0, tick_1, slot_0 ..., slot_1 ...]
+
+Each slot holds n_cars * len(STATE_FIELDS) values. The writer fills
+the back slot under a per-slot sequence counter (odd while writing) and
+then flips ``front``; readers retry if the counter changed under them.
+
+The command queue carries parameter snapshots (dicts, only the latest one
+is applied) and track edits ("splice", first, last, layoutKey(pieces)),
+applied in order to the worker's circuit without restarting the run.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from array import array
+from multiprocessing import shared_memory
+
+from config import *
+from track import *
+from models import STATE_FIELDS
+from profiler import PROFILER
+
+N_FIELDS = len(STATE_FIELDS)
+HEADER = 5
+MAX_LAG = 0.25  # seconds behind real time before the worker stops catching up
+
+
+class StateBuffer:
+    def __init__(self, n_cars, name=None):
+        self.n_cars = n_cars
+        self.slot_size = n_cars * N_FIELDS
+        size = (HEADER + 2 * self.slot_size) * 8
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = _attach(name)
+        self.name = self.shm.name
+        self.values = self.shm.buf.cast("d")
+        if self.owner:
+            self.values[:HEADER] = array("d", [0.0] * HEADER)
+
+    def write(self, tick, states):
+        back = 1 - int(self.values[0])
+        offset = HEADER + back * self.slot_size
+
+        self.values[1 + back] += 1  # odd: slot being written
+        self.values[offset : offset + self.slot_size] = array("d", [v for state in states for v in state])
+        self.values[3 + back] = tick
+        self.values[1 + back] += 1
+        self.values[0] = back
+
+    def read(self):
+        """Returns (tick, [per-car state tuples]) of the latest complete frame."""
+        while True:
+            front = int(self.values[0])
+            seq = self.values[1 + front]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            offset = HEADER + front * self.slot_size
+            flat = self.values[offset : offset + self.slot_size].tolist()
+            tick = int(self.values[3 + front])
+            if self.values[1 + front] == seq:
+                break
+
+        states = [tuple(flat[i : i + N_FIELDS]) for i in range(0, self.slot_size, N_FIELDS)]
+        return tick, states
+
+    def close(self):
+        self.values.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: spawned workers share the parent's resource tracker,
+        # registering the block a second time is harmless
+        return shared_memory.SharedMemory(name=name)
+
+
+def run_physics(buffer, layout, n_cars, parameters, commands, stop, dt=deltat, model=None):
+    """
+    Worker loop: applies the latest parameter snapshot between ticks and
+    publishes every tick. `buffer` is a StateBuffer (thread mode) or the name
+    of the shared memory block to attach to (process mode).
+    """
+    from simulation import Simulation
+
+    sim = Simulation(layout, n_cars, parameters, model=model)
+    attached = not isinstance(buffer, StateBuffer)
+    if attached:
+        buffer = StateBuffer(n_cars, name=buffer)
+    buffer.write(sim.tick_count, sim.getState())
+
+    next_tick = time.perf_counter()
+    try:
+        while not stop.is_set():
+            # only the latest parameter snapshot matters, edits all apply in order
+            latest = None
+            while True:
+                try:
+                    command = commands.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(command, dict):
+                    latest = command
+                else:
+                    _, first, last, key = command
+                    sim.splice(first, last, layoutFromKey(key))
+            if latest is not None:
+                sim.applyParameters(latest)
+
+            with PROFILER.phase("physics"):
+                sim.step(dt)
+            buffer.write(sim.tick_count, sim.getState())
+
+            next_tick += dt
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -MAX_LAG:
+                next_tick = time.perf_counter()
+    except Exception:
+        # the last frame stays readable, PhysicsWorker.alive() reports the stop
+        traceback.print_exc()
+    finally:
+        if attached:
+            buffer.close()
+
+
+class PhysicsWorker:
+    def __init__(self, layout, n_cars, parameters, mode="thread", dt=deltat, model=None):
+        self.n_cars = n_cars
+        self.mode = mode
+        self.buffer = StateBuffer(n_cars)
+        self.sent_parameters = parameters
+        self.started = False
+
+        if mode == "process":
+            ctx = multiprocessing.get_context("spawn")
+            self.commands = ctx.Queue()
+            self.stop_event = ctx.Event()
+            self.worker = ctx.Process(
+                target=run_physics,
+                args=(self.buffer.name, layout, n_cars, dict(parameters), self.commands, self.stop_event, dt, model),
+                daemon=True,
+            )
+        elif mode == "thread":
+            self.commands = queue.Queue()
+            self.stop_event = threading.Event()
+            self.worker = threading.Thread(
+                target=run_physics,
+                args=(self.buffer, layout, n_cars, dict(parameters), self.commands, self.stop_event, dt, model),
+                daemon=True,
+            )
+        else:
+            raise ValueError(f"unknown physics mode {mode!r}")
+
+    def start(self):
+        self.worker.start()
+        self.started = True
+
+    def sendParameters(self, parameters):
+        # snapshots are immutable, so an identity check is enough to skip repeats
+        if parameters is not self.sent_parameters:
+            self.commands.put(dict(parameters))
+            self.sent_parameters = parameters
+
+    def sendSplice(self, first, last, layout):
+        # the worker repeats the editor's Circuit.splice on its own circuit
+        self.commands.put(("splice", first, last, layoutKey(layout)))
+
+    def read(self):
+        return self.buffer.read()
+
+    def alive(self):
+        """False once the worker ended without being stopped, e.g. on an exception in a tick."""
+        return not self.started or self.stop_event.is_set() or self.worker.is_alive()
+
+    def stop(self):
+        self.stop_event.set()
+        self.worker.join(timeout=2)
+        self.buffer.close()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation of the simulator hot paths.
+
+Phases (physics, lookup, sprite, canvas_update, ...) are timed into
+log2-bucketed histograms and events are accumulated into counters.
+When the profiler is disabled ``phase()`` hands back a shared no-op
+context manager, so instrumented code costs one attribute check per call.
+
+Enable it with ``AUTOSLOT_PROFILE=1`` or toggle it at runtime (F3 in the
+simulator window). ``export()`` writes everything to JSON for offline
+analysis.
+"""
+
+import json
+import math
+import os
+import time
+
+N_BUCKETS = 32  # bucket i holds durations in [2^(i-1), 2^i) microseconds
+
+
+class Histogram:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * N_BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+        us = seconds * 1e6
+        idx = int(us).bit_length() if us >= 1 else 0
+        self.buckets[min(idx, N_BUCKETS - 1)] += 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Upper bound (seconds) of the bucket holding the q-th percentile."""
+        if self.count == 0:
+            return 0.0
+        target = q / 100 * self.count
+        acc = 0
+        for i, n in enumerate(self.buckets):
+            acc += n
+            if acc >= target:
+                return min((1 << i) * 1e-6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.mean(),
+            "min_s": self.min if self.count else 0.0,
+            "max_s": self.max,
+            "p50_s": self.percentile(50),
+            "p99_s": self.percentile(99),
+            "buckets_us_log2": list(self.buckets),
+        }
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _PhaseTimer:
+    __slots__ = ("hist", "t0")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.add(time.perf_counter() - self.t0)
+        return False
+
+
+class Profiler:
+    RATE_WINDOW = 0.5  # seconds between overlay rate updates
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+
+        self._rate_t0 = time.perf_counter()
+        self._rate_counts = {}
+        self.rates = {}
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram()
+        return _PhaseTimer(hist)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.reset()
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+        self._rate_counts.clear()
+        self.rates.clear()
+        self._rate_t0 = time.perf_counter()
+
+    def update_rates(self):
+        """Refresh per-second rates of every counter once per RATE_WINDOW."""
+        now = time.perf_counter()
+        elapsed = now - self._rate_t0
+        if elapsed < self.RATE_WINDOW:
+            return self.rates
+
+        for name, value in self.counters.items():
+            self.rates[name] = (value - self._rate_counts.get(name, 0)) / elapsed
+        self._rate_counts = dict(self.counters)
+        self._rate_t0 = now
+        return self.rates
+
+    def snapshot(self):
+        return {
+            "timestamp": time.time(),
+            "phases": {name: h.to_dict() for name, h in self.histograms.items()},
+            "counters": dict(self.counters),
+            "rates": dict(self.rates),
+        }
+
+    def export(self, path=None):
+        if path is None:
+            path = time.strftime("profile_%Y%m%d_%H%M%S.json")
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        return path
+
+    def draw_overlay(self, canvas):
+        canvas.delete("profiler_overlay")
+        if not self.enabled:
+            return
+
+        rates = self.update_rates()
+        lines = [
+            f"FPS: {rates.get('frames', 0):.1f}",
+            f"Physics steps/s: {rates.get('physics_steps', 0):.0f}",
+            f"Canvas items: {len(canvas.find_all())}",
+        ]
+        for name in ("physics", "lookup", "sprite", "canvas_update"):
+            hist = self.histograms.get(name)
+            if hist is not None and hist.count:
+                lines.append(f"{name}: {hist.mean() * 1e3:.3f} ms (p99 {hist.percentile(99) * 1e3:.2f})")
+
+        x = canvas.winfo_width() - 10
+        canvas.create_rectangle(
+            x - 290, 5, x, 15 + 20 * len(lines), fill="black", outline="yellow", tags="profiler_overlay"
+        )
+        for i, text in enumerate(lines):
+            canvas.create_text(
+                x - 280, 20 + 20 * i, anchor="w", text=text, fill="yellow", font=("Courier", 10), tags="profiler_overlay"
+            )
+
+
+PROFILER = Profiler(enabled=os.environ.get("AUTOSLOT_PROFILE", "") not in ("", "0"))
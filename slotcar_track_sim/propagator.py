@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Event-driven propagation of a car2 car for long runs.
+
+While the car grips with no slip angle, car2's tick is the linear
+recurrence
+
+    v[n+1] = v[n] + dt * K * (V - E * v[n]) / m
+
+(F_motor = K * (V - E v), the acceleration and speed clamps inactive), so
+v and s after n ticks have closed forms. The propagator jumps over whole
+runs of such ticks in one step, up to the first of:
+
+- the end of the lane piece (curvature changes, laps are counted here),
+- slip onset on an arc (the first tick whose centrifugal force exceeds
+  the static grip),
+- the end of the run.
+
+The event loop, propagateTicks(), is compiled with the kernel and ticks
+everything else (slip dynamics, a derailed car) with kernel._tick, so a
+whole run is one call. Searching for the end of a jump costs about
+JUMP_MIN_TICKS kernel ticks: shorter jumps are not taken, and a piece too
+short for one is ticked through without checking again. With car2 at
+deltat (a few ticks per piece) there is nothing to jump, and the
+propagator runs at 0.8 to 0.9 times the speed of kernel.runTicks (bench.py
+propagator): it still checks every piece once and counts laps. The gain
+comes with finer time steps, where a grip run is hundreds of ticks (about
+175x faster at dt = 1e-4). Jumps stay on the tick grid and follow the discrete
+recurrence, not the continuous ODE, so they agree with ticking up to
+rounding.
+
+    python propagator.py --hours 1 --voltage 4 --static-f 3 --dt 0.0001
+    python propagator.py --duration 120 --check      # also tick it and compare
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from config import *
+from track import *
+from models import STATE_FIELDS
+import kernel
+
+S, X, Y, HEADING, V, SLIP, DERAILED = range(len(STATE_FIELDS))
+JUMP_MIN_TICKS = 32  # a closed-form jump costs about as much as this many kernel ticks
+REACH_PIECE_END, REACH_SLIP = 0, 1
+
+
+# ============== CLOSED FORMS ==============
+# g = (dt, v_star, q, log_r, mass_kg, F_max_static) of the grip regime, with
+# q = dt K E / m: v[n] - v_star shrinks by 1 - q every tick
+
+
+@kernel.jit
+def _vAt(g, v, n):
+    dt, v_star, q, log_r = g[0], g[1], g[2], g[3]
+    return v_star + (v - v_star) * math.exp(n * log_r)
+
+
+@kernel.jit
+def _sAt(g, s, v, n):
+    dt, v_star, q, log_r = g[0], g[1], g[2], g[3]
+    return s + dt * (n * v_star + (v - v_star) * (1 - q) * -math.expm1(n * log_r) / q)
+
+
+@kernel.jit
+def _slips(g, v, curvature):
+    # car2.Car.tick: the centrifugal force against the static grip
+    return v != 0 and g[4] * (v**2) / abs(1 / curvature) > g[5]
+
+
+@kernel.jit
+def _reached(kind, g, s, v, target, n):
+    if kind == REACH_PIECE_END:
+        return _sAt(g, s, v, n) >= target
+    return _slips(g, _vAt(g, v, n), target)  # target: the curvature
+
+
+@kernel.jit
+def _firstTrue(kind, g, s, v, target, lo, hi):
+    """Smallest n in [lo, hi] that has _reached (monotone in n), hi if none."""
+    if _reached(kind, g, s, v, target, lo) or hi <= lo:
+        return lo
+    step = 1
+    while lo + step < hi and not _reached(kind, g, s, v, target, lo + step):
+        lo, step = lo + step, step * 2
+    hi = min(lo + step, hi)
+    if not _reached(kind, g, s, v, target, hi):
+        return hi
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if _reached(kind, g, s, v, target, mid):
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+@kernel.jit
+def _gripTicks(g, s, v, distance, curvature, n_max):
+    """
+    Ticks the car can skip from (s, v), `distance` before the piece end, with
+    grip and no slip angle. 0 when fewer than JUMP_MIN_TICKS reach the piece
+    end: ticking those is cheaper than the search.
+    """
+    dt, v_star = g[0], g[1]
+    # v moves monotonically towards v_star, which brackets the ticks to the piece end
+    fastest, slowest = max(v, v_star), min(_vAt(g, v, 1), v_star)
+    lo = max(1, min(n_max, int(distance / (dt * fastest)))) if fastest > 0 else n_max
+    if lo < JUMP_MIN_TICKS and lo < n_max:
+        return 0
+    hi = min(n_max, math.ceil(distance / (dt * slowest)) + 1) if slowest > 0 else n_max
+    n = _firstTrue(REACH_PIECE_END, g, s, v, s + distance, min(lo, hi), hi)
+
+    if abs(curvature) >= 0.0001 and v < v_star:
+        # speeding up: the grip has to hold at the start of every skipped tick
+        n = _firstTrue(REACH_SLIP, g, s, v, curvature, 1, n)
+    return n
+
+
+# ============== EVENT LOOP ==============
+
+
+@kernel.jit
+def propagateTicks(lane, length, p, state, n_ticks, dt, lap_base, lap_ticks, counts):
+    """
+    Advances `state` (STATE_FIELDS, updated in place) by n_ticks, jumping
+    over long grip runs and ticking the rest with kernel._tick. Writes the
+    tick of every lap completion (s reaching (lap_base + k) * length on the
+    track) to lap_ticks and returns their number. Adds the jumps, the ticks
+    they skipped and the ticks stepped to counts.
+    """
+    s, x, y, b_heading, v, slip_angle, derailed = state[0], state[1], state[2], state[3], state[4], state[5], state[6]
+    c = kernel._constants(p)
+    mass_kg, motor_gain, emf_k, r, voltage, F_max_static = c[0], c[1], c[2], c[3], c[4], c[5]
+
+    # with grip and no slip angle, car2's tick is v[n+1] = v[n] + dt K (V - E v[n]) / m
+    K, E = motor_gain, emf_k / r
+    q = dt * K * E / mass_kg
+    grip_regime = 0 < q < 1 and E > 0 and 0 <= voltage / E <= c[kernel.C_MAX_V]
+    g = (dt, voltage / E if grip_regime else 0.0, q, math.log1p(-q) if grip_regime else 0.0, mass_kg, F_max_static)
+
+    piece = 0
+    short_piece = -1  # the piece being ticked through, too short for a jump
+    pose_pending, pose_s, pose_slip = False, s, slip_angle
+    laps, tick = 0, 0
+    while tick < n_ticks:
+        if derailed and v == 0:
+            break  # a derailed car that stopped stays put
+
+        # `piece` is where the last tick started: checked again one tick into the next piece
+        if (
+            grip_regime
+            and not derailed
+            and slip_angle == 0
+            and piece != short_piece
+            and abs(K * (voltage - E * v) / mass_kg) <= c[kernel.C_MAX_ACCEL]
+        ):
+            piece, at = kernel._piece(lane, length, s, piece)
+            curvature = lane[2, piece]
+            if not (abs(curvature) >= 0.0001 and _slips(g, v, curvature)):
+                n = _gripTicks(g, s, v, lane[1, piece] - at, curvature, n_ticks - tick)
+                if not n:
+                    short_piece = piece
+                else:
+                    s, v = _sAt(g, s, v, n), _vAt(g, v, n)
+                    pose_s, pose_slip, pose_pending = s, slip_angle, True
+                    tick += n
+                    counts[0] += 1
+                    counts[1] += n
+                    if s >= (lap_base + laps + 1) * length:
+                        lap_ticks[laps] = tick
+                        laps += 1
+                    continue
+
+        s, x, y, b_heading, v, slip_angle, derailed, piece, pose_pending, pose_s, pose_slip = kernel._tick(
+            lane, length, c, dt, s, x, y, b_heading, v, slip_angle, derailed, piece, pose_pending, pose_s, pose_slip
+        )
+        tick += 1
+        counts[2] += 1
+        if not derailed and s >= (lap_base + laps + 1) * length:
+            lap_ticks[laps] = tick
+            laps += 1
+
+    if pose_pending:
+        x, y, b_heading, piece = kernel._pose(lane, length, c, pose_s, pose_slip, piece)
+    state[0], state[1], state[2], state[3], state[4], state[5], state[6] = s, x, y, b_heading, v, slip_angle, derailed
+    return laps
+
+
+class SegmentPropagator:
+    def __init__(self, circuit, dt=deltat):
+        self.circuit = circuit
+        self.lane, self.length = kernel.laneArrays(circuit)
+        self.dt = dt
+        self.jumps = self.jumped_ticks = self.stepped_ticks = 0
+
+    def run(self, car, n_ticks, on_lap=None):
+        """
+        Advances a car2 car by n_ticks. Returns the lap completion times (s from
+        the start of the run, on the tick grid); on_lap(lap, time) is called for
+        each once the run is done.
+        """
+        state = np.array(car.getState(), dtype=float)
+        lap_base = math.floor(state[S] / self.length)
+        lap_ticks = np.empty(int(n_ticks * self.dt * kernel.MAX_V / self.length) + 2, dtype=np.int64)
+        counts = np.zeros(3, dtype=np.int64)
+        laps = propagateTicks(
+            self.lane, self.length, kernel.packParameters(car), state, n_ticks, self.dt, lap_base, lap_ticks, counts
+        )
+        car.setState(tuple(float(v) for v in state))
+
+        self.jumps += int(counts[0])
+        self.jumped_ticks += int(counts[1])
+        self.stepped_ticks += int(counts[2])
+        lap_times = [int(tick) * self.dt for tick in lap_ticks[:laps]]
+        if on_lap:
+            for lap, lap_time in enumerate(lap_times, 1):
+                on_lap(lap, lap_time)
+        return lap_times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds, unless --hours")
+    parser.add_argument("--voltage", type=float, default=6.0)
+    parser.add_argument("--static-f", type=float, help="static friction (grip) instead of the slider middle")
+    parser.add_argument("--dt", type=float, default=deltat, help="time step (s)")
+    parser.add_argument("--check", action="store_true", help="also run it tick by tick and compare")
+    args = parser.parse_args(argv)
+
+    from simulation import Simulation
+
+    duration = args.hours * 3600 if args.hours else args.duration
+    overrides = {"voltage": args.voltage}
+    if args.static_f is not None:
+        overrides["static_f"] = args.static_f
+    parameters = midParameters(**overrides)
+    n_ticks = int(duration / args.dt)
+
+    sim = Simulation(DEFAULT_LAYOUT, 1, parameters)
+    propagator = SegmentPropagator(sim.circuit, args.dt)
+    t0 = time.perf_counter()
+    laps = propagator.run(sim.cars[0], n_ticks)
+    elapsed = time.perf_counter() - t0
+    print(
+        f"{duration:.0f} s simulated in {elapsed:.2f} s: {len(laps)} laps, "
+        f"{propagator.jumps} jumps over {propagator.jumped_ticks} ticks, {propagator.stepped_ticks} ticks stepped"
+    )
+
+    if args.check:
+        ref = Simulation(DEFAULT_LAYOUT, 1, parameters)
+        car, length, ref_laps = ref.cars[0], ref.circuit.getLength(), []
+        t0 = time.perf_counter()
+        for tick in range(1, n_ticks + 1):
+            ref.step(args.dt)
+            if not car.derailed and car.s >= (len(ref_laps) + 1) * length:
+                ref_laps.append(tick * args.dt)
+        elapsed = time.perf_counter() - t0
+        worst = max((abs(a - b) for a, b in zip(laps, ref_laps)), default=0.0)
+        print(
+            f"ticked in {elapsed:.2f} s: {len(ref_laps)} laps, final s differs by "
+            f"{abs(sim.cars[0].s - car.s):.3e} m, lap times by {worst:.3f} s at most"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Races of several cars on both lanes, with car-to-car interaction.
+
+Every lane has its own lane functions (a Circuit per lane). Cars interact
+through their states (models.STATE_FIELDS), so any car model can race:
+
+- collisions: a car that runs into the one ahead on its lane is pushed
+  back to bumper distance and both exchange momentum (RESTITUTION). A hard
+  hit (closing speed over DERAIL_IMPACT) derails the car in front.
+- side contact: in a curve, the tail of a slipping car on the inner lane
+  swings into the outer lane. Once it sweeps across the gap between the
+  lanes it hits any car alongside, which takes over part of the slip angle.
+- drafting: car2 has no aerodynamic drag, so the wake of the car ahead is
+  modelled as the share of the follower's drag it saves (DRAFT_SHARE at
+  bumper distance, none at DRAFT_RANGE), credited as extra speed.
+- lane changes: the start of a LaneChangerTrack is a branch point. A car
+  that requested a change moves there to the same place on the other lane
+  function. The crossover path itself is not modelled.
+
+Neighbors come from a per-lane index of the cars sorted by their position
+within the lap. The order barely changes between ticks, so re-sorting it is
+linear in practice, and adjacent-lane queries are binary searches: a tick
+costs O(N log N) for N cars instead of comparing every pair. Derailed cars
+are off the slot and do not interact; they are put back after RESLOT_TIME.
+
+    python race.py --cars 8 --duration 60
+    python race.py --cars 8 --changers 0 5 --change-rate 0.5
+"""
+
+import argparse
+import bisect
+import math
+import random
+import time
+
+from config import *
+from track import *
+from car2 import CAR_B, MAX_V
+from models import STATE_FIELDS, getModel
+from viewport import CAR_LENGTH
+
+S, X, Y, HEADING, V, SLIP, DERAILED = range(len(STATE_FIELDS))
+
+CAR_WIDTH = 0.060  # m, 1:32 body
+TAIL = 0.090  # m, guide pin to rear bumper
+GRID_SPACING = 2 * CAR_LENGTH  # m between grid rows
+RESTITUTION = 0.3
+DERAIL_IMPACT = 2.0  # m/s closing speed that derails the car in front
+DRAG_AREA = 0.4 * CAR_WIDTH * 0.04  # m^2, drag coefficient times frontal area
+AIR_DENSITY = 1.2  # kg/m^3
+DRAFT_RANGE = 0.3  # m of gap behind a car with a wake
+DRAFT_SHARE = 0.3  # share of the drag saved at bumper distance
+SIDE_KICK = 0.5  # share of the overlap angle passed on at side contact
+RESLOT_TIME = 2.0  # s until a derailed car is put back
+
+SIDE_CLEARANCE = LANE_SPACING - CAR_WIDTH  # m between cars on adjacent lanes
+CONTACT_SLIP = math.asin(SIDE_CLEARANCE / TAIL)  # slip angle at which the tail reaches the next lane
+
+
+class LaneIndex:
+    """The racers on one lane, sorted by their position within the lap."""
+
+    def __init__(self, length):
+        self.length = length
+        self.racers = []
+        self.keys = []
+
+    def key(self, racer):
+        return racer.state[S] % self.length
+
+    def add(self, racer):
+        k = self.key(racer)
+        i = bisect.bisect(self.keys, k)
+        self.keys.insert(i, k)
+        self.racers.insert(i, racer)
+
+    def remove(self, racer):
+        i = self.racers.index(racer)
+        del self.keys[i], self.racers[i]
+
+    def update(self):
+        # nearly sorted after a tick: timsort merges the few runs in linear time
+        self.racers.sort(key=self.key)
+        self.keys = [self.key(r) for r in self.racers]
+
+    def pairs(self):
+        """(follower, leader, gap) of cars following each other, around the lap."""
+        n = len(self.racers)
+        if n < 2:
+            return
+        for i in range(n):
+            j = (i + 1) % n
+            yield self.racers[i], self.racers[j], (self.keys[j] - self.keys[i]) % self.length
+
+    def near(self, position, radius):
+        """Racers within `radius` of `position` (within the lap) along the lane."""
+        position %= self.length
+        lo, hi = position - radius, position + radius
+        found = []
+        for a, b in ((lo, hi), (lo + self.length, hi + self.length), (lo - self.length, hi - self.length)):
+            found.extend(self.racers[bisect.bisect_left(self.keys, a) : bisect.bisect_right(self.keys, b)])
+        return found
+
+
+class Racer:
+    def __init__(self, car, lane, parameters):
+        self.car = car
+        self.lane = lane
+        self.mass = parameters["mass"] / 1000  # kg
+        self.state = list(car.getState())
+        self.change = False  # lane change requested, taken at the next changer
+        self.lap_times = []  # times the car crossed the line
+        self.grid_s = car.s  # start position: from behind the line the first crossing ends a partial lap
+        self.derailed_at = None
+
+    def laps(self):
+        """Durations of the complete laps, timed from the line (or the grid, for a car starting on it)."""
+        crossings = ([0.0] if self.grid_s == 0 else []) + self.lap_times
+        return [b - a for a, b in zip(crossings, crossings[1:])]
+
+
+class Race:
+    def __init__(self, layout=DEFAULT_LAYOUT, n_cars=8, parameters=None, model=None):
+        """`parameters` is one dict for every car or a list with one per car."""
+        if parameters is None:
+            parameters = defaultParameters()
+        if isinstance(parameters, dict):
+            parameters = [parameters] * n_cars
+
+        self.circuits = [Circuit(layout, lane_idx=k) for k in (0, 1)]
+        self.lengths = [c.getLength() for c in self.circuits]
+        # piece ranges (start, end) of every lane, the same piece index on both
+        self.starts = [[e[1] for e in c.piecewise_curvature.piece] for c in self.circuits]
+        self.ends = [[e[2] for e in c.piecewise_curvature.piece] for c in self.circuits]
+        self.changers = {i for i, (cls, _) in enumerate(layout) if issubclass(cls, LaneChangerTrack)}
+        self.indexes = [LaneIndex(length) for length in self.lengths]
+        self.tick_count = 0
+        self.collisions = self.side_contacts = self.lane_changes = 0
+        self.touching = set()  # (kind, racer, racer) in contact after the last tick, to count new contacts only
+
+        Car = getModel(model)
+        rows = (n_cars + 1) // 2
+        self.racers = []
+        for i in range(n_cars):
+            lane, circuit = i % 2, self.circuits[i % 2]
+            x, y = circuit.getLaneStart()
+            car = Car(
+                x,
+                y,
+                0,
+                None,
+                f"car {i + 1}",
+                circuit.piecewise_curvature,
+                circuit.piecewise_angle,
+                circuit.piecewise_position,
+                parameters[i],
+            )
+            car.s = (rows - 1 - i // 2) * GRID_SPACING  # the last row starts on the line
+            racer = Racer(car, lane, parameters[i])
+            self.racers.append(racer)
+            self.indexes[lane].add(racer)
+
+    @property
+    def cars(self):
+        return [r.car for r in self.racers]
+
+    # ============== LANE GEOMETRY ==============
+
+    def piece(self, lane, s):
+        """Index of the piece at s, and the lap."""
+        lap, x = divmod(s, self.lengths[lane])
+        return bisect.bisect_right(self.starts[lane], x) - 1, lap
+
+    def mapPosition(self, s, lane, other):
+        """s on `lane` to the same place (piece and fraction of it) on `other`."""
+        i, lap = self.piece(lane, s)
+        start, end = self.starts[lane][i], self.ends[lane][i]
+        fraction = (s - lap * self.lengths[lane] - start) / (end - start)
+        start, end = self.starts[other][i], self.ends[other][i]
+        return lap * self.lengths[other] + start + fraction * (end - start)
+
+    def setLane(self, racer, lane):
+        circuit = self.circuits[lane]
+        racer.car.piecewise_curvature = circuit.piecewise_curvature
+        racer.car.piecewise_angle = circuit.piecewise_angle
+        racer.car.piecewise_position = circuit.piecewise_position
+        self.indexes[racer.lane].remove(racer)
+        racer.lane = lane
+        self.indexes[lane].add(racer)
+
+    def pose(self, lane, s, slip_angle):
+        # car2.Car.tick step 7, for states moved between ticks
+        circuit = self.circuits[lane]
+        heading = circuit.piecewise_angle.get(s) + slip_angle
+        pin_x, pin_y = circuit.piecewise_position.get(s)
+        return pin_x - CAR_B * math.cos(heading), pin_y - CAR_B * math.sin(heading), heading
+
+    # ============== TICK ==============
+
+    def step(self, dt=deltat):
+        for racer in self.racers:
+            car = racer.car
+            before, _ = self.piece(racer.lane, racer.state[S])
+            car.tick(dt)
+            racer.state = list(car.getState())
+            if racer.state[DERAILED]:
+                self.reslot(racer, dt)
+                continue
+
+            # branch point: the start of a lane changer
+            i, lap = self.piece(racer.lane, racer.state[S])
+            if racer.change and i != before and i in self.changers:
+                other = 1 - racer.lane
+                past = racer.state[S] - lap * self.lengths[racer.lane] - self.starts[racer.lane][i]
+                racer.state[S] = lap * self.lengths[other] + self.starts[other][i] + past
+                racer.change = False
+                self.setLane(racer, other)
+                self.lane_changes += 1
+
+        for index in self.indexes:
+            index.update()
+        self.interact(dt)
+
+        self.tick_count += 1
+        for racer in self.racers:
+            racer.car.setState(racer.state)
+            state = racer.state
+            if not state[DERAILED] and state[S] >= (len(racer.lap_times) + 1) * self.lengths[racer.lane]:
+                racer.lap_times.append(self.tick_count * dt)
+
+    def run(self, n_ticks, dt=deltat):
+        for _ in range(n_ticks):
+            self.step(dt)
+
+    def reslot(self, racer, dt):
+        if racer.derailed_at is None:
+            racer.derailed_at = self.tick_count * dt
+        elif self.tick_count * dt - racer.derailed_at >= RESLOT_TIME:
+            racer.derailed_at = None
+            s = racer.state[S]
+            racer.state = [s, *self.pose(racer.lane, s, 0.0), 0.0, 0.0, 0.0]
+
+    def interact(self, dt):
+        touching = set()
+        for index in self.indexes:
+            for follower, leader, gap in index.pairs():
+                f, l = follower.state, leader.state
+                if f[DERAILED] or l[DERAILED]:
+                    continue
+                if gap < CAR_LENGTH:
+                    if self.collide(follower, leader, gap):
+                        touching.add(("rear", follower, leader))
+                elif gap < DRAFT_RANGE:
+                    drag = 0.5 * AIR_DENSITY * DRAG_AREA * f[V] ** 2
+                    saved = DRAFT_SHARE * (1 - gap / DRAFT_RANGE) * drag
+                    f[V] = min(MAX_V, f[V] + saved / follower.mass * dt)
+
+        for racer in self.racers:
+            state = racer.state
+            if state[DERAILED] or abs(state[SLIP]) <= CONTACT_SLIP:
+                continue
+            lane, other = racer.lane, 1 - racer.lane
+            s_other = self.mapPosition(state[S], lane, other)
+            if abs(self.circuits[other].piecewise_curvature.get(s_other)) >= abs(
+                self.circuits[lane].piecewise_curvature.get(state[S])
+            ):
+                continue  # on the outer lane the tail swings away from the other lane
+            for neighbor in self.indexes[other].near(s_other, CAR_LENGTH):
+                if neighbor.state[DERAILED]:
+                    continue
+                overlap = abs(state[SLIP]) - CONTACT_SLIP
+                neighbor.state[SLIP] += math.copysign(SIDE_KICK * overlap, state[SLIP])
+                state[SLIP] = math.copysign(CONTACT_SLIP, state[SLIP])
+                touching.add(("side", racer, neighbor))
+
+        new = touching - self.touching
+        self.collisions += sum(1 for kind, _, _ in new if kind == "rear")
+        self.side_contacts += sum(1 for kind, _, _ in new if kind == "side")
+        self.touching = touching
+
+    def collide(self, follower, leader, gap):
+        """Separates two cars on a lane, returns True if the follower hit the leader."""
+        f, l = follower.state, leader.state
+        f[S] = max(0.0, f[S] - (CAR_LENGTH - gap))  # back to bumper distance, the lanes start at 0
+        closing = f[V] - l[V]
+        if closing <= 0:
+            return False  # overlapping after a lane change, not a hit
+        m1, m2 = follower.mass, leader.mass
+        momentum = m1 * f[V] + m2 * l[V]
+        f[V] = max(0.0, (momentum - m2 * RESTITUTION * closing) / (m1 + m2))
+        l[V] = min(MAX_V, (momentum + m1 * RESTITUTION * closing) / (m1 + m2))
+        if closing > DERAIL_IMPACT:
+            l[DERAILED] = 1.0
+        return True
+
+    def getState(self):
+        return [r.car.getState() for r in self.racers]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--voltage", type=float, nargs=2, default=(3.0, 4.5), help="voltage range over the cars")
+    parser.add_argument("--changers", type=int, nargs="*", default=[], help="straights to turn into lane changers")
+    parser.add_argument("--change-rate", type=float, default=0.5, help="lane change requests per car and second")
+    parser.add_argument("--model", help="car model (see models.py)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    layout = list(DEFAULT_LAYOUT)
+    for i in args.changers:
+        if layout[i][0] is not C8205Track:
+            parser.error(f"piece {i} is not a straight")
+        layout[i] = (LaneChangerTrack, None)
+
+    lo, hi = args.voltage
+    parameters = [midParameters(voltage=lo + (hi - lo) * i / max(1, args.cars - 1)) for i in range(args.cars)]
+    race = Race(layout, args.cars, parameters, model=args.model)
+    rng = random.Random(args.seed)
+
+    n_ticks = int(args.duration / deltat)
+    t0 = time.perf_counter()
+    for _ in range(n_ticks):
+        for racer in race.racers:
+            if rng.random() < args.change_rate * deltat:
+                racer.change = True
+        race.step()
+    elapsed = time.perf_counter() - t0
+
+    for i, racer in enumerate(race.racers):
+        laps = racer.laps()
+        best = min(laps, default=None)
+        print(
+            f"{racer.car.name:7s} {parameters[i]['voltage']:.2f} V  lane {racer.lane}  {len(laps):3d} laps"
+            + (f", best {best:.3f} s" if best else "")
+        )
+    print(
+        f"{race.collisions} collisions, {race.side_contacts} side contacts, {race.lane_changes} lane changes; "
+        f"{args.duration:.0f} s simulated in {elapsed:.2f} s ({args.duration / elapsed:.0f}x real time)"
+    )
+
+
+if __name__ == "__main__":
+    main()
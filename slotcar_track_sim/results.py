@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent, content-addressed store of simulation results.
+
+A run is identified by the hash of everything that determines it: the
+layout, lane, parameter dict, car model and the version of its source
+(and of RUN_SOURCES, the constants, track geometry and stepping code it
+runs through), deltat and the duration. Sweeps and optimizers that meet a
+configuration again read its lap metrics back instead of simulating, and
+editing car2.py, config.py, track.py, simulation.py or kernel.py
+invalidates the runs that depended on them.
+
+Entries live under the store root as <key[:2]>/<key>.json (metrics) and
+<key>_<every>.npz (compressed STATE_FIELDS trajectory, one row every
+`every` ticks), so any number of worker processes can share a store:
+files are written to a temporary name and renamed into place, and a
+reader that loses a race with eviction just sees a miss. Hits refresh
+the file time, and when the store grows over its size budget the least
+recently used files are removed.
+
+    python results.py stats
+    python results.py clear
+
+The root is AUTOSLOT_CACHE, or ~/.cache/autoslot.
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import tempfile
+import time
+
+from config import *
+from track import *
+from models import DEFAULT_MODEL, STATE_FIELDS, getModel
+
+DEFAULT_ROOT = os.environ.get("AUTOSLOT_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "autoslot"))
+DEFAULT_MAX_BYTES = 1 << 30
+EVICT_TO = 0.8  # fraction of the budget left after an eviction
+LOCK_STALE_S = 60  # an eviction lock older than this is from a crashed process
+
+# modules besides the car model whose source can change a result: constants,
+# geometry, stepping (this module's simulateRun included) and steady-state laps
+RUN_SOURCES = ("config", "track", "simulation", "kernel", "results")
+STEADY_SOURCES = ("steady",)
+
+_versions = {}
+
+
+def sourceVersion(obj):
+    """Hash of the source file defining `obj` (a module or class, or a module name, which is not imported)."""
+    path = importlib.util.find_spec(obj).origin if isinstance(obj, str) else inspect.getsourcefile(obj)
+    if path not in _versions:
+        with open(path, "rb") as f:
+            _versions[path] = hashlib.sha256(f.read()).hexdigest()[:16]
+    return _versions[path]
+
+
+def runKey(layout, parameters, duration, lane_idx=0, model=None, dt=deltat, steady=False):
+    """Content hash of a run configuration."""
+    model = model or DEFAULT_MODEL
+    description = {
+        "layout": [list(k) for k in layoutKey(layout)],
+        "lane": lane_idx,
+        "parameters": {name: float(value) for name, value in sorted(parameters.items())},
+        "model": model,
+        "model_version": sourceVersion(getModel(model)),
+        "sources_version": {name: sourceVersion(name) for name in RUN_SOURCES},
+        "dt": dt,
+        "duration": duration,
+    }
+    if steady:
+        description["steady"] = True  # extrapolated runs are keyed apart
+        description["sources_version"].update({name: sourceVersion(name) for name in STEADY_SOURCES})
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+# ============== STORE ==============
+
+
+class ResultStore:
+    def __init__(self, root=DEFAULT_ROOT, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.size = None  # bytes on disk, scanned on the first write
+        self.hits = self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key, suffix):
+        return os.path.join(self.root, key[:2], key + suffix)
+
+    def _read(self, path, load):
+        try:
+            with open(path, "rb") as f:
+                value = load(f)
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # most recently used
+        except FileNotFoundError:
+            pass
+        return value
+
+    def _write(self, path, dump):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                dump(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self._entries())
+        else:
+            self.size += os.path.getsize(path)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def getMetrics(self, key):
+        metrics = self._read(self._path(key, ".json"), json.load)
+        if metrics is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return metrics
+
+    def putMetrics(self, key, metrics):
+        self._write(self._path(key, ".json"), lambda f: f.write(json.dumps(metrics).encode()))
+
+    def getTrajectory(self, key, every):
+        import numpy as np
+
+        def load(f):
+            with np.load(f) as data:
+                return data["states"]
+
+        return self._read(self._path(key, f"_{every}.npz"), load)
+
+    def putTrajectory(self, key, every, states):
+        import numpy as np
+
+        self._write(self._path(key, f"_{every}.npz"), lambda f: np.savez_compressed(f, states=states))
+
+    # ---------- eviction ----------
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith((".json", ".npz")):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def evict(self):
+        """Removes least recently used files until the store is under EVICT_TO of its budget."""
+        lock = os.path.join(self.root, "evict.lock")
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > LOCK_STALE_S:
+                    os.unlink(lock)
+            except FileNotFoundError:
+                pass
+            return  # another process is evicting
+        try:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self.size = total
+        finally:
+            os.close(fd)
+            os.unlink(lock)
+
+    def clear(self):
+        for path, _, _ in list(self._entries()):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self.size = 0
+
+
+# ============== CACHED RUNS ==============
+
+
+def simulateRun(layout, parameters, duration, lane_idx=0, model=None, dt=deltat, every=None, steady=False):
+    """
+    Runs one car from a standing start. Returns its metrics and, if `every`,
+    the STATE_FIELDS trajectory with one row every `every` ticks.
+
+    With `steady` (and no trajectory), the run stops stepping once the laps are
+    periodic (steady.py) and extrapolates the rest; "steady_from" is then the
+    time it stopped stepping.
+    """
+    from simulation import Simulation
+
+    sim = Simulation(layout, 1, parameters, lane_idx, model=model)
+    car = sim.cars[0]
+    length = sim.circuit.getLength()
+    S, V, DERAILED = STATE_FIELDS.index("s"), STATE_FIELDS.index("v"), STATE_FIELDS.index("derailed")
+    SLIP = STATE_FIELDS.index("slip_angle")
+    detector = None
+    if steady and not every:
+        from steady import SteadyState, lapTick
+
+        detector = SteadyState(length, dt)
+
+    lap_times, v_max, rows = [], 0.0, []
+    steady_from = None
+    n_ticks = int(duration / dt)
+    tick = 0
+    state = car.getState()
+    while tick < n_ticks:
+        sim.step(dt)
+        tick += 1
+        state = car.getState()
+        v_max = max(v_max, state[V])
+        if not state[DERAILED] and state[S] >= (len(lap_times) + 1) * length:
+            lap_times.append(tick * dt)
+        if every and tick % every == 0:
+            rows.append(state)
+        if state[DERAILED] and state[V] == 0:
+            break  # a derailed car that stopped stays put
+        if detector and not state[DERAILED] and detector.observe(tick * dt, state[S], state[V], state[SLIP]):
+            # periodic from here: the remaining laps and the final state follow from the last lap
+            steady_from = tick * dt
+            lap_starts, (s, v, slip) = detector.extrapolate(n_ticks * dt)
+            lap_times += [lapTick(t, dt) * dt for t in lap_starts if tick < lapTick(t, dt) <= n_ticks]
+            state = (s,) + tuple(state[1:])
+            tick = n_ticks
+            break
+
+    metrics = {
+        "lap_times": lap_times,
+        "laps": len(lap_times),
+        "best_lap": min((b - a for a, b in zip([0.0] + lap_times, lap_times)), default=None),
+        "derailed": bool(state[DERAILED]),
+        "final_s": state[S],
+        "v_max": v_max,
+        "ticks": tick,
+    }
+    if detector:
+        metrics["steady_from"] = steady_from
+    if not every:
+        return metrics, None
+
+    import numpy as np
+
+    trajectory = np.array(rows, dtype=float).reshape(-1, len(STATE_FIELDS))
+    if len(trajectory) < n_ticks // every:
+        # the car stopped early, its last state holds for the rest of the run
+        trajectory = np.vstack([trajectory, np.tile(state, (n_ticks // every - len(trajectory), 1))])
+    return metrics, trajectory
+
+
+def cachedRun(store, layout, parameters, duration, lane_idx=0, model=None, dt=deltat, every=None, steady=False):
+    """simulateRun through `store`: only configurations it has not seen are simulated."""
+    if store is None:
+        return simulateRun(layout, parameters, duration, lane_idx, model, dt, every, steady)
+
+    key = runKey(layout, parameters, duration, lane_idx, model, dt, steady and not every)
+    metrics = store.getMetrics(key)
+    trajectory = store.getTrajectory(key, every) if every and metrics is not None else None
+    if metrics is not None and (not every or trajectory is not None):
+        return metrics, trajectory
+
+    metrics, trajectory = simulateRun(layout, parameters, duration, lane_idx, model, dt, every, steady)
+    store.putMetrics(key, metrics)
+    if every:
+        store.putTrajectory(key, every, trajectory)
+    return metrics, trajectory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("stats", "clear"))
+    parser.add_argument("--root", default=DEFAULT_ROOT)
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.root)
+    if args.command == "clear":
+        store.clear()
+        print(f"cleared {args.root}")
+    else:
+        entries = list(store._entries())
+        runs = sum(1 for path, _, _ in entries if path.endswith(".json"))
+        total = sum(size for _, size, _ in entries)
+        print(f"{args.root}: {runs} runs, {len(entries) - runs} trajectories, {total / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-rate scheduling of physics, sensors, controllers and rendering.
+
+Every task has its own period. Periods are counted in integer quanta
+(QUANTUM, 1 us by default) so their events line up exactly, and tasks
+due at the same instant run in priority order: physics first, then
+sensors sampling the new state, then controllers acting on the samples,
+then rendering.
+
+A task marked `batch` runs all of its periods up to the next event of
+any other task in one call, with the number of periods as argument.
+Physics at 0.1 ms under the 1 ms IMU therefore runs as one call of 10
+steps, and only the slower loops set the pace of the Python overhead.
+Physics slower than every other task (car2 at deltat, 10 ms) gains
+nothing: each of its periods is a call of its own. Rates that are not
+integer multiples of each other still interleave correctly, just in
+smaller batches.
+
+    python scheduler.py --physics 0.0001 --imu 0.001 --control 0.004 --duration 20
+    python scheduler.py --duration 5 --telemetry loop.json && python offscreen.py --telemetry loop.json --out loop.gif
+
+The demo closes the loop the way the ESP32 controller does: the IMU
+model reports the lateral acceleration (with noise), and the controller
+lowers the track voltage when it exceeds a target. PWM is not resolved:
+the controller output is the mean voltage of the PWM cycle. There is no
+window: the render task records the car states, in the telemetry format
+offscreen.py replays.
+"""
+
+import argparse
+import heapq
+import math
+import random
+
+from config import *
+from track import *
+
+QUANTUM = 1e-6  # s, resolution of the task periods
+
+
+class Task:
+    PHYSICS, SENSOR, CONTROL, RENDER = range(4)  # priorities at the same instant
+
+    def __init__(self, name, period, callback, priority=CONTROL, batch=False):
+        """callback(t, n): t the time of the (last) event, n the periods run in this call (1 unless batch)."""
+        self.name = name
+        self.period = period
+        self.callback = callback
+        self.priority = priority
+        self.batch = batch
+        self.calls = self.periods = 0
+
+
+class MultiRateScheduler:
+    def __init__(self, tasks, quantum=QUANTUM):
+        self.quantum = quantum
+        self.tasks = list(tasks)
+        self.steps = []
+        for task in self.tasks:
+            steps = round(task.period / quantum)
+            if steps < 1 or not math.isclose(steps * quantum, task.period, rel_tol=1e-9):
+                raise ValueError(f"period of {task.name} ({task.period} s) is not a multiple of {quantum} s")
+            self.steps.append(steps)
+        self.now = 0  # quanta
+        self.due = list(self.steps)  # next event of every task, kept across runs
+
+    def run(self, duration):
+        """Runs every event up to `duration` seconds from now."""
+        end = self.now + round(duration / self.quantum)
+        # (next due, priority, index): the events still to come
+        queue = [(due, task.priority, i) for i, (task, due) in enumerate(zip(self.tasks, self.due))]
+        heapq.heapify(queue)
+        while queue and queue[0][0] <= end:
+            due, _, i = heapq.heappop(queue)
+            task, steps = self.tasks[i], self.steps[i]
+            n = 1
+            if task.batch:
+                # every period that runs before the next event of another task (including one at
+                # the same instant, when this task goes first there), or the end
+                others = queue[0] if queue else (end + 1, task.priority, i)
+                n = -(-(others[0] - due) // steps)
+                if due + n * steps == others[0] and (task.priority, i) < others[1:]:
+                    n += 1
+                n = max(1, min(n, (end - due) // steps + 1))
+            last = due + (n - 1) * steps
+            task.callback(last * self.quantum, n)
+            task.calls += 1
+            task.periods += n
+            heapq.heappush(queue, (last + steps, task.priority, i))
+        for due, _, i in queue:
+            self.due[i] = due
+        self.now = end
+
+    def getState(self):
+        return (self.now, tuple(self.due), tuple((task.calls, task.periods) for task in self.tasks))
+
+    def setState(self, state):
+        self.now, due, counts = state
+        self.due = list(due)
+        for task, (calls, periods) in zip(self.tasks, counts):
+            task.calls, task.periods = calls, periods
+
+
+# ============== SENSOR AND CONTROLLER MODELS ==============
+
+
+class ImuModel:
+    """
+    GY521 on the car: yaw rate and lateral/longitudinal acceleration of car2's state, with noise.
+
+    The longitudinal acceleration is the one of the last physics step
+    (physicsStep()), not a difference between samples: with physics slower
+    than the IMU the speed only changes every few samples.
+    """
+
+    def __init__(self, car, circuit, gyro_noise=0.02, accel_noise=0.3, seed=0):
+        self.car = car
+        self.circuit = circuit
+        self.gyro_noise = gyro_noise  # rad/s
+        self.accel_noise = accel_noise  # m/s^2
+        self.rng = random.Random(seed)
+        self.step_ax = 0.0  # acceleration over the last physics step
+        self.gz = self.ax = self.ay = 0.0
+
+    def physicsStep(self, v_before, dt):
+        """After every physics step that ends a batch: the speed before it and its length."""
+        self.step_ax = (self.car.v - v_before) / dt
+
+    def sample(self, t, n=1):
+        car = self.car
+        curvature = self.circuit.piecewise_curvature.get(car.s)
+        self.gz = car.v * curvature + self.rng.gauss(0, self.gyro_noise)
+        self.ay = car.v**2 * curvature + self.rng.gauss(0, self.accel_noise)
+        self.ax = self.step_ax + self.rng.gauss(0, self.accel_noise)
+
+    def getState(self):
+        return (self.rng.getstate(), self.step_ax, self.gz, self.ax, self.ay)
+
+    def setState(self, state):
+        rng_state, self.step_ax, self.gz, self.ax, self.ay = state
+        self.rng.setstate(rng_state)
+
+
+class LateralController:
+    """Keeps the measured lateral acceleration under a target by trimming the track voltage (PI)."""
+
+    def __init__(self, sim, imu, target_ay=20.0, kp=0.3, ki=2.0, v_max=12.0):
+        self.sim = sim
+        self.imu = imu
+        self.target_ay = target_ay
+        self.kp, self.ki = kp, ki
+        self.v_max = v_max
+        self.integral = 0.0
+        self.last_t = 0.0
+        self.voltage = sim.parameters["voltage"]
+        self.volt_seconds = 0.0  # for the mean voltage
+
+    def update(self, t, n=1):
+        dt = t - self.last_t
+        self.last_t = t
+        self.volt_seconds += self.voltage * dt
+        error = self.target_ay - abs(self.imu.ay)
+        self.integral = max(-self.v_max / self.ki, min(self.v_max / self.ki, self.integral + error * dt))
+        voltage = max(0.0, min(self.v_max, self.kp * error + self.ki * self.integral))
+        if voltage != self.voltage:
+            # a new parameter snapshot, as the sliders and the physics worker exchange them
+            self.voltage = voltage
+            self.sim.applyParameters(dict(self.sim.parameters, voltage=voltage))
+
+    def getState(self):
+        return (self.integral, self.last_t, self.voltage, self.volt_seconds)
+
+    def setState(self, state):
+        self.integral, self.last_t, self.voltage, self.volt_seconds = state
+
+
+class ClosedLoop:
+    """The demo loop: one car, its IMU model, the controller and a render task on their own periods."""
+
+    def __init__(
+        self, sim, physics=deltat, imu=imu_period, control=control_period, render=render_period, target_ay=20.0
+    ):
+        self.sim = sim
+        self.car = sim.cars[0]
+        self.imu = ImuModel(self.car, sim.circuit)
+        self.controller = LateralController(sim, self.imu, target_ay)
+        self.length = sim.circuit.getLength()
+        self.physics_period = physics
+        self.periods = {"physics": physics, "imu": imu, "control": control, "render": render}
+        self.start_parameters = dict(sim.parameters)  # of tick 0, to run the loop again from the start
+        self.laps = []
+        self.frames = []  # car states at every render period, offscreen.py telemetry frames
+        self.tasks = [
+            Task("physics", physics, self.physics, Task.PHYSICS, batch=True),
+            Task("imu", imu, self.imu.sample, Task.SENSOR),
+            Task("control", control, self.controller.update, Task.CONTROL),
+            # the render period (1/60 s) is not a whole number of microseconds: round it
+            Task("render", self.frameDt(), self.render, Task.RENDER),
+        ]
+        self.scheduler = MultiRateScheduler(self.tasks)
+
+    def physics(self, t, n):
+        dt = self.physics_period
+        for k in range(n - 1, -1, -1):  # k: steps still to go in the batch
+            v_before = self.car.v
+            self.sim.step(dt)
+            # laps are timed by their step, not by the end of the batch
+            if not self.car.derailed and self.car.s >= (len(self.laps) + 1) * self.length:
+                self.laps.append(t - k * dt)
+        self.imu.physicsStep(v_before, dt)
+
+    def frameDt(self):
+        return round(self.periods["render"] / QUANTUM) * QUANTUM
+
+    def render(self, t, n):
+        # headless: keep what a window would draw, offscreen.py renders it afterwards
+        self.frames.append(self.sim.getState())
+
+    def run(self, duration):
+        self.scheduler.run(duration)
+
+    def meanVoltage(self):
+        controller = self.controller
+        return controller.volt_seconds / controller.last_t if controller.last_t else 0.0
+
+    def settings(self):
+        """The constructor arguments (periods and the current target) and the parameters of tick 0."""
+        return dict(self.periods, target_ay=self.controller.target_ay, start_parameters=dict(self.start_parameters))
+
+    def getState(self):
+        # the simulation itself is captured separately (checkpoint.py)
+        state = (tuple(self.laps), self.scheduler.getState(), self.imu.getState(), self.controller.getState())
+        return (self.settings(),) + state
+
+    def setState(self, state):
+        # the periods have to be the loop's own: construct it from state[0] first
+        settings, laps, scheduler, imu, controller = state
+        self.start_parameters = dict(settings["start_parameters"])
+        self.laps = list(laps)
+        self.scheduler.setState(scheduler)
+        self.imu.setState(imu)
+        self.controller.setState(controller)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--physics", type=float, default=deltat, help="physics period (s)")
+    parser.add_argument("--imu", type=float, default=imu_period)
+    parser.add_argument("--control", type=float, default=control_period)
+    parser.add_argument("--render", type=float, default=render_period, help="render (here: recorded frame) period")
+    parser.add_argument("--target-ay", type=float, default=20.0, help="lateral acceleration target (m/s^2)")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--telemetry", help="write the rendered frames to this JSON file for offscreen.py")
+    args = parser.parse_args(argv)
+
+    from simulation import Simulation
+
+    sim = Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=0.0))
+    loop = ClosedLoop(sim, args.physics, args.imu, args.control, args.render, args.target_ay)
+    loop.run(args.duration)
+
+    for task in loop.tasks:
+        print(f"{task.name:8s} {task.periods:8d} periods in {task.calls:7d} calls")
+    lap_times = [b - a for a, b in zip([0.0] + loop.laps, loop.laps)]
+    print(f"{len(lap_times)} laps, best {min(lap_times):.3f} s" if lap_times else "no lap")
+    print(f"mean voltage {loop.meanVoltage():.2f} V, {'derailed' if loop.car.derailed else 'on track'}")
+    if args.telemetry:
+        from offscreen import save_telemetry
+
+        save_telemetry(args.telemetry, DEFAULT_LAYOUT, loop.frames, loop.frameDt())
+        print(f"{len(loop.frames)} frames written to {args.telemetry}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Lap time sensitivity to the car parameters.
+
+The base parameter set and a step up and down in every parameter run as
+one batch of the vectorized car2 model (identify.BatchCar), so the
+gradient over all of PARAM_DEFINITIONS costs a single lap simulation.
+Lap times are interpolated within the crossing tick, which keeps them
+smooth in the parameters instead of stepping by deltat.
+
+car2 switches between grip, slip and derailment, so the lap time is only
+piecewise smooth. Every parameter reports its left and right slopes as
+well as the central difference: when they disagree by more than
+KINK_TOLERANCE the step straddles a switch and the gradient is flagged.
+A step that derails the car gives an infinite lap time and no gradient
+on that side. Steps are one slider resolution, one-sided at the ends of
+a slider range.
+
+    python sensitivity.py --voltage 6
+    python sensitivity.py --voltage 6 --descend 10 --fit voltage mass static_f
+"""
+
+import argparse
+import math
+
+import numpy as np
+
+from config import *
+from track import *
+from identify import RANGES, BatchCar
+
+MAX_LAP_TIME = 30.0  # s, a car that has not finished by then counts as stuck
+KINK_TOLERANCE = 0.25  # relative disagreement of the one-sided slopes
+
+RESOLUTIONS = {name: resolution for _, _, _, resolution, _, name in PARAM_DEFINITIONS}
+
+
+def lapTimes(circuit, parameters, max_time=MAX_LAP_TIME, dt=deltat):
+    """First lap time of every parameter set from a standing start, inf if derailed or stuck."""
+    cars = BatchCar(circuit, parameters)
+    length = cars.length
+    times = np.full(len(cars.s), math.inf)
+    running = np.ones(len(cars.s), dtype=bool)
+    for tick in range(int(max_time / dt)):
+        s_prev = cars.s
+        cars.tick(dt)
+        crossed = running & ~cars.derailed & (cars.s >= length)
+        if crossed.any():
+            fraction = (length - s_prev[crossed]) / (cars.s[crossed] - s_prev[crossed])
+            times[crossed] = (tick + fraction) * dt
+        running &= ~crossed & ~cars.derailed
+        if not running.any():
+            break
+    return times
+
+
+def sensitivity(layout, parameters, names=None, lane_idx=0, dt=deltat):
+    """
+    Returns (base lap time, {name: row}) where every row has the step, the
+    central, left and right slopes d(lap time)/d(parameter) and a status:
+    "ok", "kink" (a switch within the step), "derails" or "flat" (no effect here).
+    """
+    names = list(names or RANGES)
+    circuit = Circuit(layout, lane_idx=lane_idx)
+
+    # base, then (down, up) for every parameter
+    sets = [dict(parameters)]
+    steps = []
+    for name in names:
+        lo, hi = RANGES[name]
+        value = parameters[name]
+        down, up = max(lo, value - RESOLUTIONS[name]), min(hi, value + RESOLUTIONS[name])
+        steps.append((down, up))
+        sets.append(dict(parameters, **{name: down}))
+        sets.append(dict(parameters, **{name: up}))
+    batch = {name: np.array([p[name] for p in sets], dtype=float) for name in RANGES}
+    times = lapTimes(circuit, batch, dt=dt)
+
+    base = times[0]
+    rows = {}
+    for i, name in enumerate(names):
+        (down, up), t_down, t_up = steps[i], times[1 + 2 * i], times[2 + 2 * i]
+        value = parameters[name]
+        left = (base - t_down) / (value - down) if value > down and math.isfinite(t_down) else math.nan
+        right = (t_up - base) / (up - value) if up > value and math.isfinite(t_up) else math.nan
+        central = (t_up - t_down) / (up - down) if math.isfinite(t_up) and math.isfinite(t_down) else math.nan
+
+        if not (math.isfinite(base) and math.isfinite(t_down) and math.isfinite(t_up)):
+            # no lap on one side: only the slope on the other side is meaningful
+            status = "derails"
+            central = left if math.isnan(right) else right
+        elif t_down == base == t_up:
+            status = "flat"
+        elif not (math.isnan(left) or math.isnan(right)) and abs(left - right) > KINK_TOLERANCE * max(
+            abs(left), abs(right)
+        ):
+            status = "kink"
+        else:
+            status = "ok"
+        rows[name] = {"step": (up - down) / 2, "gradient": central, "left": left, "right": right, "status": status}
+    return base, rows
+
+
+def descend(layout, parameters, names, iterations, rate=0.1, log=print):
+    """
+    Projected gradient descent on the lap time, in units of the slider ranges:
+    every iteration moves at most `rate` of each range. Only the base lap time
+    of a candidate has to improve for it to be kept, otherwise the rate is halved.
+    """
+    parameters = dict(parameters)
+    base, rows = sensitivity(layout, parameters, names)
+    for iteration in range(iterations):
+        # gradient in range units, kinked and one-sided slopes included, derailing sides excluded
+        g = np.array([rows[n]["gradient"] * (RANGES[n][1] - RANGES[n][0]) for n in names])
+        g = np.nan_to_num(g)
+        if not g.any():
+            break
+        move = -rate * g / np.abs(g).max()
+        candidate = dict(parameters)
+        for name, m in zip(names, move):
+            lo, hi = RANGES[name]
+            candidate[name] = min(hi, max(lo, parameters[name] + m * (hi - lo)))
+
+        t, candidate_rows = sensitivity(layout, candidate, names)
+        if t < base:
+            parameters, base, rows = candidate, t, candidate_rows
+        else:
+            rate /= 2
+        if log:
+            log(f"iteration {iteration + 1}: lap {base:.4f} s, rate {rate:.4f}")
+    return parameters, base
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voltage", type=float, default=6.0)
+    parser.add_argument("--fit", nargs="+", choices=list(RANGES), help="parameters to report (and tune)")
+    parser.add_argument("--descend", type=int, default=0, help="gradient descent iterations on the lap time")
+    args = parser.parse_args(argv)
+
+    parameters = midParameters(voltage=args.voltage)
+    names = args.fit or list(RANGES)
+    base, rows = sensitivity(DEFAULT_LAYOUT, parameters, names)
+    print(f"lap time {base:.4f} s")
+    for name, row in rows.items():
+        print(
+            f"  {name:12s} {row['gradient']:+11.5f} s/unit  (left {row['left']:+.5f}, right {row['right']:+.5f}, "
+            f"step {row['step']:g})  {row['status']}"
+        )
+
+    if args.descend:
+        tuned, lap = descend(DEFAULT_LAYOUT, parameters, names, args.descend)
+        print(f"tuned lap time {lap:.4f} s")
+        for name in names:
+            print(f"  {name} = {tuned[name]:.4g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Network server streaming a live headless simulation.
+
+Physics runs on a PhysicsWorker exactly as in the simulator window; the
+asyncio loop samples its latest frame at --rate Hz and fans it out to
+every connected client. Each client has a small bounded queue: when a
+client falls behind, its oldest frames are dropped, so slow clients
+never stall the others or the physics.
+
+    python server.py --port 8765 --cars 2 --rate 30
+    python server.py --watch localhost:8765        # print the stream
+
+Messages to clients are length prefixed: a little-endian uint32 payload
+length, a one byte type, then the body.
+
+    HELLO  (0)  JSON: layout, model, fields, rate, dt, parameters
+    STATE  (1)  uint64 tick, float64 sim time, uint16 n_cars, then per car
+                float32 s, x, y, heading, v, slip
+    REPLY  (2)  JSON answer to a command
+    ERROR  (3)  JSON {"error": ...}: the physics worker stopped, no more frames
+
+Clients send commands as JSON lines of at most COMMAND_LIMIT bytes.
+Parameter names are those of config.PARAM_DEFINITIONS, for example
+{"voltage": 7.5}, or {"parameters": {"mass": 90, "static_f": 0.8}}, and
+values have to be finite and within the slider range. Every command gets
+a REPLY, {"ok": false, "error": ...} if it was rejected.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import struct
+
+from config import *
+from track import *
+from models import DEFAULT_MODEL, MODELS, STATE_FIELDS
+from parameters import ParameterStore
+from physics_worker import PhysicsWorker
+
+HELLO, STATE, REPLY, ERROR = 0, 1, 2, 3
+MESSAGE_HEADER = struct.Struct("<IB")  # payload length (type byte included), type
+STATE_HEADER = struct.Struct("<QdH")  # tick, sim time, number of cars
+CAR_STATE = struct.Struct("<6f")  # s, x, y, heading, v, slip
+
+STREAMED_FIELDS = ("s", "x", "y", "b_heading", "v", "slip_angle")
+FIELD_INDEX = [STATE_FIELDS.index(name) for name in STREAMED_FIELDS]
+PARAMETER_RANGES = {name: (lo, hi) for _, lo, hi, _, _, name in PARAM_DEFINITIONS}
+
+CLIENT_QUEUE_FRAMES = 4  # frames buffered per client before the oldest are dropped
+COMMAND_LIMIT = 64 * 1024  # bytes per command line
+
+
+def encodeMessage(kind, body):
+    return MESSAGE_HEADER.pack(len(body) + 1, kind) + body
+
+
+def encodeState(tick, sim_time, states):
+    body = [STATE_HEADER.pack(tick, sim_time, len(states))]
+    for state in states:
+        body.append(CAR_STATE.pack(*(state[i] for i in FIELD_INDEX)))
+    return encodeMessage(STATE, b"".join(body))
+
+
+def decodeState(body):
+    """Inverse of encodeState for a STATE body: (tick, sim time, [per-car 6-tuples])."""
+    tick, sim_time, n_cars = STATE_HEADER.unpack_from(body)
+    offset = STATE_HEADER.size
+    cars = [CAR_STATE.unpack_from(body, offset + i * CAR_STATE.size) for i in range(n_cars)]
+    return tick, sim_time, cars
+
+
+async def readCommand(reader):
+    """
+    Reads one command line, None at the end of the stream. A line over the
+    stream limit is discarded up to its newline and raises ValueError, the
+    connection stays usable.
+    """
+    try:
+        return await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial or None
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    while True:
+        try:
+            await reader.readexactly(consumed)
+            await reader.readuntil(b"\n")
+            break
+        except asyncio.IncompleteReadError:
+            break
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+    raise ValueError(f"command longer than {COMMAND_LIMIT} bytes")
+
+
+async def readMessage(reader):
+    """Reads one message from a server stream, returns (type, body)."""
+    length, kind = MESSAGE_HEADER.unpack(await reader.readexactly(MESSAGE_HEADER.size))
+    return kind, await reader.readexactly(length - 1)
+
+
+class Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = asyncio.Queue(CLIENT_QUEUE_FRAMES)
+        self.lock = asyncio.Lock()  # frames and replies are written and drained one at a time
+        self.dropped = 0
+
+    async def send(self, message):
+        async with self.lock:
+            self.writer.write(message)
+            await self.writer.drain()
+
+    def offer(self, message):
+        # never blocks the broadcaster: a full queue loses its oldest frame
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+class SimulationServer:
+    def __init__(self, layout=DEFAULT_LAYOUT, n_cars=1, parameters=None, rate=30, physics_mode="thread", model=None):
+        self.layout = list(layout)
+        self.n_cars = n_cars
+        self.rate = rate
+        self.model = model or DEFAULT_MODEL
+        self.param_store = ParameterStore(parameters or midParameters())
+        self.parameters = self.param_store.publish()
+        self.physics = PhysicsWorker(self.layout, n_cars, self.parameters, mode=physics_mode, model=self.model)
+        self.clients = set()
+        self.error = None  # set once the physics worker stopped on its own
+
+    async def serve(self, host="0.0.0.0", port=8765):
+        self.physics.start()
+        server = await asyncio.start_server(self.handleClient, host, port, limit=COMMAND_LIMIT)
+        print(f"serving {self.n_cars} car(s) on {', '.join(str(s.getsockname()) for s in server.sockets)}")
+        try:
+            async with server:
+                await asyncio.gather(server.serve_forever(), self.broadcast())
+        finally:
+            self.physics.stop()
+
+    async def broadcast(self):
+        last_tick = None
+        period = 1 / self.rate
+        loop = asyncio.get_running_loop()
+        next_frame = loop.time()
+        while True:
+            if self.error is None and not self.physics.alive():
+                # the last frame would freeze: tell the clients instead
+                self.error = "physics worker stopped"
+                print(self.error)
+                message = encodeMessage(ERROR, json.dumps({"error": self.error}).encode())
+                for client in self.clients:
+                    client.offer(message)
+            tick, states = self.physics.read()
+            if self.error is None and tick != last_tick and self.clients:
+                message = encodeState(tick, tick * deltat, states)
+                for client in self.clients:
+                    client.offer(message)
+                last_tick = tick
+
+            next_frame += period
+            await asyncio.sleep(max(0.0, next_frame - loop.time()))
+
+    async def handleClient(self, reader, writer):
+        client = Client(writer)
+        hello = {
+            "layout": [list(k) for k in layoutKey(self.layout)],
+            "model": self.model,
+            "fields": list(STREAMED_FIELDS),
+            "rate": self.rate,
+            "dt": deltat,
+            "parameters": dict(self.parameters),
+        }
+        writer.write(encodeMessage(HELLO, json.dumps(hello).encode()))
+        if self.error is not None:
+            writer.write(encodeMessage(ERROR, json.dumps({"error": self.error}).encode()))
+        self.clients.add(client)
+
+        sender = asyncio.create_task(self.sendFrames(client))
+        try:
+            while True:
+                try:
+                    line = await readCommand(reader)
+                except ValueError as e:
+                    reply = {"ok": False, "error": str(e)}
+                else:
+                    if line is None:
+                        break
+                    reply = self.applyCommand(line)
+                # replies bypass the frame queue, and wait like frames for a slow client
+                await client.send(encodeMessage(REPLY, json.dumps(reply).encode()))
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            writer.close()
+
+    async def sendFrames(self, client):
+        try:
+            while True:
+                await client.send(await client.queue.get())
+        except ConnectionError:
+            pass
+
+    def applyCommand(self, line):
+        if self.error is not None:
+            return {"ok": False, "error": self.error}
+        try:
+            command = json.loads(line)
+            if not isinstance(command, dict):
+                return {"ok": False, "error": "a command has to be a JSON object"}
+            values = command.pop("parameters", {})
+            if not isinstance(values, dict):
+                return {"ok": False, "error": '"parameters" has to be a JSON object'}
+            values = dict(values)
+            values.update(command)
+            unknown = set(values) - set(PARAMETER_RANGES)
+            if unknown:
+                return {"ok": False, "error": f"unknown parameters {sorted(unknown)}"}
+            values = {name: float(value) for name, value in values.items()}
+            for name, value in values.items():
+                # out of range values (a zero mass, nan) would kill the physics worker
+                lo, hi = PARAMETER_RANGES[name]
+                if not (math.isfinite(value) and lo <= value <= hi):
+                    return {"ok": False, "error": f"{name} = {value} outside [{lo}, {hi}]"}
+            self.param_store.update(values)
+        except (ValueError, TypeError, AttributeError) as e:
+            return {"ok": False, "error": str(e)}
+
+        # one snapshot per command, the worker only keeps the latest
+        self.parameters = self.param_store.publish()
+        self.physics.sendParameters(self.parameters)
+        return {"ok": True, "parameters": dict(self.parameters)}
+
+
+async def watch(host, port, commands=()):
+    """Minimal client: sends `commands` and prints the streamed frames."""
+    reader, writer = await asyncio.open_connection(host, port)
+    for command in commands:
+        writer.write(command.encode() + b"\n")
+    while True:
+        kind, body = await readMessage(reader)
+        if kind == STATE:
+            tick, sim_time, cars = decodeState(body)
+            print(f"t={sim_time:8.3f} " + " | ".join(" ".join(f"{v:7.3f}" for v in car) for car in cars))
+        else:
+            print(json.loads(body))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cars", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=30, help="frames per second sent to clients")
+    parser.add_argument("--voltage", type=float, default=6.0)
+    parser.add_argument("--physics", default=os.environ.get("AUTOSLOT_PHYSICS", "thread"), choices=("thread", "process"))
+    parser.add_argument("--model", default=DEFAULT_MODEL, choices=sorted(MODELS))
+    parser.add_argument("--watch", metavar="HOST:PORT", help="connect to a server and print its stream")
+    parser.add_argument("--command", action="append", default=[], help="JSON command sent by --watch")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.watch:
+            host, port = args.watch.rsplit(":", 1)
+            asyncio.run(watch(host, int(port), args.command))
+        else:
+            server = SimulationServer(
+                DEFAULT_LAYOUT, args.cars, midParameters(voltage=args.voltage), args.rate, args.physics, args.model
+            )
+            asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Headless simulation: cars of one physics model (car2 by default, see
+models.py) on a circuit, stepped with a fixed time step. Used by the
+physics worker and by batch tools.
+"""
+
+from config import *
+from track import *
+from models import DEFAULT_MODEL, getModel
+
+
+class Simulation:
+    def __init__(self, layout=DEFAULT_LAYOUT, n_cars=1, parameters=None, lane_idx=0, model=None):
+        if parameters is None:
+            parameters = defaultParameters()
+
+        self.circuit = Circuit(layout, lane_idx=lane_idx)
+        self.parameters = parameters
+        self.tick_count = 0
+        self.model = model or DEFAULT_MODEL
+        Car = getModel(self.model)
+
+        x, y = self.circuit.getLaneStart()
+        self.cars = [
+            Car(
+                x,
+                y,
+                0,
+                None,
+                f"car {i + 1}",
+                self.circuit.piecewise_curvature,
+                self.circuit.piecewise_angle,
+                self.circuit.piecewise_position,
+                parameters,
+            )
+            for i in range(n_cars)
+        ]
+
+    def applyParameters(self, parameters):
+        # called between ticks, only when a new snapshot arrived
+        if parameters is not self.parameters:
+            for car in self.cars:
+                car.updateParameters(parameters)
+            self.parameters = parameters
+
+    def splice(self, first, last, layout):
+        """
+        Circuit.splice on the running simulation: only the edited pieces and
+        those downstream are rebuilt, in place, and the cars keep their state
+        and their place on the track.
+        """
+        entries = self.circuit.piecewise_curvature.piece
+        length = self.circuit.getLength()
+        start = entries[first][1] if first < len(entries) else length
+        end = entries[last - 1][2] if last > first else start
+
+        removed, changed = self.circuit.splice(first, last, layout)
+        new_length = self.circuit.getLength()
+        for car in self.cars:
+            lap, x = divmod(car.s, length)
+            if x >= end:
+                x += new_length - length
+            elif x > start:
+                x = start  # on a removed piece: moved to the start of what replaced it
+            car.s = lap * new_length + x
+        return removed, changed
+
+    def step(self, dt=deltat):
+        for car in self.cars:
+            car.tick(dt)
+        self.tick_count += 1
+
+    def run(self, n_ticks, dt=deltat):
+        for _ in range(n_ticks):
+            self.step(dt)
+
+    def getState(self):
+        return [car.getState() for car in self.cars]
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Steady-state lap detection and periodic extrapolation.
+
+With constant inputs a car2 car converges to a periodic lap: its speed
+settles at V/E (or the speed limit) and every lap repeats the v(s) and
+slip_angle(s) profile of the one before. SteadyState samples both at
+PROFILE_POINTS fixed positions of every lap, interpolated between ticks,
+and reports convergence once CONFIRM_LAPS laps in a row match the lap
+before within tolerance. From then on the laps and the state at any later
+time follow from the last lap and its period, without stepping.
+
+The speed has to match to V_TOLERANCE. The slip angle only repeats up to
+the tick phase at which the car enters a curve, so its tolerance is a few
+ticks' worth of car2's maximum slip rate. A lap whose peak slip comes
+within DERAIL_MARGIN_TICKS of the derailment angle never counts as steady:
+the jitter could derail the car in a later lap.
+
+The extrapolated laps are exact only up to the tick grid: the period
+comes from interpolated crossings, so a crossing that falls within
+rounding of a tick can be counted one tick off. --check at 10 or 12 V
+shows 2 or 3 lap times in 600 s one tick apart from ticking every lap,
+and the final s about 1e-4 m apart.
+
+Inputs have to stay constant from the confirmed laps on; call reset()
+when they change. results.simulateRun(..., steady=True) uses it for sweeps
+and endurance runs:
+
+    python steady.py --duration 3600 --voltage 6
+    python steady.py --duration 600 --voltage 4 --check     # compare with ticking every lap
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from config import *
+from track import *
+from car2 import DERAIL_SLIP, MAX_SLIP_RATE
+
+PROFILE_POINTS = 200  # samples of v and slip angle per lap
+CONFIRM_LAPS = 2  # laps in a row that have to repeat the one before
+V_TOLERANCE = 1e-4  # m/s
+SLIP_TOLERANCE_TICKS = 5  # slip tolerance in ticks of MAX_SLIP_RATE
+DERAIL_MARGIN_TICKS = 2  # ticks of MAX_SLIP_RATE the peak slip has to stay below derailment
+
+
+class SteadyState:
+    def __init__(self, length, dt=deltat, points=PROFILE_POINTS, confirm=CONFIRM_LAPS):
+        self.length = length
+        self.grid = np.arange(points) * (length / points)
+        self.confirm = confirm
+        self.slip_tolerance = SLIP_TOLERANCE_TICKS * MAX_SLIP_RATE * dt
+        self.derail_margin = DERAIL_MARGIN_TICKS * MAX_SLIP_RATE * dt
+        self.reset()
+
+    def reset(self):
+        """Forgets the laps seen so far, e.g. after the inputs changed."""
+        self.samples = None  # (t, s, v, slip) lists of the lap in progress
+        self.lap = None  # index of the lap in progress
+        self.previous = None  # (start time, times since the start, v, slip) of the last complete lap
+        self.matches = 0
+        self.period = None
+
+    def observe(self, t, s, v, slip):
+        """Adds the state at time t (s never decreases). Returns True once the laps are periodic."""
+        lap = math.floor(s / self.length)
+        if self.samples is None:
+            self.samples, self.lap = ([t], [s], [v], [slip]), lap
+            return False
+        for column, value in zip(self.samples, (t, s, v, slip)):
+            column.append(value)
+        if lap == self.lap:
+            return False
+
+        # the car crossed the line: profile the lap that ended (if it was seen from its start)
+        ts, ss, vs, slips = self.samples
+        start = self.lap * self.length
+        if ss[0] <= start:
+            points = start + self.grid
+            t_start = float(np.interp(start, ss, ts))
+            times = np.interp(points, ss, ts) - t_start
+            self.finishLap(t_start, times, np.interp(points, ss, vs), np.interp(points, ss, slips))
+        # the sample before the line starts the next one
+        self.samples = tuple(column[-2:] for column in self.samples)
+        self.lap = lap
+        return self.matches >= self.confirm
+
+    def finishLap(self, start, times, vs, slips):
+        if self.previous is not None:
+            start_before, _, vs_before, slips_before = self.previous
+            repeats = (
+                np.abs(vs - vs_before).max() <= V_TOLERANCE
+                and np.abs(slips - slips_before).max() <= self.slip_tolerance
+                and np.abs(slips).max() + self.derail_margin < DERAIL_SLIP
+            )
+            self.matches = self.matches + 1 if repeats else 0
+            self.period = start - start_before
+        self.previous = (start, times, vs, slips)
+
+    def extrapolate(self, t_end):
+        """
+        From the last complete lap and its period: the start times of the laps
+        after it up to t_end, and (s, v, slip) at t_end.
+        """
+        start, times, vs, slips = self.previous
+        period = self.period
+        lap = self.lap - 1  # of the last complete lap
+        n = math.floor((t_end - start) / period)
+        lap_starts = [start + k * period for k in range(1, n + 1)]
+
+        # the same time into the last complete lap, which closes on the start of the next
+        phase = t_end - start - n * period
+        times = np.append(times, period)
+        s = (lap + n) * self.length + float(np.interp(phase, times, np.append(self.grid, self.length)))
+        v = float(np.interp(phase, times, np.append(vs, vs[0])))
+        slip = float(np.interp(phase, times, np.append(slips, slips[0])))
+        return lap_starts, (s, v, slip)
+
+
+def lapTick(t, dt=deltat):
+    """The tick at which a car crossing the line at time t is counted (the first with s past the line)."""
+    return math.ceil(round(t / dt, 9))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3600.0)
+    parser.add_argument("--voltage", type=float, default=6.0)
+    parser.add_argument("--check", action="store_true", help="also tick every lap and compare")
+    args = parser.parse_args(argv)
+
+    from results import simulateRun
+
+    parameters = midParameters(voltage=args.voltage)
+    t0 = time.perf_counter()
+    metrics, _ = simulateRun(DEFAULT_LAYOUT, parameters, args.duration, steady=True)
+    elapsed = time.perf_counter() - t0
+    steady_from = metrics.get("steady_from")
+    print(
+        f"{args.duration:.0f} s in {elapsed:.2f} s: {metrics['laps']} laps, best {metrics['best_lap']:.3f} s, "
+        + (f"steady from {steady_from:.2f} s" if steady_from is not None else "no steady state")
+    )
+
+    if args.check:
+        t0 = time.perf_counter()
+        ref, _ = simulateRun(DEFAULT_LAYOUT, parameters, args.duration)
+        elapsed = time.perf_counter() - t0
+        differ = sum(1 for a, b in zip(metrics["lap_times"], ref["lap_times"]) if abs(a - b) > 1e-9)
+        print(
+            f"ticked in {elapsed:.2f} s: {ref['laps']} laps, {differ} lap times differ, "
+            f"final s differs by {abs(metrics['final_s'] - ref['final_s']):.2e} m"
+        )
+
+
+if __name__ == "__main__":
+    main()
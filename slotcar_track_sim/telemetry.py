@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming ingest of real car telemetry (ESP32 + GY521 IMU logs).
+
+Logs are read in fixed-size chunks, never whole, and every stage keeps
+just enough state to carry on with the next chunk:
+
+1. readLog() parses chunks of a CSV or raw binary log into columns in
+   SI units (s, m/s^2, rad/s).
+2. LaneAligner integrates the gyro yaw rate and maps the yaw onto lane s
+   through the cumulative turning profile of the circuit. Inside curves
+   the heading tells where the car is; along straights (where the heading
+   does not change) s is interpolated in time between the curve exit and
+   the next curve entry.
+3. ResidualTracker runs car2 alongside the log and compares s and yaw
+   rate with what the model predicts at the same instants.
+
+    python telemetry.py race.csv --voltage 6 --out aligned.npz
+
+Log formats:
+
+    CSV      header line, comma separated; a time column "t" (s), "t_ms" or
+             "t_us", gyro "gx, gy, gz" in deg/s and optional "ax, ay, az" in m/s^2
+    binary   little-endian records of uint32 t_us followed by int16 ax, ay,
+             az, gx, gy, gz raw MPU-6050 counts, with the +-8 g and +-2000 deg/s
+             ranges (a slot car easily turns at more than 500 deg/s)
+
+Alignment needs every heading to be reached once per lap, i.e. all curves
+turning the same way, and a car that starts still on lane s = start_s. A
+car that stays out of the curves for more than MAX_PENDING_ROWS samples
+(standing still, in practice) is held at its last known position, so the
+unresolved samples never grow past that. --out streams the aligned
+columns to disk chunk by chunk (NpzWriter).
+"""
+
+import argparse
+import itertools
+import math
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+
+from config import *
+from track import *
+
+CHUNK_ROWS = 65536
+MAX_PENDING_ROWS = 4 * CHUNK_ROWS  # unresolved samples before the car is taken to be still
+STILL_SAMPLES = 200  # samples at the start of a log used to estimate the gyro bias
+HEADING_MARGIN = math.radians(3)  # curve ends within this heading are left to the time interpolation
+
+BINARY_RECORD = np.dtype([("t_us", "<u4"), ("ax", "<i2"), ("ay", "<i2"), ("az", "<i2"),
+                          ("gx", "<i2"), ("gy", "<i2"), ("gz", "<i2")])
+ACCEL_LSB_PER_G = 4096.0
+GYRO_LSB_PER_DPS = 16.4
+G = 9.81
+
+TIME_SCALES = {"t": 1.0, "t_ms": 1e-3, "t_us": 1e-6}
+
+
+# ============== PARSING ==============
+
+
+def readLog(path, chunk_rows=CHUNK_ROWS):
+    """Yields dicts of column arrays (t, gx, gy, gz and the accelerations present), chunk by chunk."""
+    if path.endswith(".csv"):
+        yield from _readCsv(path, chunk_rows)
+    else:
+        yield from _readBinary(path, chunk_rows)
+
+
+def _readCsv(path, chunk_rows):
+    with open(path) as f:
+        names = [name.strip() for name in f.readline().split(",")]
+        time_name = next((name for name in TIME_SCALES if name in names), None)
+        if time_name is None or "gz" not in names:
+            raise ValueError(f"{path}: needs a time column ({', '.join(TIME_SCALES)}) and gz")
+
+        columns = {name: i for i, name in enumerate(names) if name in ("ax", "ay", "az", "gx", "gy", "gz")}
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            data = np.loadtxt(lines, delimiter=",", ndmin=2)
+            chunk = {"t": data[:, names.index(time_name)] * TIME_SCALES[time_name]}
+            for name, i in columns.items():
+                chunk[name] = np.radians(data[:, i]) if name.startswith("g") else data[:, i]
+            yield chunk
+
+
+def _readBinary(path, chunk_rows):
+    t_offset, last_t_us = 0, None
+    with open(path, "rb") as f:
+        while True:
+            raw = f.read(chunk_rows * BINARY_RECORD.itemsize)
+            n = len(raw) // BINARY_RECORD.itemsize
+            if n == 0:
+                return
+            records = np.frombuffer(raw[: n * BINARY_RECORD.itemsize], dtype=BINARY_RECORD)
+
+            # the microsecond counter wraps every ~71 minutes
+            t_us = records["t_us"].astype(np.int64)
+            previous = np.concatenate(([last_t_us if last_t_us is not None else t_us[0]], t_us[:-1]))
+            wraps = np.cumsum(t_us < previous) * 2**32
+            t_us = t_us + wraps + t_offset
+            t_offset = wraps[-1] + t_offset
+            last_t_us = int(records["t_us"][-1])
+
+            chunk = {"t": t_us * 1e-6}
+            for name in ("ax", "ay", "az"):
+                chunk[name] = records[name] / ACCEL_LSB_PER_G * G
+            for name in ("gx", "gy", "gz"):
+                chunk[name] = np.radians(records[name] / GYRO_LSB_PER_DPS)
+            yield chunk
+
+
+# ============== ALIGNMENT ==============
+
+
+def turningProfile(circuit):
+    """
+    Curve segments of the lane as arrays (theta0, theta1, s0, curvature), in
+    driving order, with headings measured in the turning direction.
+    Returns them with the lap length, the net turn per lap and its sign.
+    """
+    entries = circuit.piecewise_angle.piece
+    curvatures = [c for c, s, e, a0 in entries if c != 0]
+    if not curvatures or not (all(c > 0 for c in curvatures) or all(c < 0 for c in curvatures)):
+        raise ValueError("lane alignment needs curves that all turn the same way")
+
+    sign = 1.0 if curvatures[0] > 0 else -1.0
+    theta0, theta1, s0, curvature = [], [], [], []
+    for c, s, e, a0 in entries:
+        if c != 0:
+            theta0.append(sign * a0)
+            theta1.append(sign * (a0 + c * (e - s)))
+            s0.append(s)
+            curvature.append(sign * c)
+    net_turn = theta1[-1] - sign * entries[0][3]
+    return (np.array(theta0), np.array(theta1), np.array(s0), np.array(curvature)), circuit.getLength(), net_turn, sign
+
+
+class LaneAligner:
+    """
+    Maps IMU samples to lane s (unwrapped over laps), chunk by chunk. Samples
+    on straights stay pending until the car enters the next curve (or the
+    log ends).
+    """
+
+    def __init__(self, circuit, start_s=0.0, bias=None):
+        (self.theta0, self.theta1, self.s0, self.curvature), self.length, self.net_turn, self.sign = turningProfile(
+            circuit
+        )
+        self.heading0 = self.sign * circuit.piecewise_angle.get(start_s)
+        self.start_s = start_s
+        self.bias = bias
+        self.held = []  # raw chunks waiting for the gyro bias estimate
+        self.yaw = 0.0
+        self.last = None  # (t, gz) of the previous sample, for the trapezoidal integration
+        self.anchor = None  # (t, s) of the last resolved sample
+        self.pending = []  # chunks of aligned samples not resolved yet
+        self.pending_rows = 0
+
+    def feed(self, chunk):
+        """Returns the aligned samples (dict with t, s, yaw, ...) that became resolved with this chunk."""
+        if self.bias is None:
+            # the car is assumed still at the start of the log
+            self.held.append(chunk)
+            if sum(len(c["t"]) for c in self.held) < STILL_SAMPLES:
+                return None
+            return self._releaseHeld()
+        return self._feed(chunk)
+
+    def flush(self):
+        """Resolves what is left at the end of the log."""
+        released = self._releaseHeld() if self.bias is None and self.held else None
+        final = self._resolve(final=True) if self.pending else None
+        return _concat([released, final])
+
+    def _releaseHeld(self):
+        self.bias = float(np.mean(np.concatenate([c["gz"] for c in self.held])[:STILL_SAMPLES]))
+        held, self.held = self.held, []
+        return _concat([self._feed(c) for c in held])
+
+    def _feed(self, chunk):
+        t, gz = chunk["t"], chunk["gz"] - self.bias
+        if self.last is None:
+            self.last = (t[0], gz[0])
+        t_prev = np.concatenate(([self.last[0]], t[:-1]))
+        gz_prev = np.concatenate(([self.last[1]], gz[:-1]))
+        yaw = self.yaw + np.cumsum((gz + gz_prev) / 2 * (t - t_prev))
+        self.yaw, self.last = yaw[-1], (t[-1], gz[-1])
+
+        # heading in the turning direction, then lap and heading within the lap
+        phi = self.heading0 + self.sign * yaw
+        lap = np.floor((phi - self.theta0[0]) / self.net_turn)
+        phi_lap = phi - lap * self.net_turn
+
+        i = np.clip(np.searchsorted(self.theta0, phi_lap, side="right") - 1, 0, len(self.theta0) - 1)
+        inside = (phi_lap > self.theta0[i] + HEADING_MARGIN) & (phi_lap < self.theta1[i] - HEADING_MARGIN)
+        s = np.where(inside, lap * self.length + self.s0[i] + (phi_lap - self.theta0[i]) / self.curvature[i], np.nan)
+
+        self.pending.append(dict(chunk, gz=gz, yaw=yaw, s=s, inside=inside))
+        self.pending_rows += len(t)
+        return self._resolve()
+
+    def _resolve(self, final=False):
+        # samples up to the last one inside a curve can be resolved now. Only the
+        # newest chunk can hold one, the older pending samples are all outside
+        hold = final
+        if not final and not self.pending[-1]["inside"].any():
+            if self.pending_rows <= MAX_PENDING_ROWS:
+                return None
+            hold = True
+        merged = _concat(self.pending)
+        inside = merged["inside"]
+        last = len(inside) - 1 if hold else int(np.flatnonzero(inside)[-1])
+
+        done = {k: v[: last + 1] for k, v in merged.items()}
+        self.pending = [{k: v[last + 1 :] for k, v in merged.items()}] if last + 1 < len(inside) else []
+        self.pending_rows = len(inside) - last - 1
+
+        t, known = done["t"], done["inside"]
+        # the first anchor is the start position, at the first sample
+        anchor = self.anchor or (t[0], self.start_s)
+        anchors_t = np.concatenate(([anchor[0]], t[known]))
+        anchors_s = np.concatenate(([anchor[1]], done["s"][known]))
+
+        # the car only moves forward, gyro noise must not send it back
+        anchors_s = np.maximum.accumulate(anchors_s)
+        if hold and anchors_t[-1] < t[-1]:
+            # nothing after the last curve (yet): hold the last known position
+            anchors_t = np.append(anchors_t, t[-1])
+            anchors_s = np.append(anchors_s, anchors_s[-1])
+        done["s"] = np.interp(t, anchors_t, anchors_s)
+        self.anchor = (anchors_t[-1], anchors_s[-1])
+        return done
+
+
+def _concat(chunks):
+    chunks = [c for c in chunks if c is not None and len(c["t"])]
+    if not chunks:
+        return None
+    if len(chunks) == 1:
+        return chunks[0]
+    return {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+
+
+class NpzWriter:
+    """
+    Writes columns to an .npz chunk by chunk, as np.savez would write them
+    at once: each column is spooled to a temporary file next to the output
+    and copied into the archive behind its .npy header on close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.spool = tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path)))
+        self.columns = {}  # name -> [dtype, rows]
+
+    def write(self, columns):
+        for name, values in columns.items():
+            values = np.ascontiguousarray(values)
+            column = self.columns.setdefault(name, [values.dtype, 0])
+            with open(os.path.join(self.spool.name, name), "ab") as f:
+                f.write(values.astype(column[0], copy=False).tobytes())
+            column[1] += len(values)
+
+    def close(self):
+        try:
+            with zipfile.ZipFile(self.path, "w", allowZip64=True) as archive:
+                for name, (dtype, rows) in self.columns.items():
+                    header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows,)}
+                    with archive.open(name + ".npy", "w", force_zip64=True) as out:
+                        np.lib.format.write_array_header_1_0(out, header)
+                        with open(os.path.join(self.spool.name, name), "rb") as f:
+                            shutil.copyfileobj(f, out)
+        finally:
+            self.spool.cleanup()
+
+
+# ============== MODEL RESIDUAL ==============
+
+
+class ResidualTracker:
+    """Steps car2 through the log time and evaluates it at the sample instants."""
+
+    def __init__(self, layout, parameters, lane_idx=0, start_s=0.0, dt=deltat):
+        from simulation import Simulation
+
+        self.sim = Simulation(layout, 1, parameters, lane_idx)
+        self.car = self.sim.cars[0]
+        self.car.s = start_s
+
+        # lane curvature as arrays, for vectorized lookups
+        entries = self.sim.circuit.piecewise_curvature.piece
+        self.piece_starts = np.array([e[1] for e in entries])
+        self.piece_curvatures = np.array([e[0] for e in entries])
+        self.length = self.sim.circuit.getLength()
+        self.dt = dt
+        self.t0 = None
+        self.history_t, self.history_s, self.history_v = [0.0], [self.car.s], [self.car.v]
+
+    def feed(self, aligned):
+        t = aligned["t"]
+        if self.t0 is None:
+            self.t0 = t[0]
+        t_rel = t - self.t0
+        while self.history_t[-1] < t_rel[-1]:
+            self.sim.step(self.dt)
+            self.history_t.append(self.history_t[-1] + self.dt)
+            self.history_s.append(self.car.s)
+            self.history_v.append(self.car.v)
+
+        s_pred = np.interp(t_rel, self.history_t, self.history_s)
+        v_pred = np.interp(t_rel, self.history_t, self.history_v)
+        piece = np.searchsorted(self.piece_starts, s_pred % self.length, side="right") - 1
+        curvature = self.piece_curvatures[piece]
+        out = dict(aligned, s_pred=s_pred, residual_s=aligned["s"] - s_pred)
+        out["residual_yaw_rate"] = aligned["gz"] - v_pred * curvature
+        # only the model history after this chunk's start is needed from now on
+        keep = max(0, int(np.searchsorted(self.history_t, t_rel[-1])) - 1)
+        del self.history_t[:keep], self.history_s[:keep], self.history_v[:keep]
+        return out
+
+
+# ============== OVERLAY ==============
+
+
+class TelemetryOverlay:
+    """Real car position from an aligned log, drawn as a ghost marker next to the simulated car."""
+
+    TAG = "telemetry"
+
+    def __init__(self, aligned, circuit):
+        self.t = aligned["t"] - aligned["t"][0]
+        self.s = aligned["s"]
+        self.circuit = circuit
+
+    @classmethod
+    def load(cls, path, circuit):
+        with np.load(path) as data:
+            return cls({"t": data["t"], "s": data["s"]}, circuit)
+
+    def positionAt(self, t):
+        s = float(np.interp(t, self.t, self.s))
+        return self.circuit.piecewise_position.get(s % self.circuit.getLength())
+
+    def draw(self, canvas, view, t):
+        canvas.delete(self.TAG)
+        x, y = self.positionAt(t)
+        px, py = view.m_to_px(canvas, x, y)
+        r = 6
+        canvas.create_oval(px - r, py - r, px + r, py + r, outline="deepskyblue", width=3, tags=self.TAG)
+
+
+# ============== DRIVER ==============
+
+
+def process(path, layout=DEFAULT_LAYOUT, parameters=None, lane_idx=0, start_s=0.0, chunk_rows=CHUNK_ROWS):
+    """Streams a log through alignment (and the model residual if `parameters`), yielding aligned chunks."""
+    circuit = Circuit(layout, lane_idx=lane_idx)
+    aligner = LaneAligner(circuit, start_s)
+    tracker = ResidualTracker(layout, parameters, lane_idx, start_s) if parameters is not None else None
+    for chunk in itertools.chain(readLog(path, chunk_rows), [None]):
+        aligned = aligner.flush() if chunk is None else aligner.feed(chunk)
+        if aligned is not None and len(aligned["t"]):
+            yield tracker.feed(aligned) if tracker else aligned
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log")
+    parser.add_argument("--lane", type=int, default=0)
+    parser.add_argument("--start-s", type=float, default=0.0, help="lane position of the car when the log starts")
+    parser.add_argument("--voltage", type=float, help="also compute the residual against car2 at this voltage")
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--out", help="write the aligned samples to this .npz (for the simulator overlay)")
+    args = parser.parse_args(argv)
+
+    parameters = midParameters(voltage=args.voltage) if args.voltage is not None else None
+    keep = ("t", "s", "yaw", "s_pred", "residual_s", "residual_yaw_rate")
+    writer = NpzWriter(args.out) if args.out else None
+    n, sq_s, sq_yaw = 0, 0.0, 0.0
+    for aligned in process(args.log, DEFAULT_LAYOUT, parameters, args.lane, args.start_s, args.chunk):
+        n += len(aligned["t"])
+        if parameters is not None:
+            sq_s += float(np.sum(aligned["residual_s"] ** 2))
+            sq_yaw += float(np.sum(aligned["residual_yaw_rate"] ** 2))
+        if writer:
+            writer.write({k: aligned[k] for k in keep if k in aligned})
+
+    print(f"{n} samples aligned")
+    if parameters is not None and n:
+        print(f"RMS residual: s {math.sqrt(sq_s / n):.3f} m, yaw rate {math.sqrt(sq_yaw / n):.3f} rad/s")
+    if writer:
+        writer.close()
+        print(f"aligned samples written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+The simulator modules import each other by name (from config import *), so
+the tests run with slotcar_track_sim/ on the path, as the tools do.
+
+    cd slotcar_track_sim && python -m pytest -q
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubCanvas:
+    """The tag bookkeeping of a Tk canvas, without a display."""
+
+    def __init__(self, width=800, height=600):
+        self.width, self.height = width, height
+        self.items = {}  # id -> set of tags
+        self.next_id = 1
+
+    def __getitem__(self, option):
+        return {"bg": "white"}[option]
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def create(self, *args, tags=(), **kwargs):
+        item = self.next_id
+        self.next_id += 1
+        self.items[item] = {tags} if isinstance(tags, str) else set(tags)
+        return item
+
+    create_line = create_polygon = create_arc = create_rectangle = create_text = create_oval = create_image = create
+
+    def find_withtag(self, tag):
+        if tag == "all":
+            return tuple(self.items)
+        if isinstance(tag, int):
+            return (tag,) if tag in self.items else ()
+        if tag.startswith("!"):
+            return tuple(i for i, tags in self.items.items() if tag[1:] not in tags)
+        return tuple(i for i, tags in self.items.items() if tag in tags)
+
+    def delete(self, tag):
+        for item in self.find_withtag(tag):
+            del self.items[item]
+
+    def addtag_withtag(self, new, tag):
+        for item in self.find_withtag(tag):
+            self.items[item].add(new)
+
+    def dtag(self, tag, remove=None):
+        for item in self.find_withtag(tag):
+            self.items[item].discard(remove or tag)
+
+    def tags(self):
+        return set().union(*self.items.values()) if self.items else set()
+
+    def move(self, tag, dx, dy):
+        pass
+
+    def tag_raise(self, tag, above=None):
+        pass
+
+    def tag_lower(self, tag, below=None):
+        pass
+
+
+@pytest.fixture
+def canvas():
+    return StubCanvas()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import bisect
+import time
+
+from config import *
+from track import *
+from physics_worker import PhysicsWorker
+from simulation import Simulation
+from validate import circuitClosure, validateCircuit
+
+
+def pieceAt(circuit, s):
+    """(piece, distance into it) at lane position s."""
+    entries = circuit.piecewise_curvature.piece
+    x = s % circuit.getLength()
+    i = bisect.bisect_right([e[1] for e in entries], x) - 1
+    return circuit.pieces[i], x - entries[i][1]
+
+
+def test_splice_keeps_the_car_on_its_piece():
+    sim = Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=4))
+    sim.run(150)
+    car = sim.cars[0]
+    piece, into = pieceAt(sim.circuit, car.s)
+    i = sim.circuit.pieces.index(piece)
+    state = car.getState()
+
+    # upstream of the car: it moves along s by the inserted length, still on its piece
+    sim.splice(i, i, [(C8205Track, None)])
+    assert pieceAt(sim.circuit, car.s)[0] is piece
+    assert abs(pieceAt(sim.circuit, car.s)[1] - into) < 1e-9
+    assert car.getState()[4:] == state[4:]  # v, slip angle, derailed
+
+    # downstream of the car: still at the same place
+    sim.splice(i + 3, i + 4, [])
+    assert pieceAt(sim.circuit, car.s)[0] is piece
+    assert abs(pieceAt(sim.circuit, car.s)[1] - into) < 1e-9
+    sim.run(10)
+    assert sim.tick_count == 160
+
+
+def test_editor_closure_matches_the_validator():
+    circuit = Circuit()
+    circuit.flipPiece(2)
+    closed, closure_error, heading_error, _ = circuitClosure(circuit)
+    report = validateCircuit(circuit)
+    assert not closed and not report["closed"]
+    assert closure_error == report["closure_error_m"]
+    assert heading_error == report["heading_error_rad"]
+
+
+def test_worker_applies_edits_without_restarting():
+    worker = PhysicsWorker(DEFAULT_LAYOUT, 1, midParameters(voltage=4))
+    worker.start()
+    try:
+        deadline = time.time() + 5
+        while worker.read()[0] < 20 and time.time() < deadline:
+            time.sleep(0.01)
+        tick, _ = worker.read()
+        worker.sendSplice(len(DEFAULT_LAYOUT), len(DEFAULT_LAYOUT), [(C8205Track, None)])
+        time.sleep(0.1)
+        assert worker.worker.is_alive()
+        assert worker.read()[0] > tick  # still counting from the same run
+    finally:
+        worker.stop()
+
+
+def test_lane_length_error_fails_the_report(monkeypatch):
+    # curves put the outer lane 1 mm closer to the inner one than straights do,
+    # which costs 2 pi mm of lane length per turn
+    import validate
+
+    monkeypatch.setattr(validate, "JOINT_TOLERANCE", 1e-2)
+    report = validateCircuit(Circuit())
+    assert report["closed"] and abs(report["lane_length_error_m"]) > 1e-3
+    assert not report["ok"]
+    monkeypatch.setattr(validate, "LANE_LENGTH_TOLERANCE", 1e-2)
+    assert validateCircuit(Circuit())["ok"]
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""The fast paths against the plain car2 / Simulation ticks they stand in for."""
+
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+import checkpoint
+import kernel
+from config import *
+from track import *
+from checkpoint import Snapshot, fork, loopSummary, whatIf
+from identify import BatchCar
+from race import RESLOT_TIME, Race
+from scheduler import ClosedLoop
+from simulation import Simulation
+
+TICKS = 1500
+TRAJECTORIES = {
+    "grip": midParameters(voltage=3),
+    "slip": midParameters(voltage=5),
+    "derail": midParameters(voltage=4, max_energy=0),
+}
+
+
+def carStates(parameters, ticks=TICKS, dt=deltat):
+    sim = Simulation(DEFAULT_LAYOUT, 1, parameters)
+    states = []
+    for _ in range(ticks):
+        sim.cars[0].tick(dt)
+        states.append(sim.cars[0].getState())
+    return np.array(states)
+
+
+@pytest.fixture(scope="module")
+def plainKernel():
+    """kernel.py imported again with AUTOSLOT_JIT=0, the pure Python path."""
+    previous = os.environ.get("AUTOSLOT_JIT")
+    os.environ["AUTOSLOT_JIT"] = "0"
+    try:
+        spec = importlib.util.spec_from_file_location("kernel_plain", kernel.__file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if previous is None:
+            del os.environ["AUTOSLOT_JIT"]
+        else:
+            os.environ["AUTOSLOT_JIT"] = previous
+    assert not module.JIT_ENABLED
+    return module
+
+
+def test_trajectories_cover_grip_slip_and_derailment():
+    grip, slip, derail = (carStates(p) for p in TRAJECTORIES.values())
+    assert not grip[:, 5].any()
+    assert np.abs(slip[:, 5]).max() > 0.1 and not slip[-1, 6]
+    assert derail[-1, 6]
+
+
+def test_car2_constants_are_shared_not_copied():
+    import car2
+    import identify
+    import layout_search
+    import race
+    import steady
+
+    for module in (kernel, identify, layout_search, race, steady):
+        for name in ("CAR_A", "CAR_B", "R_MOTOR", "MAX_SLIP", "DERAIL_SLIP", "MAX_SLIP_RATE", "MAX_ACCEL", "MAX_V"):
+            if hasattr(module, name):
+                assert getattr(module, name) is getattr(car2, name), f"{module.__name__}.{name}"
+
+
+def test_kernel_reads_car2_constants_at_run_time():
+    # not frozen into the compiled (and disk cached) kernel: a retuned car2 is followed
+    car = Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=12, static_f=2)).cars[0]
+    tick_kernel = kernel.TickKernel(Circuit())
+    p = kernel.packParameters(car)
+    p[kernel.P_MAX_V] = 1.0
+    state = np.array(car.getState(), dtype=float)
+    kernel.runTicks(tick_kernel.lane, tick_kernel.length, p, state, 200, deltat, 200)
+    assert state[4] == 1.0
+
+
+@pytest.mark.parametrize("case", sorted(TRAJECTORIES))
+@pytest.mark.parametrize("path", ["default", "plain"])
+def test_kernel_is_bit_compatible_with_car_tick(case, path, plainKernel):
+    module = kernel if path == "default" else plainKernel
+    expected = carStates(TRAJECTORIES[case])
+    car = Simulation(DEFAULT_LAYOUT, 1, TRAJECTORIES[case]).cars[0]
+    trajectory = module.TickKernel(Circuit()).run(car, TICKS, every=1)
+    assert np.array_equal(trajectory, expected)
+    assert car.getState() == tuple(expected[-1])
+
+
+@pytest.mark.parametrize("case", sorted(TRAJECTORIES))
+def test_batch_car_matches_car_tick(case):
+    expected = carStates(TRAJECTORIES[case])
+    cars = BatchCar(Circuit(), TRAJECTORIES[case])
+    s, v, slip, derailed = [], [], [], []
+    for _ in range(TICKS):
+        cars.tick(deltat)
+        s.append(cars.s[0])
+        v.append(cars.v[0])
+        slip.append(cars.slip_angle[0])
+        derailed.append(cars.derailed[0])
+    # the same operations, regrouped into per-set constants
+    assert np.allclose(s, expected[:, 0], rtol=0, atol=1e-9)
+    assert np.allclose(v, expected[:, 4], rtol=0, atol=1e-9)
+    assert np.allclose(slip, expected[:, 5], rtol=0, atol=1e-9)
+    assert np.array_equal(derailed, expected[:, 6].astype(bool))
+
+
+@pytest.mark.parametrize("case", sorted(TRAJECTORIES))
+def test_one_car_race_is_the_simulation(case):
+    race = Race(DEFAULT_LAYOUT, 1, TRAJECTORIES[case])
+    sim = Simulation(DEFAULT_LAYOUT, 1, TRAJECTORIES[case])
+    for _ in range(TICKS):
+        race.step()
+        sim.step()
+        if race.racers[0].derailed_at is None and sim.cars[0].derailed:
+            break  # the race put the car back on the slot, RESLOT_TIME after it derailed
+        assert race.cars[0].getState() == sim.cars[0].getState()
+    assert sim.tick_count > RESLOT_TIME / deltat
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_fork_matches_a_run_from_tick_0(processes):
+    prefix, suffix, targets = 5.0, 3.0, [15.0, 30.0]
+    loop = ClosedLoop(Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=0.0)), target_ay=20.0)
+    loop.run(prefix)
+    snapshot = Snapshot(Snapshot.capture(loop.sim, loop=loop).data)  # as a saved file reads back
+    results = fork(snapshot, [{"target_ay": t, "duration": suffix} for t in targets], whatIf, processes)
+
+    for target, result in zip(targets, results):
+        loop = ClosedLoop(Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=0.0)), target_ay=20.0)
+        loop.run(snapshot.tick_count * deltat)
+        loop.controller.target_ay = target
+        loop.run(suffix)
+        assert result == loopSummary(loop, snapshot.tick_count * deltat)
+
+
+def test_fork_keeps_the_periods_and_target_of_the_checkpointed_loop(tmp_path, capsys):
+    prefix, suffix = 2.0, 1.0
+    loop = ClosedLoop(Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=0.0)), physics=0.0005, target_ay=25.0)
+    loop.run(prefix)
+    snapshot = Snapshot(Snapshot.capture(loop.sim, loop=loop).data)
+    (result,) = fork(snapshot, [{"target_ay": 15.0, "duration": suffix}], whatIf, 1)
+
+    loop = ClosedLoop(Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=0.0)), physics=0.0005, target_ay=25.0)
+    loop.run(prefix)
+    loop.controller.target_ay = 15.0
+    loop.run(suffix)
+    assert snapshot.tick_count == round(prefix / 0.0005)
+    assert result == loopSummary(loop, prefix)
+
+    # --check repeats the prefix as it was run, whatever the current --target-ay and --physics
+    path = str(tmp_path / "prefix.ckpt")
+    snapshot.save(path)
+    checkpoint.main(["--load", path, "--suffix", str(suffix), "--targets", "15", "--target-ay", "40", "--check"])
+    assert "check from tick 0: identical" in capsys.readouterr().out
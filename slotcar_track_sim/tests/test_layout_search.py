@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import random
+
+import layout_search
+from config import *
+from track import *
+from layout_search import LayoutSearch
+from validate import circuitClosure
+
+
+def test_the_reach_table_prunes_without_losing_layouts(monkeypatch):
+    plain = LayoutSearch(10)
+    expected = set(plain.enumerateLayouts())
+    monkeypatch.setattr(layout_search, "REACH_MIN_PIECES", 10)
+    pruned = LayoutSearch(10)
+    assert pruned.reach
+    assert set(pruned.enumerateLayouts()) == expected
+    assert pruned.nodes < plain.nodes
+
+
+def test_samples_are_closed_layouts():
+    search = LayoutSearch(24)
+    rng = random.Random(0)
+    found = [seq for seq in (search.sample(rng) for _ in range(300)) if seq is not None]
+    assert found
+    for seq in found[:5]:
+        closed = circuitClosure(Circuit(search.table.layout(seq)))[0]
+        assert closed
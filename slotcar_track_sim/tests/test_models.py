@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import math
+
+import pytest
+
+from config import *
+from track import *
+from models import MODELS, STATE_FIELDS, getModel
+from simulation import Simulation
+
+
+@pytest.mark.parametrize("name", sorted(MODELS))
+def test_every_model_has_the_registry_interface(name):
+    sim = Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=6), model=name)
+    car = sim.cars[0]
+    sim.run(50)
+    for method in ("tick", "updateParameters", "motorForce", "draw", "getState", "setState"):
+        assert callable(getattr(getModel(name), method))
+    assert not hasattr(car, "STATE_FIELDS")  # models.STATE_FIELDS is the only definition
+
+    state = car.getState()
+    assert len(state) == len(STATE_FIELDS)
+    assert math.isfinite(car.motorForce()) and car.motorForce() > 0
+
+    car.tick(deltat)
+    car.setState(state)
+    assert car.getState() == state
+
+
+@pytest.mark.parametrize("name", sorted(MODELS))
+def test_a_restored_derailed_car_keeps_ticking(name):
+    # e.g. a car derailed by a collision in race.py, or a checkpoint taken after a derailment
+    car = Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=3), model=name).cars[0]
+    s, x, y, b, v, slip, _ = car.getState()
+    car.setState((s, x, y, 1.0, 0.5, slip, 1.0))
+    car.tick(deltat)
+    s, x2, y2, _, _, _, derailed = car.getState()
+    assert derailed and all(math.isfinite(value) for value in car.getState())
+    assert (x2, y2) != (x, y)
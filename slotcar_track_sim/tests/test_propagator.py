@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""SegmentPropagator against ticking every tick with the kernel."""
+
+import pytest
+
+import kernel
+from config import *
+from track import *
+from propagator import SegmentPropagator
+from simulation import Simulation
+
+CASES = {
+    # (parameters, dt, ticks)
+    "grip fine": (midParameters(voltage=4, static_f=3), 1e-4, 300000),
+    "grip": (midParameters(voltage=3), deltat, 3000),
+    "slip fine": (midParameters(voltage=5), 1e-4, 100000),
+    "slip": (midParameters(voltage=5), deltat, 3000),
+    "derail": (midParameters(voltage=4, max_energy=0), deltat, 3000),
+}
+
+
+def tickedRun(parameters, dt, ticks):
+    """Lap completion ticks and final state of the plain kernel."""
+    sim = Simulation(DEFAULT_LAYOUT, 1, parameters)
+    trajectory = kernel.TickKernel(sim.circuit).run(sim.cars[0], ticks, dt=dt, every=1)
+    length = sim.circuit.getLength()
+    s, derailed = trajectory[:, 0], trajectory[:, 6].astype(bool)
+    laps, lap_ticks = 0, []
+    for tick in range(ticks):
+        if not derailed[tick] and s[tick] >= (laps + 1) * length:
+            laps += 1
+            lap_ticks.append(tick + 1)
+    return lap_ticks, sim.cars[0].getState()
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_propagator_matches_ticking(case):
+    parameters, dt, ticks = CASES[case]
+    lap_ticks, expected = tickedRun(parameters, dt, ticks)
+    sim = Simulation(DEFAULT_LAYOUT, 1, parameters)
+    propagator = SegmentPropagator(sim.circuit, dt)
+    laps = propagator.run(sim.cars[0], ticks)
+
+    assert [round(t / dt) for t in laps] == lap_ticks
+    state = sim.cars[0].getState()
+    if not state[6]:
+        # a derailed car stops being ticked once it stands still
+        assert propagator.jumped_ticks + propagator.stepped_ticks == ticks
+    assert state[6] == expected[6]  # derailed
+    assert state[5] == pytest.approx(expected[5], abs=1e-9)  # slip angle
+    assert state[4] == pytest.approx(expected[4], abs=1e-9)  # v
+    assert state[0] == pytest.approx(expected[0], abs=1e-6)  # s
+    assert state[1:3] == pytest.approx(expected[1:3], abs=1e-6)  # x, y
+
+
+def test_grip_runs_are_jumped_at_fine_steps():
+    parameters, dt, ticks = CASES["grip fine"]
+    sim = Simulation(DEFAULT_LAYOUT, 1, parameters)
+    propagator = SegmentPropagator(sim.circuit, dt)
+    propagator.run(sim.cars[0], ticks)
+    assert propagator.jumped_ticks > 0.9 * ticks
+    assert propagator.jumps < ticks / 100
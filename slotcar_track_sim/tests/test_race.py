@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from config import *
+from track import *
+from race import Race
+
+
+def test_laps_are_timed_from_the_line_not_the_grid():
+    race = Race(DEFAULT_LAYOUT, 6, midParameters(voltage=3))
+    for _ in range(int(10 / deltat)):
+        race.step()
+    for racer in race.racers:
+        laps = racer.laps()
+        if racer.grid_s == 0:
+            assert laps[0] == pytest.approx(racer.lap_times[0])
+            assert len(laps) == len(racer.lap_times)
+        else:
+            # the first crossing ends the partial lap from the grid, which is no lap
+            assert racer.lap_times[0] < min(laps)
+            assert len(laps) == len(racer.lap_times) - 1
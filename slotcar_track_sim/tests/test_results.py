@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+
+import pytest
+
+import results
+from config import *
+from track import *
+from results import RUN_SOURCES, runKey
+
+
+@pytest.mark.parametrize("module", RUN_SOURCES + ("car2",))
+def test_editing_a_run_source_changes_the_key(module, monkeypatch):
+    parameters = midParameters(voltage=6)
+    key = runKey(DEFAULT_LAYOUT, parameters, 10.0)
+    path = importlib.util.find_spec(module).origin
+    monkeypatch.setitem(results._versions, path, "edited")
+    assert runKey(DEFAULT_LAYOUT, parameters, 10.0) != key
+
+
+def test_steady_runs_depend_on_steady_py(monkeypatch):
+    parameters = midParameters(voltage=6)
+    plain, steady = runKey(DEFAULT_LAYOUT, parameters, 10.0), runKey(DEFAULT_LAYOUT, parameters, 10.0, steady=True)
+    assert plain != steady
+    monkeypatch.setitem(results._versions, importlib.util.find_spec("steady").origin, "edited")
+    assert runKey(DEFAULT_LAYOUT, parameters, 10.0) == plain
+    assert runKey(DEFAULT_LAYOUT, parameters, 10.0, steady=True) != steady
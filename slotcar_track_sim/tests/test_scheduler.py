@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from config import *
+from track import *
+from scheduler import ClosedLoop, MultiRateScheduler, Task
+from simulation import Simulation
+
+
+def quietLoop(physics, duration, batch=True):
+    """The demo loop with the IMU noise off, logging ax and the speed at every IMU sample."""
+    loop = ClosedLoop(Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=0.0)), physics=physics)
+    loop.imu.gyro_noise = loop.imu.accel_noise = 0.0
+    loop.tasks[0].batch = batch
+    samples = []
+    sample = loop.imu.sample
+
+    def logged(t, n=1):
+        sample(t, n)
+        samples.append((t, loop.imu.ax, loop.car.v))
+
+    loop.tasks[1].callback = logged
+    loop.run(duration)
+    return loop, samples
+
+
+@pytest.mark.parametrize("physics", [deltat, 0.0005, 0.0001])
+def test_imu_ax_stays_within_the_acceleration_clamp(physics):
+    _, samples = quietLoop(physics, 2.0)
+    assert max(abs(ax) for _, ax, _ in samples) <= 30.0 + 1e-6  # car2.Car.tick
+
+
+def test_imu_ax_holds_the_last_physics_step_between_ticks():
+    # physics at 10 ms under the 1 ms IMU: the speed only changes every 10th sample
+    _, samples = quietLoop(deltat, 2.0)
+    speeds = {round(t * 1000): v for t, _, v in samples}
+    for t, ax, _ in samples:
+        last = round(t * 1000) // 10 * 10  # ms of the last physics step
+        if last >= 20:
+            assert ax == pytest.approx((speeds[last] - speeds[last - 10]) / deltat, abs=1e-9)
+    assert sum(1 for _, ax, _ in samples if ax != 0) > 0.9 * len(samples)
+
+
+def test_batched_physics_matches_one_call_per_period():
+    batched, _ = quietLoop(0.0001, 3.0)
+    single, _ = quietLoop(0.0001, 3.0, batch=False)
+    physics = batched.tasks[0]
+    assert physics.periods == single.tasks[0].periods == 30000
+    assert physics.calls < physics.periods / 5
+    assert batched.car.getState() == single.car.getState()
+    assert batched.laps == pytest.approx(single.laps, abs=1e-9)
+
+
+def test_batch_runs_through_a_shared_instant_it_goes_first_at():
+    log = []
+    fast = Task("physics", 0.0001, lambda t, n: log.append(("physics", round(t, 6), n)), Task.PHYSICS, batch=True)
+    slow = Task("imu", 0.001, lambda t, n: log.append(("imu", round(t, 6), n)), Task.SENSOR)
+    MultiRateScheduler([fast, slow]).run(0.003)
+    assert log == [
+        ("physics", 0.001, 10),
+        ("imu", 0.001, 1),
+        ("physics", 0.002, 10),
+        ("imu", 0.002, 1),
+        ("physics", 0.003, 10),
+        ("imu", 0.003, 1),
+    ]
+
+
+def test_render_records_offscreen_frames(tmp_path):
+    from offscreen import load_telemetry
+    from scheduler import main
+
+    loop = ClosedLoop(Simulation(DEFAULT_LAYOUT, 1, midParameters(voltage=0.0)))
+    loop.run(1.0)
+    assert len(loop.frames) == loop.tasks[3].periods == int(1.0 / loop.frameDt())
+    s = [frame[0][0] for frame in loop.frames]  # the car moves on between frames
+    assert s == sorted(s) and s[0] < s[-1] <= loop.car.s
+
+    path = str(tmp_path / "loop.json")
+    main(["--duration", "1", "--telemetry", path])
+    layout, frames, frame_dt = load_telemetry(path)
+    assert len(frames) == len(loop.frames)
+    assert frame_dt == loop.frameDt()
+    assert frames[-1] == [list(state) for state in loop.frames[-1]]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+from config import *
+from track import *
+from server import COMMAND_LIMIT, ERROR, HELLO, REPLY, STATE, SimulationServer, readMessage
+
+
+def exchange(lines):
+    """Sends `lines` to a fresh server and returns the replies, in order."""
+
+    async def run():
+        server = SimulationServer(DEFAULT_LAYOUT, 1, midParameters(voltage=4), rate=100)
+        server.physics.start()
+        listener = await asyncio.start_server(server.handleClient, "127.0.0.1", 0, limit=COMMAND_LIMIT)
+        broadcast = asyncio.create_task(server.broadcast())
+        try:
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            kind, _ = await readMessage(reader)
+            assert kind == HELLO
+            replies = []
+            for line in lines:
+                writer.write(line + b"\n")
+                while True:
+                    kind, body = await asyncio.wait_for(readMessage(reader), 5)
+                    if kind == REPLY:
+                        replies.append(json.loads(body))
+                        break
+                    assert kind == STATE
+            writer.close()
+            return replies
+        finally:
+            broadcast.cancel()
+            listener.close()
+            server.physics.stop()
+
+    return asyncio.run(run())
+
+
+def test_commands_update_parameters():
+    replies = exchange([b'{"voltage": 7.5}', b'{"parameters": {"mass": 90}}'])
+    assert replies[0]["ok"] and replies[0]["parameters"]["voltage"] == 7.5
+    assert replies[1]["ok"] and replies[1]["parameters"]["mass"] == 90
+
+
+def test_bad_commands_get_an_error_and_keep_the_connection():
+    replies = exchange(
+        [
+            b"[1, 2]",
+            b'{"parameters": [1]}',
+            b'{"warp": 9}',
+            b"not json",
+            b'{"voltage": "' + b"9" * (2 * COMMAND_LIMIT) + b'"}',
+            b'{"voltage": 5}',
+        ]
+    )
+    assert [reply["ok"] for reply in replies] == [False] * 5 + [True]
+    assert "JSON object" in replies[0]["error"]
+    assert "longer than" in replies[4]["error"]
+
+
+def test_values_outside_the_slider_range_are_rejected():
+    replies = exchange(
+        [b'{"mass": 0}', b'{"voltage": "nan"}', b'{"voltage": "inf"}', b'{"voltage": -1}', b'{"voltage": 12}']
+    )
+    assert [reply["ok"] for reply in replies] == [False] * 4 + [True]
+    assert "mass" in replies[0]["error"]
+
+
+def test_clients_are_told_when_the_physics_worker_dies():
+    async def run():
+        server = SimulationServer(DEFAULT_LAYOUT, 1, midParameters(voltage=4), rate=100)
+        server.physics.start()
+        listener = await asyncio.start_server(server.handleClient, "127.0.0.1", 0, limit=COMMAND_LIMIT)
+        broadcast = asyncio.create_task(server.broadcast())
+        try:
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            kind, _ = await readMessage(reader)
+            assert kind == HELLO
+            # past the command check: a zero mass kills the tick
+            server.physics.sendParameters(dict(server.parameters, mass=0.0))
+            while True:
+                kind, body = await asyncio.wait_for(readMessage(reader), 5)
+                if kind == ERROR:
+                    break
+                assert kind == STATE
+            writer.write(b'{"voltage": 5}\n')
+            kind, reply = await asyncio.wait_for(readMessage(reader), 5)
+            writer.close()
+            return json.loads(body), kind, json.loads(reply)
+        finally:
+            broadcast.cancel()
+            listener.close()
+            server.physics.stop()
+
+    error, kind, reply = asyncio.run(run())
+    assert "stopped" in error["error"]
+    assert kind == REPLY and not reply["ok"]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+
+import telemetry
+from config import *
+from track import *
+from telemetry import LaneAligner, NpzWriter, process, readLog
+
+RATE = 1000  # Hz
+SPEED = 1.0  # m/s
+
+
+def writeLog(path, still_before=0.5, laps=2.0, still_after=0.0):
+    """A synthetic CSV log of a car at SPEED on lane 0, still before and after, and its true s."""
+    circuit = Circuit()
+    length = circuit.getLength()
+    drive = laps * length / SPEED
+    t = np.arange(int((still_before + drive + still_after) * RATE)) / RATE
+    s = np.clip(t - still_before, 0, drive) * SPEED
+    moving = (t > still_before) & (t < still_before + drive)
+    gz = np.array([SPEED * circuit.piecewise_curvature.get(x % length) if m else 0.0 for x, m in zip(s, moving)])
+    with open(path, "w") as f:
+        f.write("t,gx,gy,gz\n")
+        for row in zip(t, gz):
+            f.write(f"{row[0]:.6f},0,0,{math.degrees(row[1]):.9f}\n")
+    return t, s
+
+
+def aligned(path, chunk_rows):
+    chunks = list(process(str(path), chunk_rows=chunk_rows))
+    return {k: np.concatenate([c[k] for c in chunks]) for k in ("t", "s")}
+
+
+def test_alignment_follows_the_car_and_does_not_depend_on_chunking(tmp_path):
+    path = tmp_path / "run.csv"
+    t, s = writeLog(path)
+    small, large = aligned(path, 97), aligned(path, 65536)
+    assert np.array_equal(small["t"], t)
+    assert np.allclose(small["s"], large["s"], atol=1e-9)
+    # from the first curve to the last (outside them, s is interpolated from the ends of the log)
+    assert np.abs(small["s"] - s)[(t > 1.0) & (t < t[-1] - 0.1)].max() < 1e-3
+
+
+def test_a_still_car_keeps_the_pending_window_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "MAX_PENDING_ROWS", 1000)
+    path = tmp_path / "still.csv"
+    t, s = writeLog(path, still_before=0.5, laps=0.5, still_after=5.0)
+    aligner = LaneAligner(Circuit())
+    n = 0
+    for chunk in readLog(str(path), 100):
+        out = aligner.feed(chunk)
+        n += 0 if out is None else len(out["t"])
+        assert aligner.pending_rows <= 1000 + 100
+        assert sum(len(c["t"]) for c in aligner.pending) == aligner.pending_rows
+    n += len(aligner.flush()["t"])
+    assert n == len(t)
+
+
+def test_npz_writer_matches_savez(tmp_path):
+    rng = np.random.default_rng(0)
+    columns = {"t": rng.random(1000), "n": rng.integers(0, 9, 1000)}
+    writer = NpzWriter(str(tmp_path / "streamed.npz"))
+    for i in range(0, 1000, 300):
+        writer.write({k: v[i : i + 300] for k, v in columns.items()})
+    writer.close()
+    with np.load(tmp_path / "streamed.npz") as data:
+        assert set(data.files) == set(columns)
+        for k, v in columns.items():
+            assert data[k].dtype == v.dtype and np.array_equal(data[k], v)
+    assert [p.name for p in tmp_path.iterdir()] == ["streamed.npz"]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from track import *
+from track_layer import TAG, TrackLayer, pieceTag
+
+
+def pieceTags(canvas):
+    return {tag for tag in canvas.tags() if tag.startswith("piece")}
+
+
+def test_redraw_only_edited_pieces(canvas):
+    layer = TrackLayer(canvas)
+    circuit = Circuit()
+    assert layer.draw(circuit)
+    untouched = canvas.find_withtag(pieceTag(circuit.pieces[0]))
+
+    removed, changed = circuit.flipPiece(len(circuit.pieces) - 1)
+    layer.update(removed, changed)
+    assert pieceTags(canvas) == {pieceTag(t) for t in circuit.pieces}
+    assert canvas.find_withtag(pieceTag(circuit.pieces[0])) == untouched
+
+
+def test_reset_then_edit_draws_the_new_circuit(canvas):
+    layer = TrackLayer(canvas)
+    old = Circuit()
+    layer.draw(old)
+
+    # "Reset Simulation": a new Circuit of the same layout hits the cache
+    new = Circuit(old.layout)
+    items = set(canvas.find_withtag(TAG))
+    assert not layer.draw(new)
+    assert set(canvas.find_withtag(TAG)) == items
+    assert pieceTags(canvas) == {pieceTag(t) for t in new.pieces}
+
+    removed, changed = new.insertPiece(3, C8205Track)
+    layer.update(removed, changed)
+    assert pieceTags(canvas) == {pieceTag(t) for t in new.pieces}
+    assert not pieceTags(canvas) & {pieceTag(t) for t in old.pieces}
+    for t in changed:
+        assert canvas.find_withtag(pieceTag(t))
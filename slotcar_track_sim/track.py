@@ -4,9 +4,10 @@ Created on Fri Oct 17 09:06:36 2025
 
 @author: 2016570
 """
+import itertools
 import math
-import numpy as np
 from config import *
+from viewport import DEFAULT_VIEW, pointsBounds
 
 LANE_SPACING = 78/1000        # center-to-center between lanes 
 RAIL_SPACING = 10/1000         # rail center-to-center distance
@@ -35,21 +36,13 @@ class Track:
         return x,y
 
 
-class CurvaturePiecewiseFunction:
+class PiecewiseFunction:
+    # piece entries are tuples starting with (curvature, start, end)
     def __init__(self):
-        self.piece = [] # curvature , start, end
-        
+        self.piece = []
         
     def appendTrack(self, o, t):
-        if (len(self.piece) == 0):
-            start = 0
-        else:
-            start = self.piece[-1][2] # previous end
-            
-        c = o.getLaneCurvature(t)
-        end = start + o.getLaneLength(t)
-        
-        self.piece.append((c, start, end))
+        self.piece.append(self.makeEntry(o, t, self.getLength()))
 
     def getLength(self):
         if (len(self.piece) == 0):
@@ -58,6 +51,30 @@ class CurvaturePiecewiseFunction:
             start = self.piece[-1][2] # previous end
         return start
     
+    def spliceTracks(self, first, last, tracks, t):
+        # replaces the entries [first, last) with those of `tracks` and shifts the
+        # parametric range of the entries after them, which are otherwise unchanged
+        start = self.piece[first - 1][2] if first > 0 else 0
+        entries = []
+        for o in tracks:
+            entries.append(self.makeEntry(o, t, start))
+            start = entries[-1][2]
+        
+        tail = self.piece[last:]
+        if tail and tail[0][1] != start:
+            delta = start - tail[0][1]
+            tail = [(e[0], e[1] + delta, e[2] + delta) + e[3:] for e in tail]
+        self.piece[first:] = entries + tail
+
+
+class CurvaturePiecewiseFunction(PiecewiseFunction):
+    # entries: curvature, start, end
+        
+    def makeEntry(self, o, t, start):
+        c = o.getLaneCurvature(t)
+        end = start + o.getLaneLength(t)
+        return (c, start, end)
+    
     def get(self, x):
         l = self.getLength()
         
@@ -70,30 +87,14 @@ class CurvaturePiecewiseFunction:
             
         raise Exception('x = ', x)
 
-class AnglePiecewiseFunction:
-    def __init__(self):
-        self.piece = [] # curvature , start, end
-        
+class AnglePiecewiseFunction(PiecewiseFunction):
+    # entries: curvature, start, end, initial angle
         
-    def appendTrack(self, o, t):
+    def makeEntry(self, o, t, start):
         a0 = o.angle
-        
-        if (len(self.piece) == 0):
-            start = 0
-        else:
-            start = self.piece[-1][2] # previous end
-            
         c = o.getLaneCurvature(t)
         end = start + o.getLaneLength(t)
-        
-        self.piece.append((c, start, end, a0))
-
-    def getLength(self):
-        if (len(self.piece) == 0):
-            start = 0
-        else:
-            start = self.piece[-1][2] # previous end
-        return start
+        return (c, start, end, a0)
     
     def get(self, x):
         l = self.getLength()
@@ -109,30 +110,15 @@ class AnglePiecewiseFunction:
             
         raise Exception('x = ', x)        
         
-class PositionPiecewiseFunction:
-    def __init__(self):
-        self.piece = [] # curvature , parametric start, parametric end, x start, y start, initial angle
+class PositionPiecewiseFunction(PiecewiseFunction):
+    # entries: curvature , parametric start, parametric end, x start, y start, initial angle
         
-    def appendTrack(self, o, t):
+    def makeEntry(self, o, t, start):
         x0, y0 = o.getLaneStart(t)
         a0 = o.angle
-        
-        if (len(self.piece) == 0):
-            start = 0
-        else:
-            start = self.piece[-1][2] # previous end
-            
         c = o.getLaneCurvature(t)
         end = start + o.getLaneLength(t)
-        
-        self.piece.append((c, start, end, x0, y0, a0))
-
-    def getLength(self):
-        if (len(self.piece) == 0):
-            start = 0
-        else:
-            start = self.piece[-1][2] # previous end
-        return start
+        return (c, start, end, x0, y0, a0)
     
     def get(self, x):
         l = self.getLength()
@@ -168,21 +154,38 @@ class StraighTrack(Track):
         ny = (self.y + self.TRACK_LENGTH * math.sin(rads)) 
         return nx, ny, self.angle
         
+    def getBounds(self):
+        # world bounding box (xmin, ymin, xmax, ymax) of the piece, for culling
+        rads = self.angle
+        corners = []
+        for dx, dy in [(0, 0), (self.TRACK_LENGTH, 0), (self.TRACK_LENGTH, TRACK_WIDTH), (0, TRACK_WIDTH)]:
+            corners.append((self.x + dx * math.cos(rads) - dy * math.sin(rads),
+                            self.y + dx * math.sin(rads) + dy * math.cos(rads)))
+        return pointsBounds(corners)
+        
     def getLaneCurvature(self, t):
         return 0
     
     def getLaneLength(self, t):
         return self.TRACK_LENGTH
     
-    def draw(self, canvas):
+    def draw(self, canvas, tags="track", view=DEFAULT_VIEW):
         lane1_center_y = (TRACK_WIDTH - LANE_SPACING) / 2
         lane2_center_y = lane1_center_y + LANE_SPACING
         self.lanes_y = [lane1_center_y, lane2_center_y]
         
         rads = self.angle 
+        cos_a, sin_a = math.cos(rads), math.sin(rads)
         
         # Get the rotation center (x0, y0) in pixels
-        x0, y0 = m_to_px(canvas, self.x, self.y)
+        x0, y0 = view.m_to_px(canvas, self.x, self.y)
+        ppm = view.pixels_per_meter
+        
+        def to_px(dx, dy):
+            # rotate a point of the piece frame and convert it to pixels relative to (x0, y0)
+            rotated_dx = dx * cos_a - dy * sin_a
+            rotated_dy = dx * sin_a + dy * cos_a
+            return x0 + rotated_dx * ppm, y0 - rotated_dy * ppm
         
         # Calculate the four corners of the track rectangle relative to (x0, y0)
         corners_rel = [
@@ -192,82 +195,58 @@ class StraighTrack(Track):
             (0, TRACK_WIDTH)  # bottom-left
         ]
         
-        # Rotate corners and convert to pixel coordinates
         rotated_corners = []
         for dx, dy in corners_rel:
-            # Apply rotation relative to (0,0)
-            rotated_dx = dx * math.cos(rads) - dy * math.sin(rads)
-            rotated_dy = dx * math.sin(rads) + dy * math.cos(rads)
-            # Translate to pixel coordinates (already includes x0, y0 as base)
-            px = x0 + m_to_px(canvas, rotated_dx, rotated_dy)[0] - m_to_px(canvas, 0, 0)[0]
-            py = y0 + m_to_px(canvas, rotated_dx, rotated_dy)[1] - m_to_px(canvas, 0, 0)[1]
-            rotated_corners.extend([px, py])
+            rotated_corners.extend(to_px(dx, dy))
         
         # Draw track background (rotated rectangle)
-        canvas.create_polygon(rotated_corners, fill="gray20", outline="black", width=2)
+        canvas.create_polygon(rotated_corners, fill="gray20", outline="black", width=2, tags=tags)
         
-        w_rails = sm_to_px(RAIL_WIDTH)
-        w_slot = sm_to_px(SLOT_WIDTH)
+        # level of detail: rails and slots only when they are visible as such
+        if not view.showDetail(RAIL_SPACING):
+            return
+        
+        w_rails = view.sm_to_px(RAIL_WIDTH)
+        w_slot = view.sm_to_px(SLOT_WIDTH)
         
         # === Draw lanes (slots + rails) ===
         for lane_y in self.lanes_y:
-            # Define points along the track for slot and rails
-            slot_points = []
-            rail1_points = []
-            rail2_points = []
-            
-            # Create points along the track length (start and end)
-            for x_offset in [0, self.TRACK_LENGTH]:
-                # Slot points
-                slot_x = x_offset
-                slot_y = lane_y
-                # Rotate slot points relative to (0,0)
-                rotated_slot_x = slot_x * math.cos(rads) - slot_y * math.sin(rads)
-                rotated_slot_y = slot_x * math.sin(rads) + slot_y * math.cos(rads)
-                # Convert to pixel coordinates relative to x0, y0
-                px = x0 + m_to_px(canvas, rotated_slot_x, rotated_slot_y)[0] - m_to_px(canvas, 0, 0)[0]
-                py = y0 + m_to_px(canvas, rotated_slot_x, rotated_slot_y)[1] - m_to_px(canvas, 0, 0)[1]
-                slot_points.extend([px, py])
-                
-                # Rail 1 points (above slot)
-                rail1_y = lane_y - RAIL_SPACING / 2
-                rotated_rail1_x = x_offset * math.cos(rads) - rail1_y * math.sin(rads)
-                rotated_rail1_y = x_offset * math.sin(rads) + rail1_y * math.cos(rads)
-                px = x0 + m_to_px(canvas, rotated_rail1_x, rotated_rail1_y)[0] - m_to_px(canvas, 0, 0)[0]
-                py = y0 + m_to_px(canvas, rotated_rail1_x, rotated_rail1_y)[1] - m_to_px(canvas, 0, 0)[1]
-                rail1_points.extend([px, py])
-                
-                # Rail 2 points (below slot)
-                rail2_y = lane_y + RAIL_SPACING / 2
-                rotated_rail2_x = x_offset * math.cos(rads) - rail2_y * math.sin(rads)
-                rotated_rail2_y = x_offset * math.sin(rads) + rail2_y * math.cos(rads)
-                px = x0 + m_to_px(canvas, rotated_rail2_x, rotated_rail2_y)[0] - m_to_px(canvas, 0, 0)[0]
-                py = y0 + m_to_px(canvas, rotated_rail2_x, rotated_rail2_y)[1] - m_to_px(canvas, 0, 0)[1]
-                rail2_points.extend([px, py])
+            rail1_y = lane_y - RAIL_SPACING / 2
+            rail2_y = lane_y + RAIL_SPACING / 2
             
             # Draw rails (metallic lines)
-            canvas.create_line(rail1_points[0], rail1_points[1], rail1_points[2], rail1_points[3], 
-                              fill="silver", width=w_rails)
-            canvas.create_line(rail2_points[0], rail2_points[1], rail2_points[2], rail2_points[3], 
-                              fill="silver", width=w_rails)
+            canvas.create_line(*to_px(0, rail1_y), *to_px(self.TRACK_LENGTH, rail1_y),
+                              fill="silver", width=w_rails, tags=tags)
+            canvas.create_line(*to_px(0, rail2_y), *to_px(self.TRACK_LENGTH, rail2_y),
+                              fill="silver", width=w_rails, tags=tags)
             
             # Draw slot (dark groove)
-            canvas.create_line(slot_points[0], slot_points[1], slot_points[2], slot_points[3], 
-                              fill="black", width=w_slot)
+            canvas.create_line(*to_px(0, lane_y), *to_px(self.TRACK_LENGTH, lane_y),
+                              fill="black", width=w_slot, tags=tags)
             
 
 
     
 
 class CurvedTrack(Track):
+    # side "L" turns left: (x, y) is on the outer edge and the center is OUTER_RADIUS to the left.
+    # side "R" turns right: (x, y) is on the inner edge and the center is
+    # OUTER_RADIUS - TRACK_WIDTH to the right, so the piece covers the same strip.
 
     def getNext(self):
         # returns the connection point and angle of the next piece
         # in world coordinates (meters)
-        curve_rads = (self.angle + self.ANGLE) 
-        
         cx, cy = self.getCenterOfRotation()
         
+        if self.side == "R":
+            curve_rads = (self.angle - self.ANGLE)
+            inner_edge_radius = self.OUTER_RADIUS - TRACK_WIDTH
+            nx = (cx - inner_edge_radius * math.sin(curve_rads))
+            ny = (cy + inner_edge_radius * math.cos(curve_rads))
+            return nx, ny, curve_rads
+        
+        curve_rads = (self.angle + self.ANGLE) 
+        
         nx = (cx + self.OUTER_RADIUS * math.sin(curve_rads)) 
         ny = (cy - self.OUTER_RADIUS * math.cos(curve_rads)) 
         return nx, ny, self.angle + self.ANGLE
@@ -282,6 +261,8 @@ class CurvedTrack(Track):
         # Calculate center coordinates relative to rotation center
         center_x_rel = 0  # relative to rotation center
         center_y_rel = inner_edge_radius + TRACK_WIDTH
+        if self.side == "R":
+            center_y_rel = -inner_edge_radius
         
         # Rotate the center point around (x0, y0)
         rotated_center_x_rel = center_x_rel * math.cos(rads) - center_y_rel * math.sin(rads)
@@ -292,9 +273,26 @@ class CurvedTrack(Track):
         
         return center_x, center_y
 
+    def getArcAngles(self):
+        # start and extent (radians, counterclockwise from +x) of the arc around the center
+        if self.side == "R":
+            return self.angle + math.pi/2 - self.ANGLE, self.ANGLE
+        return self.angle - math.pi/2, self.ANGLE
+
+    def getBounds(self):
+        # world bounding box of the piece from points sampled on both edges
+        cx, cy = self.getCenterOfRotation()
+        start, extent = self.getArcAngles()
+        points = []
+        for i in range(5):
+            a = start + extent * i / 4
+            for r in (self.OUTER_RADIUS, self.OUTER_RADIUS - TRACK_WIDTH):
+                points.append((cx + r * math.cos(a), cy + r * math.sin(a)))
+        return pointsBounds(points)
+
     def getLaneCurvature(self, t):
-        # returns curvature in radians per m
-        rads = self.ANGLE 
+        # returns curvature in radians per m, negative for right turns
+        rads = self.ANGLE if self.side != "R" else -self.ANGLE
         return rads / self.getLaneLength(t)
     
     def getLaneLength(self, t):
@@ -308,38 +306,27 @@ class CurvedTrack(Track):
         outer_edge_radius = self.OUTER_RADIUS 
 
         lanes_radii = [inner_edge_radius + LANE_SPACING/2, self.OUTER_RADIUS - LANE_SPACING/2]
+        if self.side == "R":
+            # lanes keep their offset from (x, y), which is now the inner edge
+            return lanes_radii[1 - t]
         return lanes_radii[t]
         
-    def draw(self, canvas):
-        rads = self.angle # angle in rads
+    def draw(self, canvas, tags="track", view=DEFAULT_VIEW):
         
-        # Get the rotation center (x0, y0) in pixels
-        x0, y0 = m_to_px(canvas, self.x, self.y)
-        
-        # center of the circle (assuming top-left origin)
-        angle_start = -math.pi/2  
-        angle_extent = self.ANGLE
+        # start and extent of the arc around the center of the circle
+        rotated_start_angle, angle_extent = self.getArcAngles()
 
         # --- Draw black tarmac (outer track boundary) ---
         inner_edge_radius = self.OUTER_RADIUS - TRACK_WIDTH
         outer_edge_radius = self.OUTER_RADIUS 
 
-        # Calculate center coordinates relative to rotation center
-        center_x_rel = 0  # relative to rotation center
-        center_y_rel = inner_edge_radius + TRACK_WIDTH
-        
-        # Rotate the center point around (x0, y0)
-        rotated_center_x_rel = center_x_rel * math.cos(rads) - center_y_rel * math.sin(rads)
-        rotated_center_y_rel = center_x_rel * math.sin(rads) + center_y_rel * math.cos(rads)
-        
-        # Convert to absolute pixel coordinates
-        center_x = x0 + m_to_px(canvas, rotated_center_x_rel, rotated_center_y_rel)[0] - m_to_px(canvas, 0, 0)[0]
-        center_y = y0 + m_to_px(canvas, rotated_center_x_rel, rotated_center_y_rel)[1] - m_to_px(canvas, 0, 0)[1]
+        # Convert the center of rotation to absolute pixel coordinates
+        center_x, center_y = view.m_to_px(canvas, *self.getCenterOfRotation())
 
-        lanes_radii = [inner_edge_radius + LANE_SPACING/2, self.OUTER_RADIUS - LANE_SPACING/2]
+        lanes_radii = [self.getLaneRadius(0), self.getLaneRadius(1)]
 
-        inner_r_px = inner_edge_radius * pixels_per_meter
-        outer_r_px = outer_edge_radius * pixels_per_meter
+        inner_r_px = inner_edge_radius * view.pixels_per_meter
+        outer_r_px = outer_edge_radius * view.pixels_per_meter
 
         # Calculate bounding boxes for arcs
         bbox_inner = (center_x - inner_r_px, center_y - inner_r_px,
@@ -347,21 +334,22 @@ class CurvedTrack(Track):
         bbox_outer = (center_x - outer_r_px, center_y - outer_r_px,
                       center_x + outer_r_px, center_y + outer_r_px)
 
-        # Adjust start angle based on rotation
-        rotated_start_angle = angle_start + self.angle
-
         # convert rads to degrees
         rotated_start_angle = rotated_start_angle * 180 / math.pi
         angle_extent = angle_extent * 180 / math.pi
 
         # Draw filled arc between outer and inner edge
         canvas.create_arc(bbox_outer, start=rotated_start_angle, extent=angle_extent,
-                          style='pieslice', outline='', fill='gray20')
+                          style='pieslice', outline='', fill='gray20', tags=tags)
         canvas.create_arc(bbox_inner, start=rotated_start_angle-1, extent=angle_extent+1,
-                          style='pieslice', outline='', fill=canvas['bg'])
+                          style='pieslice', outline='', fill=canvas['bg'], tags=tags)
+
+        # level of detail: rails and slots only when they are visible as such
+        if not view.showDetail(RAIL_SPACING):
+            return
 
-        w_rails = sm_to_px(RAIL_WIDTH)
-        w_slot = sm_to_px(SLOT_WIDTH)
+        w_rails = view.sm_to_px(RAIL_WIDTH)
+        w_slot = view.sm_to_px(SLOT_WIDTH)
 
         for radius in lanes_radii:
             # Rails relative to lane center
@@ -370,29 +358,29 @@ class CurvedTrack(Track):
             rail_outer_radius = radius + rail_offset
 
             # Convert mm to pixels
-            r_inner_px = rail_inner_radius * pixels_per_meter
-            r_outer_px = rail_outer_radius * pixels_per_meter
+            r_inner_px = rail_inner_radius * view.pixels_per_meter
+            r_outer_px = rail_outer_radius * view.pixels_per_meter
 
             # Draw rails as arcs
             canvas.create_arc(
                 center_x - r_inner_px, center_y - r_inner_px,
                 center_x + r_inner_px, center_y + r_inner_px,
                 start=rotated_start_angle, extent=angle_extent,
-                style='arc', outline='silver', width=w_rails
+                style='arc', outline='silver', width=w_rails, tags=tags
             )
             canvas.create_arc(
                 center_x - r_outer_px, center_y - r_outer_px,
                 center_x + r_outer_px, center_y + r_outer_px,
                 start=rotated_start_angle, extent=angle_extent,
-                style='arc', outline='silver', width=w_rails
+                style='arc', outline='silver', width=w_rails, tags=tags
             )
 
             # Draw slot as an arc (center line)
             canvas.create_arc(
-                center_x - radius * pixels_per_meter, center_y - radius * pixels_per_meter,
-                center_x + radius * pixels_per_meter, center_y + radius * pixels_per_meter,
+                center_x - radius * view.pixels_per_meter, center_y - radius * view.pixels_per_meter,
+                center_x + radius * view.pixels_per_meter, center_y + radius * view.pixels_per_meter,
                 start=rotated_start_angle, extent=angle_extent,
-                style='arc', outline='black', width=w_slot
+                style='arc', outline='black', width=w_slot, tags=tags
             )
 
 class NoTrack(StraighTrack):
@@ -411,8 +399,36 @@ class C8205Track(StraighTrack):
         self.angle = angle
 
 
+class LaneChangerTrack(StraighTrack):
+    # digital lane changer: a straight whose start is a branch point between
+    # the lanes (see race.py). The catalog reference and length are assumptions.
+    TRACK_LENGTH = 350/1000
+
+    def __init__(self, x, y, angle):
+        self.x , self.y = x, y
+        self.angle = angle
+
+    def draw(self, canvas, tags="track", view=DEFAULT_VIEW):
+        super().draw(canvas, tags, view)
+        if not view.showDetail(RAIL_SPACING):
+            return
+
+        x0, y0 = view.m_to_px(canvas, self.x, self.y)
+        ppm = view.pixels_per_meter
+        cos_a, sin_a = math.cos(self.angle), math.sin(self.angle)
+
+        def to_px(dx, dy):
+            return x0 + (dx * cos_a - dy * sin_a) * ppm, y0 - (dx * sin_a + dy * cos_a) * ppm
+
+        # crossover slots
+        low, high = self.lanes_y
+        for y_from, y_to in ((low, high), (high, low)):
+            canvas.create_line(*to_px(self.TRACK_LENGTH * 0.2, y_from), *to_px(self.TRACK_LENGTH * 0.8, y_to),
+                              fill="black", width=view.sm_to_px(SLOT_WIDTH), tags=tags)
+
+
 class C8204Track(CurvedTrack):
-    
+
     OUTER_RADIUS = R2_RADIUS # inner lane radius (mm)
     ANGLE = math.pi / 4               # curve angle in radians
 
@@ -433,3 +449,136 @@ class C8202Track(CurvedTrack):
         self.side = side
 
 
+class R3CurveTrack(CurvedTrack):
+    # wide curves; the catalog reference is not known, the 22.5 deg sector is an assumption
+
+    OUTER_RADIUS = R3_RADIUS
+    ANGLE = math.pi / 8
+
+    def __init__(self, x, y, angle, side):
+        self.x , self.y = x, y
+        self.angle = angle
+        self.side = side
+
+
+class R4CurveTrack(CurvedTrack):
+
+    OUTER_RADIUS = R4_RADIUS
+    ANGLE = math.pi / 8
+
+    def __init__(self, x, y, angle, side):
+        self.x , self.y = x, y
+        self.angle = angle
+        self.side = side
+
+
+# Default layout used by the simulator: (piece class, side) in driving order
+DEFAULT_LAYOUT = (
+    [(C8205Track, None)] + [(C8204Track, "L")] * 4 +
+    [(C8205Track, None)] + [(C8204Track, "L")] * 4
+)
+START_X, START_Y = -100/1000, -350/1000
+
+
+def layoutKey(layout):
+    """Hashable, class-independent description of a layout."""
+    return tuple((cls.__name__, side) for cls, side in layout)
+
+
+def layoutFromKey(key):
+    """Inverse of layoutKey: (class name, side) pairs back to piece classes."""
+    return [(globals()[name], side) for name, side in key]
+
+
+POSE_TOLERANCE = 1e-9  # m / rad, below which a re-posed piece counts as unchanged
+
+_piece_uids = itertools.count()
+
+
+def makePiece(cls, side, x, y, angle):
+    t = cls(x, y, angle) if side is None else cls(x, y, angle, side)
+    t.uid = next(_piece_uids)  # stable identity across edits, e.g. for canvas tags
+    return t
+
+
+def samePose(a, b):
+    return all(abs(u - v) <= POSE_TOLERANCE for u, v in zip(a, b))
+
+
+class Circuit:
+    """Chains the pieces of a layout with getNext() and builds the lane functions."""
+
+    def __init__(self, layout=DEFAULT_LAYOUT, x=START_X, y=START_Y, angle=0, lane_idx=0):
+        self.layout = list(layout)
+        self.lane_idx = lane_idx
+        self.start = (x, y, angle)
+
+        self.pieces = []
+        self.piecewise_curvature = CurvaturePiecewiseFunction()
+        self.piecewise_angle = AnglePiecewiseFunction()
+        self.piecewise_position = PositionPiecewiseFunction()
+
+        for cls, side in self.layout:
+            t = makePiece(cls, side, x, y, angle)
+            self.pieces.append(t)
+
+            self.piecewise_curvature.appendTrack(t, lane_idx)
+            self.piecewise_angle.appendTrack(t, lane_idx)
+            self.piecewise_position.appendTrack(t, lane_idx)
+            x, y, angle = t.getNext()
+
+    def getLength(self):
+        return self.piecewise_curvature.getLength()
+
+    def getLaneStart(self):
+        return self.pieces[0].getLaneStart(self.lane_idx)
+
+    # ============== EDITING ==============
+    # Edits only rebuild the edited pieces and re-pose the pieces downstream of
+    # them, stopping at the first one whose pose is unchanged (e.g. after
+    # swapping a piece for one with the same exit). Lane function entries past
+    # that point are only shifted along s. Every edit returns
+    # (removed pieces, changed pieces) so views can redraw just those.
+
+    def insertPiece(self, i, cls, side=None):
+        return self.splice(i, i, [(cls, side)])
+
+    def replacePiece(self, i, cls, side=None):
+        return self.splice(i, i + 1, [(cls, side)])
+
+    def deletePiece(self, i):
+        return self.splice(i, i + 1, [])
+
+    def flipPiece(self, i):
+        cls, side = self.layout[i]
+        if side is None:
+            return [], []
+        return self.replacePiece(i, cls, "R" if side == "L" else "L")
+
+    def splice(self, first, last, layout):
+        """Replaces pieces [first, last) by the (class, side) pairs of `layout`."""
+        x, y, angle = self.pieces[first - 1].getNext() if first > 0 else self.start
+
+        new = []
+        for cls, side in layout:
+            t = makePiece(cls, side, x, y, angle)
+            new.append(t)
+            x, y, angle = t.getNext()
+
+        # re-pose downstream pieces until one is already where it belongs
+        moved = []
+        for t in self.pieces[last:]:
+            if samePose((t.x, t.y, t.angle), (x, y, angle)):
+                break
+            t.x, t.y, t.angle = x, y, angle
+            moved.append(t)
+            x, y, angle = t.getNext()
+
+        removed = self.pieces[first:last]
+        self.pieces[first:last] = new
+        self.layout[first:last] = layout
+
+        changed = new + moved
+        for f in (self.piecewise_curvature, self.piecewise_angle, self.piecewise_position):
+            f.spliceTracks(first, last + len(moved), changed, self.lane_idx)
+        return removed, changed
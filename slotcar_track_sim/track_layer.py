@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Static track layer of the simulator canvas.
+
+All track items carry the "track" tag (plus "piece<uid>" per piece) and are
+drawn once per layout and zoom; edits only redraw the pieces they changed. Resets and frames only touch dynamic items
+(cars, HUD); the new Circuit of a reset takes over the drawn pieces. Resizes and pans just shift the layer with canvas.move(),
+drawing the pieces that scrolled into view; pieces outside the viewport
+are never drawn.
+"""
+
+from config import *
+from track import *
+from viewport import DEFAULT_VIEW
+
+TAG = "track"
+CENTERLINE_SAMPLES = 1000
+CULL_MARGIN_PX = 50
+
+
+def pieceTag(t):
+    return f"piece{t.uid}"
+
+
+class TrackLayer:
+    def __init__(self, canvas, view=DEFAULT_VIEW):
+        self.canvas = canvas
+        self.view = view
+        self.key = None
+        self.origin = None
+        self.circuit = None
+        self.drawn = set()  # uids of the pieces currently on the canvas
+
+    def draw(self, circuit, draw_tarmac=True, draw_centerline=True):
+        """Draws the circuit unless the cached layer already shows it; returns True if redrawn."""
+        key = (
+            layoutKey(circuit.layout),
+            circuit.lane_idx,
+            circuit.start,
+            self.view.pixels_per_meter,
+            draw_tarmac,
+            draw_centerline,
+        )
+        if key == self.key and self.canvas.find_withtag(TAG):
+            if circuit is not self.circuit:
+                self.rebind(circuit)
+            self.refresh()
+            return False
+
+        self.canvas.delete(TAG)
+        self.circuit = circuit
+        self.draw_tarmac = draw_tarmac
+        self.drawn = set()
+        self.origin = self.view.m_to_px(self.canvas, 0, 0)
+
+        if draw_tarmac:
+            self.drawVisiblePieces()
+
+        self.draw_centerline = draw_centerline
+        if draw_centerline:
+            self.drawCenterline()
+
+        self.canvas.tag_lower(TAG)
+        self.key = key
+        return True
+
+    def drawCenterline(self):
+        length = self.circuit.getLength()
+        coords_list = []
+        for i in range(CENTERLINE_SAMPLES - 1):
+            x, y = self.circuit.piecewise_position.get(i * length / (CENTERLINE_SAMPLES - 1))
+            coords_list.extend(self.view.m_to_px(self.canvas, x, y))
+        self.canvas.create_line(*coords_list, fill="darkorange", width=10, smooth=True, tags=(TAG, "centerline"))
+
+    def drawVisiblePieces(self):
+        for t in self.circuit.pieces:
+            if t.uid not in self.drawn and self.view.isVisible(self.canvas, t.getBounds(), CULL_MARGIN_PX):
+                t.draw(self.canvas, tags=(TAG, pieceTag(t)), view=self.view)
+                self.drawn.add(t.uid)
+
+    def rebind(self, circuit):
+        # a new Circuit of the drawn layout (e.g. after a reset): its pieces are
+        # where the drawn ones are, only their uids differ, so the tags move over
+        drawn = set()
+        for old, new in zip(self.circuit.pieces, circuit.pieces):
+            if old.uid in self.drawn:
+                self.canvas.addtag_withtag(pieceTag(new), pieceTag(old))
+                self.canvas.dtag(pieceTag(old), pieceTag(old))
+                drawn.add(new.uid)
+        self.circuit = circuit
+        self.drawn = drawn
+
+    def update(self, removed, changed):
+        """Follows an edit of the drawn circuit: only the removed and changed pieces are touched."""
+        if self.key is None:
+            return
+        for t in removed + changed:
+            self.canvas.delete(pieceTag(t))
+            self.drawn.discard(t.uid)
+
+        if self.draw_tarmac:
+            self.drawVisiblePieces()
+        if self.draw_centerline:
+            self.canvas.delete("centerline")
+            self.drawCenterline()
+        self.canvas.tag_raise("centerline")
+        self.canvas.tag_lower(TAG)
+        self.key = (layoutKey(self.circuit.layout),) + self.key[1:]
+
+    def refresh(self):
+        # follows resizes and pans without redrawing what is already there
+        if self.key is None:
+            return
+        origin = self.view.m_to_px(self.canvas, 0, 0)
+        if origin != self.origin:
+            self.canvas.move(TAG, origin[0] - self.origin[0], origin[1] - self.origin[1])
+            self.origin = origin
+            if self.draw_tarmac:
+                self.drawVisiblePieces()
+                # keep new pieces under the centerline and everything under the cars
+                self.canvas.tag_raise("centerline")
+                self.canvas.tag_lower(TAG)
+
+    def invalidate(self):
+        self.canvas.delete(TAG)
+        self.key = None
+        self.drawn = set()
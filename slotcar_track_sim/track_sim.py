@@ -1,38 +1,45 @@
 import tkinter as tk
-import threading
+import os
 import time
 import math
-from PIL import Image, ImageTk
 from track import *
 from config import *
-from car2 import *
+from charts import LiveCharts
+from models import DEFAULT_MODEL, getModel
+from parameters import ParameterStore
+from physics_worker import PhysicsWorker
+from profiler import PROFILER
+from track_layer import TrackLayer
+from validate import circuitClosure
+from viewport import Viewport, unionBounds
 from tkinter import ttk
 
-piecewise_function_xy1 = None
-
 
 class App:
-    param_definitions = [
-        ("Voltage", 0.0, 12.0, 0.1, "V", "voltage"),
-        ("Magnet Max Energy Product", 0.0, 50.0, 0.5, "MGOe", "max_energy"),
-        ("Mass", 70.0, 200.0, 1.0, "g", "mass"),
-        ("Static Friction", 0.0, 2.0, 0.01, "-", "static_f"),
-        ("Dynamic Friction", 0.0, 2.0, 0.01, "-", "dynamic_f"),
-        ("Wheel Radius", 4.0, 10.0, 0.1, "mm", "wheel_r"),
-        ("Torque Constant", 0.8, 2.0, 0.01, "-", "torque_c"),
-        ("Back EMF Constant", 1.0, 5.0, 0.01, "-", "back_emf_c"),
-        ("Back EMF", 0.003, 0.007, 0.0001, "-", "back_emf"),
-        ("Gear Ratio", 2.5, 4.0, 0.1, "-", "gear_ratio"),
-        ("Geartrain Efficiency", 80.0, 95.0, 1.0, "%", "efficiency"),
-    ]
+    param_definitions = PARAM_DEFINITIONS
 
     def __init__(self, parent):
         self.parent = parent
         self.parent.title("Simulation")
         self.parent.geometry(f"{sw}x{sh}")
 
-        self.parameters = {}
-        self.cars = []
+        # slider edits are coalesced and published once per frame
+        self.param_store = ParameterStore(defaultParameters())
+        self.applied_parameters = None
+        self.cars = []  # drawn only, their state is copied from the physics worker
+
+        # physics runs on a worker thread, or a process with AUTOSLOT_PHYSICS=process
+        self.physics_mode = os.environ.get("AUTOSLOT_PHYSICS", "thread")
+        self.physics = None
+        self.last_tick = 0
+
+        # the car model comes from the registry, AUTOSLOT_MODEL=car selects the guide pin model
+        self.model = DEFAULT_MODEL
+        self.Car = getModel(self.model)
+
+        # AUTOSLOT_TELEMETRY=aligned.npz (written by telemetry.py) overlays a real run
+        self.telemetry_path = os.environ.get("AUTOSLOT_TELEMETRY")
+        self.telemetry = None
 
         self.parent.grid_columnconfigure(0, weight=3)
         self.parent.grid_columnconfigure(1, weight=7)
@@ -43,10 +50,42 @@ class App:
         self.canvas = tk.Canvas(parent, bg="white")
         self.canvas.grid(row=0, column=1, sticky="nsew", padx=10, pady=10)
 
-        self.worker = threading.Thread(target=self.simulator_thread, daemon=True)
-        self.worker.start()
+        # wheel zooms, dragging pans and F fits the circuit in the window
+        self.view = Viewport()
+        self.layout = list(DEFAULT_LAYOUT)
+        self.circuit = None
+        self.selected = None
+        self.canvas.bind("<MouseWheel>", lambda event: self.zoom(1.2 if event.delta > 0 else 1 / 1.2, event))
+        self.canvas.bind("<Button-4>", lambda event: self.zoom(1.2, event))
+        self.canvas.bind("<Button-5>", lambda event: self.zoom(1 / 1.2, event))
+        self.canvas.bind("<ButtonPress-1>", self.start_pan)
+        self.canvas.bind("<B1-Motion>", self.pan)
+        self.parent.bind("<f>", lambda event: self.fit_view())
+
+        # static track items are drawn once and reused across resets and resizes
+        self.track_layer = TrackLayer(self.canvas, self.view)
+        self.canvas.bind("<Configure>", lambda event: self.track_layer.refresh())
+
+        # track editor: right click selects a piece, Tab cycles the selection, S / C insert a
+        # straight / curve after it, Delete removes it and R flips a curve
+        self.canvas.bind("<ButtonPress-3>", self.select_piece_at)
+        self.parent.bind("<Tab>", lambda event: self.cycle_selection(1))
+        self.parent.bind("<Shift-Tab>", lambda event: self.cycle_selection(-1))
+        self.parent.bind("<s>", lambda event: self.edit_track("insert", C8205Track, None))
+        self.parent.bind("<c>", lambda event: self.edit_track("insert", C8204Track, "L"))
+        self.parent.bind("<Delete>", lambda event: self.edit_track("delete"))
+        self.parent.bind("<r>", lambda event: self.edit_track("flip"))
+
+        # give the canvas time to get its size before drawing the circuit
+        self.parent.after(500, self.initCircuit)
+        self.parent.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # F3 toggles the profiling overlay, F4 exports the collected timings
+        self.parent.bind("<F3>", lambda event: PROFILER.toggle())
+        self.parent.bind("<F4>", lambda event: print(f"Profile written to {PROFILER.export()}"))
 
         self.last_redraw_time = time.time()
+        self.last_chart_time = self.last_redraw_time
         self.parent.after(1, self.redraw)
 
     def setup_control_panel(self):
@@ -68,6 +107,10 @@ class App:
         reset_btn = ttk.Button(self.control_frame, text="Reset Simulation", command=self.reset_simulation)
         reset_btn.grid(row=2, column=0, pady=15, sticky="ew")
 
+        # live plots of the first car, redrawn every chart_period
+        self.charts = LiveCharts(self.control_frame)
+        self.charts.grid(row=3, column=0, columnspan=3, sticky="nsew")
+
     def create_sliders(self, parent):
         parent.grid_columnconfigure(0, weight=1)
         parent.grid_columnconfigure(1, weight=3)
@@ -78,7 +121,6 @@ class App:
             ttk.Label(parent, text=f"{label_text}:").grid(row=row_index, column=0, padx=5, pady=5, sticky="w")
 
             initial_value = min_val
-            self.parameters[var_name] = initial_value
             value_label = ttk.Label(parent, text=f"{initial_value:.4f} {unit}", width=12)
             value_label.grid(row=row_index, column=2, padx=5, pady=5, sticky="e")
 
@@ -99,7 +141,7 @@ class App:
 
     def update_value(self, var_name, unit, value_label, value):
         new_value = float(value)
-        self.parameters[var_name] = new_value
+        self.param_store.set(var_name, new_value)
 
         if var_name == "back_emf":
             formatted_value = f"{new_value:.4f}"
@@ -110,9 +152,6 @@ class App:
 
         value_label.config(text=f"{formatted_value} {unit}")
 
-        if len(self.cars) > 0:
-            self.cars[0].updateParameters(self.parameters)
-
     # ---------------------------------------------------
     # 🚀 FULL RESET OF SIMULATION (sliders + canvas + car)
     # ---------------------------------------------------
@@ -123,28 +162,23 @@ class App:
             if isinstance(child, ttk.Scale):
                 child.set(float(child.cget("from")))
 
-        # Reset parameters dictionary
-        for _, min_val, _, _, _, var_name in self.param_definitions:
-            self.parameters[var_name] = min_val
+        # Reset parameters
+        self.param_store.update(defaultParameters())
+        self.applied_parameters = self.param_store.publish()
 
-        # Clear cars
+        # Stop physics and clear cars
+        self.stop_physics()
         self.cars.clear()
 
-        # Clear canvas
-        self.canvas.delete("all")
+        # Clear dynamic canvas items, the cached track layer stays
+        self.canvas.delete("!track")
 
         # Rebuild circuit
         self.initCircuit()
 
     def initCircuit(self):
-        global piecewise_function_xy1
-
-        piecewise_function_t1 = CurvaturePiecewiseFunction()
-        piecewise_function_xy1 = PositionPiecewiseFunction()
-        piecewise_function_a = AnglePiecewiseFunction()
-
         lane_idx = 0
-        initial_x, initial_y = -100 / 1000, -350 / 1000
+        initial_x, initial_y = START_X, START_Y
 
         if lane_idx == 0:
             lane_y = LANE_SPACING / 2 + LANE_SPACING
@@ -154,134 +188,196 @@ class App:
         drawTarmac = True
         drawParametricCurve = True
 
-        x, y, a = initial_x, initial_y, 0
-
-        t = C8205Track(x, y, a)
-        if drawTarmac:
-            t.draw(self.canvas)
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        t = C8204Track(x, y, a, "L")
-        if drawTarmac:
-            t.draw(self.canvas)
-
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        t = C8204Track(x, y, a, "L")
-        if drawTarmac:
-            t.draw(self.canvas)
-
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        t = C8204Track(x, y, a, "L")
-        if drawTarmac:
-            t.draw(self.canvas)
-
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        t = C8204Track(x, y, a, "L")
-        if drawTarmac:
-            t.draw(self.canvas)
-
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        t = C8205Track(x, y, a)
-        if drawTarmac:
-            t.draw(self.canvas)
-
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        t = C8204Track(x, y, a, "L")
-        if drawTarmac:
-            t.draw(self.canvas)
-
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        t = C8204Track(x, y, a, "L")
-        if drawTarmac:
-            t.draw(self.canvas)
-
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        t = C8204Track(x, y, a, "L")
-        if drawTarmac:
-            t.draw(self.canvas)
-
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        t = C8204Track(x, y, a, "L")
-        if drawTarmac:
-            t.draw(self.canvas)
-
-        piecewise_function_t1.appendTrack(t, lane_idx)
-        piecewise_function_xy1.appendTrack(t, lane_idx)
-        piecewise_function_a.appendTrack(t, lane_idx)
-        x, y, a = t.getNext()
-
-        s = np.linspace(0, piecewise_function_t1.getLength(), 1000)[0:-1]
-
-        coords_list = [piecewise_function_xy1.get(s_i) for s_i in s]
-        coords_list = [m_to_px(self.canvas, x, y) for x, y in coords_list]
-
-        if drawParametricCurve:
-            self.canvas.create_line(*coords_list, fill="darkorange", width=10, smooth=True)
+        circuit = Circuit(self.layout, initial_x, initial_y, 0, lane_idx)
+        self.circuit = circuit
+        self.selected = None
+        self.track_layer.draw(circuit, drawTarmac, drawParametricCurve)
+        self.show_closure()
+        if self.telemetry_path:
+            from telemetry import TelemetryOverlay
+
+            self.telemetry = TelemetryOverlay.load(self.telemetry_path, circuit)
 
+        self.applied_parameters = self.param_store.publish()
         self.cars.append(
-            Car(
+            self.Car(
                 initial_x,
                 (initial_y + lane_y),
                 0,
-                car1_img,
+                None,
                 "car 1",
-                piecewise_function_t1,
-                piecewise_function_a,
-                piecewise_function_xy1,
-                self.parameters,
+                circuit.piecewise_curvature,
+                circuit.piecewise_angle,
+                circuit.piecewise_position,
+                self.applied_parameters,
             )
         )
 
+        self.start_physics()
+
+    def start_physics(self):
+        self.physics = PhysicsWorker(
+            self.layout, len(self.cars), self.applied_parameters, mode=self.physics_mode, model=self.model
+        )
+        self.last_tick = 0
+        self.charts.reset(self.circuit.getLength())
+        self.physics.start()
+
     def redraw(self):
         current_time = time.time()
-        if current_time - self.last_redraw_time >= deltat:
-            for car in self.cars:
-                car.tick(deltat)
-                car.draw(self.canvas)
+        if self.physics is not None and current_time - self.last_redraw_time >= render_period:
+            with PROFILER.phase("frame"):
+                self.apply_parameters()
+
+                # only the latest complete physics frame is drawn
+                tick, states = self.physics.read()
+                PROFILER.count("physics_steps", (tick - self.last_tick) * len(self.cars))
+                self.last_tick = tick
+
+                for car, state in zip(self.cars, states):
+                    car.setState(state)
+                    car.draw(self.canvas, self.view)
+                if self.cars:
+                    self.sample_charts(tick * deltat, self.cars[0])
+                if self.telemetry is not None:
+                    self.telemetry.draw(self.canvas, self.view, tick * deltat)
+                PROFILER.draw_overlay(self.canvas)
+            PROFILER.count("frames")
             self.last_redraw_time = current_time
 
+        if current_time - self.last_chart_time >= chart_period:
+            with PROFILER.phase("charts"):
+                self.charts.draw()
+            self.last_chart_time = current_time
+
         self.parent.after(1, self.redraw)
 
-    def simulator_thread(self):
-        time.sleep(0.5)
-        self.parent.after(0, self.initCircuit)
-        while True:
-            time.sleep(0.1)
+    def sample_charts(self, t, car):
+        values = {
+            "v": car.v,
+            "slip": math.degrees(car.slip_angle),
+            "force": car.motorForce(),
+            "voltage": self.applied_parameters["voltage"],
+        }
+        self.charts.add(t, car.s, values)
+
+    def apply_parameters(self):
+        # publish the coalesced slider edits once per frame, only when they changed
+        parameters = self.param_store.publish()
+        if parameters is not self.applied_parameters:
+            for car in self.cars:
+                car.updateParameters(parameters)
+            self.physics.sendParameters(parameters)
+            self.applied_parameters = parameters
+
+    # ---------------------------------------------------
+    # Viewport: zoom, pan and fit
+    # ---------------------------------------------------
+    def zoom(self, factor, event):
+        self.view.zoomAt(self.canvas, factor, event.x, event.y)
+        if self.circuit is not None:
+            self.track_layer.draw(self.circuit)
+            self.draw_selection()
+
+    def start_pan(self, event):
+        self.pan_start = (event.x, event.y)
+
+    def pan(self, event):
+        self.view.panBy(event.x - self.pan_start[0], event.y - self.pan_start[1])
+        self.pan_start = (event.x, event.y)
+        self.track_layer.refresh()
+        self.draw_selection()
+
+    def fit_view(self):
+        if self.circuit is not None:
+            self.view.fit(self.canvas, unionBounds([t.getBounds() for t in self.circuit.pieces]))
+            self.track_layer.draw(self.circuit)
+            self.draw_selection()
+
+    # ---------------------------------------------------
+    # Track editor: select, insert, delete and flip pieces
+    # ---------------------------------------------------
+    def select_piece_at(self, event):
+        if self.circuit is None:
+            return
+        x, y = self.view.px_to_m(self.canvas, event.x, event.y)
+        best, best_d = None, None
+        for i, t in enumerate(self.circuit.pieces):
+            x0, y0, x1, y1 = t.getBounds()
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                d = math.hypot(x - (x0 + x1) / 2, y - (y0 + y1) / 2)
+                if best is None or d < best_d:
+                    best, best_d = i, d
+        self.selected = best
+        self.draw_selection()
+
+    def cycle_selection(self, step):
+        if self.circuit is None:
+            return "break"
+        n = len(self.circuit.pieces)
+        self.selected = 0 if self.selected is None else (self.selected + step) % n
+        self.draw_selection()
+        return "break"  # keep Tab from moving the keyboard focus
+
+    def draw_selection(self):
+        self.canvas.delete("selection")
+        if self.selected is None:
+            return
+        x0, y0, x1, y1 = self.circuit.pieces[self.selected].getBounds()
+        px0, py0 = self.view.m_to_px(self.canvas, x0, y1)
+        px1, py1 = self.view.m_to_px(self.canvas, x1, y0)
+        self.canvas.create_rectangle(px0, py0, px1, py1, outline="deepskyblue", width=2, dash=(4, 2), tags="selection")
+
+    def show_closure(self):
+        # the lane functions wrap s around the lap, which only makes sense on closed layouts
+        closed, closure_error, heading_error, _ = circuitClosure(self.circuit)
+        if closed:
+            self.parent.title("Simulation")
+        else:
+            self.parent.title(
+                f"Simulation - track open by {closure_error * 1e3:.1f} mm, {math.degrees(heading_error):.1f} deg"
+            )
+
+    def edit_track(self, action, cls=None, side=None):
+        if self.circuit is None or self.selected is None:
+            return
+        i = self.selected
+        if action == "insert":
+            first, last, layout = i + 1, i + 1, [(cls, side)]
+        elif action == "delete":
+            if len(self.circuit.pieces) == 1:
+                return
+            first, last, layout = i, i + 1, []
+        else:
+            cls, side = self.circuit.layout[i]
+            if side is None:
+                return
+            first, last, layout = i, i + 1, [(cls, "R" if side == "L" else "L")]
+
+        # only the edited pieces and those that moved downstream are rebuilt and redrawn
+        removed, changed = self.circuit.splice(first, last, layout)
+        self.layout = list(self.circuit.layout)
+        if action == "insert":
+            self.selected = i + 1
+        elif action == "delete":
+            self.selected = min(i, len(self.circuit.pieces) - 1)
+        self.track_layer.update(removed, changed)
+        self.draw_selection()
+        self.show_closure()
+        self.charts.setLapLength(self.circuit.getLength())
+
+        # the worker splices its own circuit the same way, the car keeps running
+        if self.physics is not None:
+            self.physics.sendSplice(first, last, layout)
+
+    def stop_physics(self):
+        if self.physics is not None:
+            self.physics.stop()
+            self.physics = None
+
+    def on_close(self):
+        self.stop_physics()
+        self.parent.destroy()
 
 
 if __name__ == "__main__":
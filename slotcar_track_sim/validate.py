@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Closure and geometry consistency checks for track layouts.
+
+validateCircuit() inspects one layout in detail: how far the last piece
+ends from the start pose, heading continuity at every joint, position
+continuity of both lanes across joints, and whether the lane lengths
+differ by what the lane offsets and the net turning imply. The editor
+only needs circuitClosure(), which reads the already edited pieces.
+
+closureErrors() is the fast path for generators and optimizers: each
+piece type reduces to a rigid (dx, dy, dtheta) step in its own frame, so
+the end pose of thousands of layouts is a vectorized cumulative sum.
+
+    python validate.py                 # report on the default layout
+    python validate.py --batch 100000  # batch throughput on random layouts
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from config import *
+from track import *
+
+CLOSURE_TOLERANCE = 1e-3  # m, end point to start point
+HEADING_TOLERANCE = 1e-3  # rad
+JOINT_TOLERANCE = 1e-4  # m, lane position jump across a joint
+LANE_LENGTH_TOLERANCE = 1e-4  # m, lane length difference against the net turning
+
+
+def wrapAngle(a):
+    return (a + math.pi) % (2 * math.pi) - math.pi
+
+
+def laneEnd(entry):
+    # end point and heading of a PositionPiecewiseFunction entry
+    c, s, e, x0, y0, a0 = entry
+    rx = e - s
+    if c == 0:
+        return x0 + rx * math.cos(a0), y0 + rx * math.sin(a0), a0
+    af = a0 + rx * c
+    return x0 + 1 / c * (math.sin(af) - math.sin(a0)), y0 - 1 / c * (math.cos(af) - math.cos(a0)), af
+
+
+# ============== SINGLE LAYOUT ==============
+
+
+def circuitClosure(circuit):
+    """
+    (closed, position error in m, heading error in rad, net turn in rad) of
+    the pieces of `circuit` as they are, e.g. right after an edit.
+    """
+    x0, y0, a0 = circuit.start
+    xe, ye, ae = circuit.pieces[-1].getNext()
+    closure_error = math.hypot(xe - x0, ye - y0)
+    heading_error = abs(wrapAngle(ae - a0))
+    closed = closure_error <= CLOSURE_TOLERANCE and heading_error <= HEADING_TOLERANCE
+    return closed, closure_error, heading_error, ae - a0
+
+
+def validateCircuit(circuit):
+    """
+    Returns a report dict on `circuit` (any lane). Joint errors are measured
+    between consecutive pieces and, for closed layouts, from the last piece
+    back to the first.
+    """
+    closed, closure_error, heading_error, net_turn = circuitClosure(circuit)
+
+    n = len(circuit.pieces)
+    joints = range(n if closed else n - 1)
+
+    # piece chaining: every piece must start at its predecessor's getNext()
+    max_heading_jump = 0.0
+    for i in joints:
+        nx, ny, na = circuit.pieces[i].getNext()
+        t = circuit.pieces[(i + 1) % n]
+        max_heading_jump = max(max_heading_jump, abs(wrapAngle(na - t.angle)))
+
+    lanes = []
+    for lane_idx in (0, 1):
+        lane = circuit if lane_idx == circuit.lane_idx else Circuit(circuit.layout, *circuit.start, lane_idx)
+        entries = lane.piecewise_position.piece
+        worst, worst_joint = 0.0, None
+        for i in joints:
+            ex, ey, ea = laneEnd(entries[i])
+            nx, ny = entries[(i + 1) % n][3:5]
+            jump = math.hypot(nx - ex, ny - ey)
+            if jump > worst:
+                worst, worst_joint = jump, i
+        lanes.append({"length_m": lane.getLength(), "max_joint_error_m": worst, "worst_joint": worst_joint})
+
+    # lanes run parallel, so their lengths differ by the net turning times their
+    # distance on the straights (Track.getLaneStart)
+    p = circuit.pieces[0]
+    offsets = []
+    for lane_idx in (0, 1):
+        lx, ly = p.getLaneStart(lane_idx)
+        offsets.append(math.hypot(lx - p.x, ly - p.y))
+    expected_difference = net_turn * (offsets[0] - offsets[1])
+    length_difference = lanes[1]["length_m"] - lanes[0]["length_m"]
+
+    report = {
+        "pieces": n,
+        "closed": closed,
+        "closure_error_m": closure_error,
+        "heading_error_rad": heading_error,
+        "net_turn_rad": net_turn,
+        "max_heading_jump_rad": max_heading_jump,
+        "lanes": lanes,
+        "lane_length_difference_m": length_difference,
+        "expected_lane_length_difference_m": expected_difference,
+        "lane_length_error_m": length_difference - expected_difference,
+    }
+    report["ok"] = (
+        closed
+        and max_heading_jump <= HEADING_TOLERANCE
+        and all(lane["max_joint_error_m"] <= JOINT_TOLERANCE for lane in lanes)
+        and abs(report["lane_length_error_m"]) <= LANE_LENGTH_TOLERANCE
+    )
+    return report
+
+
+def describeReport(report):
+    lines = [
+        f"{report['pieces']} pieces, {'closed' if report['closed'] else 'OPEN'}",
+        f"closure error {report['closure_error_m'] * 1e3:.3f} mm, heading error {math.degrees(report['heading_error_rad']):.4f} deg",
+        f"net turn {math.degrees(report['net_turn_rad']):.1f} deg, max heading jump {report['max_heading_jump_rad']:.2e} rad",
+    ]
+    for lane_idx, lane in enumerate(report["lanes"]):
+        lines.append(
+            f"lane {lane_idx}: {lane['length_m']:.4f} m, max joint error {lane['max_joint_error_m'] * 1e3:.3f} mm"
+            + (f" (after piece {lane['worst_joint']})" if lane["worst_joint"] is not None else "")
+        )
+    lines.append(
+        f"lane length difference {report['lane_length_difference_m'] * 1e3:.2f} mm,"
+        f" expected {report['expected_lane_length_difference_m'] * 1e3:.2f} mm"
+    )
+    return "\n".join(lines)
+
+
+# ============== BATCH ==============
+
+
+def pieceSteps(catalog):
+    """
+    (dx, dy, dtheta) of every (class, side) of `catalog` from its start pose to
+    its getNext() pose, in the piece frame. An extra zero row closes the table
+    so that index -1 can pad layouts of different lengths.
+    """
+    steps = np.zeros((len(catalog) + 1, 3))
+    for k, (cls, side) in enumerate(catalog):
+        t = cls(0, 0, 0) if side is None else cls(0, 0, 0, side)
+        steps[k] = t.getNext()
+    return steps
+
+
+def closureErrors(layouts, steps, start_angle=0.0):
+    """
+    Vectorized closure check. `layouts` is an (N, L) integer array of indices
+    into the catalog of `steps` (-1 pads), returns (position error in m,
+    wrapped heading error in rad, net turn in rad) arrays of length N.
+    """
+    layouts = np.asarray(layouts)
+    dx, dy, dtheta = (steps[layouts, k] for k in range(3))
+    net_turn = dtheta.sum(axis=1)
+    heading = start_angle + np.cumsum(dtheta, axis=1) - dtheta  # heading at the start of each piece
+    cos_h, sin_h = np.cos(heading), np.sin(heading)
+    ex = (dx * cos_h - dy * sin_h).sum(axis=1)
+    ey = (dx * sin_h + dy * cos_h).sum(axis=1)
+    heading_error = np.abs((net_turn + np.pi) % (2 * np.pi) - np.pi)
+    return np.hypot(ex, ey), heading_error, net_turn
+
+
+def closedMask(layouts, steps, tolerance=CLOSURE_TOLERANCE, heading_tolerance=HEADING_TOLERANCE):
+    position_error, heading_error, _ = closureErrors(layouts, steps)
+    return (position_error <= tolerance) & (heading_error <= heading_tolerance)
+
+
+def encodeLayout(layout, catalog):
+    index = {spec: k for k, spec in enumerate(catalog)}
+    return [index[spec] for spec in layout]
+
+
+CATALOG = [
+    (C8205Track, None),
+    (C8204Track, "L"),
+    (C8204Track, "R"),
+    (C8202Track, "L"),
+    (C8202Track, "R"),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, help="time the batch check on this many random layouts")
+    parser.add_argument("--pieces", type=int, default=len(DEFAULT_LAYOUT), help="pieces per random layout")
+    args = parser.parse_args(argv)
+
+    report = validateCircuit(Circuit())
+    print(describeReport(report))
+
+    if args.batch:
+        steps = pieceSteps(CATALOG)
+        rng = np.random.default_rng(0)
+        layouts = rng.integers(0, len(CATALOG), size=(args.batch, args.pieces))
+        t0 = time.perf_counter()
+        closed = closedMask(layouts, steps)
+        elapsed = time.perf_counter() - t0
+        print(f"{args.batch} layouts in {elapsed * 1e3:.1f} ms ({args.batch / elapsed:,.0f}/s), {closed.sum()} closed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Camera of the simulator canvas: zoom, pan, culling and level of detail.
+
+The default viewport (zoom 1, no pan) maps exactly like config.m_to_px,
+so code drawing without a viewport looks the same as before.
+"""
+
+from config import *
+
+# level of detail thresholds, in pixels
+LOD_RAIL_PX = 2.0  # rails and slots are skipped when the rail spacing is smaller
+LOD_SPRITE_PX = 14.0  # cars become simple glyphs when shorter than this
+CAR_LENGTH = 0.11  # m, used for the car glyph and its culling box
+
+MIN_ZOOM = 0.05
+MAX_ZOOM = 20.0
+
+
+class Viewport:
+    def __init__(self, zoom=1.0, pan_x=0.0, pan_y=0.0):
+        self.zoom = zoom
+        self.pan_x = pan_x  # world point shown at the canvas centre (m)
+        self.pan_y = pan_y
+
+    @property
+    def pixels_per_meter(self):
+        return pixels_per_meter * self.zoom
+
+    def m_to_px(self, canvas, x, y):
+        ppm = self.pixels_per_meter
+        return (canvas.winfo_width() / 2 + (x - self.pan_x) * ppm, canvas.winfo_height() / 2 - (y - self.pan_y) * ppm)
+
+    def px_to_m(self, canvas, px, py):
+        ppm = self.pixels_per_meter
+        return (self.pan_x + (px - canvas.winfo_width() / 2) / ppm, self.pan_y - (py - canvas.winfo_height() / 2) / ppm)
+
+    def sm_to_px(self, s):
+        return s * self.pixels_per_meter
+
+    # ============== CULLING ==============
+
+    def getVisibleBounds(self, canvas, margin_px=0):
+        x0, y1 = self.px_to_m(canvas, -margin_px, -margin_px)
+        x1, y0 = self.px_to_m(canvas, canvas.winfo_width() + margin_px, canvas.winfo_height() + margin_px)
+        return x0, y0, x1, y1
+
+    def isVisible(self, canvas, bounds, margin_px=0):
+        vx0, vy0, vx1, vy1 = self.getVisibleBounds(canvas, margin_px)
+        x0, y0, x1, y1 = bounds
+        return x0 <= vx1 and x1 >= vx0 and y0 <= vy1 and y1 >= vy0
+
+    # ============== LEVEL OF DETAIL ==============
+
+    def showDetail(self, size_m):
+        # rails and slots are only worth drawing when they are a few pixels apart
+        return self.sm_to_px(size_m) >= LOD_RAIL_PX
+
+    def showSprites(self):
+        return self.sm_to_px(CAR_LENGTH) >= LOD_SPRITE_PX
+
+    # ============== NAVIGATION ==============
+
+    def zoomAt(self, canvas, factor, px, py):
+        """Zooms by `factor` keeping the world point under pixel (px, py) fixed."""
+        wx, wy = self.px_to_m(canvas, px, py)
+        self.zoom = min(MAX_ZOOM, max(MIN_ZOOM, self.zoom * factor))
+        nx, ny = self.px_to_m(canvas, px, py)
+        self.pan_x += wx - nx
+        self.pan_y += wy - ny
+
+    def panBy(self, dx_px, dy_px):
+        self.pan_x -= dx_px / self.pixels_per_meter
+        self.pan_y += dy_px / self.pixels_per_meter
+
+    def fit(self, canvas, bounds, margin=0.05):
+        x0, y0, x1, y1 = bounds
+        self.pan_x, self.pan_y = (x0 + x1) / 2, (y0 + y1) / 2
+        w = max(x1 - x0, 1e-6) * (1 + 2 * margin)
+        h = max(y1 - y0, 1e-6) * (1 + 2 * margin)
+        zoom = min(canvas.winfo_width() / w, canvas.winfo_height() / h) / pixels_per_meter
+        self.zoom = min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+
+
+def unionBounds(bounds_list):
+    x0 = min(b[0] for b in bounds_list)
+    y0 = min(b[1] for b in bounds_list)
+    x1 = max(b[2] for b in bounds_list)
+    y1 = max(b[3] for b in bounds_list)
+    return x0, y0, x1, y1
+
+
+def pointsBounds(points):
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+DEFAULT_VIEW = Viewport()